@@ -1,5 +1,17 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .search import install_search_indexes
+        from .changes import number_unnumbered
+        from .stock import record_openings
+        from .rollups import install_daily_counts
+        post_migrate.connect(install_search_indexes, sender=self)
+        post_migrate.connect(number_unnumbered, sender=self)
+        post_migrate.connect(record_openings, sender=self)
+        post_migrate.connect(install_daily_counts, sender=self)
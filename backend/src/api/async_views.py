@@ -0,0 +1,127 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from django.conf import settings
+from django.db import connections
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound, PermissionDenied
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from .models import Ticket, Expenditure, Device, Department, Category
+from .serializers import TicketSerializer
+from .renderers import FastJSONRenderer
+from .conditional import get_etag, etag_matches, set_cache_headers
+from .views import TicketViewSet, get_ticket_counts
+
+# ORM work of the async views runs here. The pool bounds how many queries the async views run at once
+# (and how many database connections they hold), independently of the number of open requests.
+ORM_EXECUTOR = ThreadPoolExecutor(max_workers=getattr(settings, 'ASYNC_ORM_WORKERS', 8),
+                                  thread_name_prefix='api-orm')
+
+
+def call_orm(func, args, kwargs):
+    # Executor threads keep their connections between calls: the pool is bounded, and so is the number of
+    # connections it holds. Only a connection broken by a failed call is dropped.
+    try:
+        return func(*args, **kwargs)
+    finally:
+        for conn in connections.all():
+            if conn.connection is not None and conn.errors_occurred:
+                if not conn.is_usable():
+                    conn.close()
+                conn.errors_occurred = False
+
+
+async def run_orm(func, *args, **kwargs):
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(ORM_EXECUTOR, partial(call_orm, func, args, kwargs))
+
+
+def authenticate(request):
+    request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    request.user
+    for permission in api_settings.DEFAULT_PERMISSION_CLASSES:
+        if not permission().has_permission(request, None):
+            raise PermissionDenied()
+    return request
+
+
+def render(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(FastJSONRenderer().render(data), status=status_code, content_type='application/json')
+
+
+def async_api_view(*models):
+    """
+    Read-only async counterpart of @api_view with @conditional_get: authenticates the request with the DRF
+    settings, answers 304 for a current ETag and renders the data returned by the view, or the APIException
+    it raised, as JSON.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return render({'detail': f'Method "{request.method}" not allowed.'},
+                              status.HTTP_405_METHOD_NOT_ALLOWED)
+            try:
+                request = await run_orm(authenticate, request)
+                etag = await run_orm(get_etag, request, models)
+                if etag_matches(request, etag):
+                    return set_cache_headers(request, HttpResponse(status=status.HTTP_304_NOT_MODIFIED), etag)
+                data = await view(request, *args, **kwargs)
+            except APIException as exc:
+                data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+                return render(data, exc.status_code)
+            return set_cache_headers(request, render(data), etag)
+        return wrapper
+    return decorator
+
+
+async def prefetch_tickets(tickets):
+    # The two prefetches are independent and run side by side, each on its own connection.
+    for ticket in tickets:
+        ticket._prefetched_objects_cache = {}
+    await asyncio.gather(
+        run_orm(prefetch_related_objects, tickets, 'work_done'),
+        run_orm(prefetch_related_objects, tickets,
+                Prefetch('expenditures', queryset=Expenditure.objects.select_related('position'))),
+    )
+
+
+def serialize_tickets(tickets, request, many):
+    return TicketSerializer(tickets, many=many, context={'request': request}).data
+
+
+@async_api_view(*TicketViewSet.etag_models)
+async def ticket_list(request):
+    view = TicketViewSet(request=request, action='list', format_kwarg=None, args=(), kwargs={})
+
+    def get_tickets():
+        queryset = view.get_queryset().prefetch_related(None)
+        page = view.paginate_queryset(queryset)
+        return list(queryset) if page is None else page
+
+    tickets = await run_orm(get_tickets)
+    await prefetch_tickets(tickets)
+    data = await run_orm(serialize_tickets, tickets, request, True)
+    if view.paginator.is_active(request):
+        return view.paginator.get_paginated_response(data).data
+    return data
+
+
+@async_api_view(*TicketViewSet.etag_models)
+async def ticket_detail(request, pk):
+    def get_ticket():
+        return Ticket.objects.select_related('device', 'owner').filter(pk=pk).first()
+
+    ticket = await run_orm(get_ticket)
+    if ticket is None:
+        raise NotFound()
+    await prefetch_tickets([ticket])
+    return await run_orm(serialize_tickets, ticket, request, False)
+
+
+@async_api_view(Ticket, Device, Department, Category)
+async def ticket_per_date(request):
+    return await run_orm(get_ticket_counts, request.query_params)
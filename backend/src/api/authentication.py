@@ -0,0 +1,98 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from rest_framework.authentication import TokenAuthentication
+from dj_rest_auth.models import TokenModel
+from .generations import get_generations
+
+
+class TokenCache:
+    """
+    Per-process LRU of token key -> (user, token), each entry kept for `ttl` seconds. Entries are revoked on
+    save and delete of their token or user (see api.signals). Other processes learn of it from the generation
+    of the token table, which those signals bump: every lookup passes the current one, and a cache filled
+    under another generation is dropped whole. Writes that skip the signals (QuerySet.update()) must call
+    clear() and bump_generation(TokenModel). Only valid tokens of active users are cached.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        # Bumped by every revocation, an entry read from the database before one is not cached.
+        self.epoch = 0
+        self.generation = None
+
+    def clear(self):
+        with self.lock:
+            self.entries = OrderedDict()
+            self.epoch += 1
+
+    def get(self, key, generation=None):
+        with self.lock:
+            if generation != self.generation:
+                self.entries = OrderedDict()
+                self.epoch += 1
+                self.generation = generation
+                return None
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1], entry[2]
+
+    def set(self, key, user, token, epoch):
+        with self.lock:
+            if epoch != self.epoch:
+                return
+            self.entries[key] = (time.monotonic(), user, token)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def revoke(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.epoch += 1
+
+    def revoke_user(self, user_pk):
+        with self.lock:
+            for key in [key for key, entry in self.entries.items() if entry[1].pk == user_pk]:
+                del self.entries[key]
+            self.epoch += 1
+
+
+TOKEN_CACHE = TokenCache()
+
+
+def clone(instance):
+    # copy.copy() would share the state, with the cache of related objects, of the instance.
+    instance = copy.copy(instance)
+    instance._state = copy.copy(instance._state)
+    instance._state.fields_cache = {}
+    return instance
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication answered from TOKEN_CACHE: the query of the token and its user is replaced by the read
+    of a single generation counter. Every request gets its own copies of the cached instances.
+    """
+
+    def authenticate_credentials(self, key):
+        cached = TOKEN_CACHE.get(key, get_generations([TokenModel])[0][1])
+        if cached is None:
+            epoch = TOKEN_CACHE.epoch
+            user, token = super().authenticate_credentials(key)
+            TOKEN_CACHE.set(key, user, token, epoch)
+        else:
+            user, token = cached
+        user = clone(user)
+        token = clone(token)
+        token.user = user
+        return user, token
@@ -0,0 +1,124 @@
+import threading
+import time
+from bisect import bisect_left, insort
+from .models import Device, Department, DevType
+from .lookups import get_lookup_cache
+
+
+def get_words(title):
+    return sorted({word.casefold() for word in title.split()})
+
+
+class DeviceAutocomplete:
+    """
+    Per-process prefix index over device inventory numbers and the words of device titles, two sorted lists
+    of (key, pk) searched with bisect. Built on first use, kept current by the save and delete signals of
+    Device (see api.signals) and rebuilt after `ttl` seconds, which bounds staleness across processes.
+    Writes that skip the signals (bulk_create(), QuerySet.update()) must call clear().
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.devices = None
+            self.title_words = {}
+            self.inv_nums = []
+            self.words = []
+            self.loaded_at = time.monotonic()
+
+    def load(self):
+        if time.monotonic() - self.loaded_at > self.ttl:
+            self.devices = None
+        if self.devices is not None:
+            return
+        self.devices = {}
+        self.title_words = {}
+        self.inv_nums = []
+        self.words = []
+        for row in Device.objects.values_list('pk', 'inv_num', 'title', 'department_id', 'type_id').iterator():
+            self.remember(*row)
+        self.inv_nums.sort()
+        self.words.sort()
+        self.loaded_at = time.monotonic()
+
+    def remember(self, pk, inv_num, title, department_id, type_id, insert=list.append):
+        self.devices[pk] = (inv_num, title, department_id, type_id)
+        self.title_words[pk] = get_words(title)
+        insert(self.inv_nums, (inv_num.casefold(), pk))
+        for word in self.title_words[pk]:
+            insert(self.words, (word, pk))
+
+    def forget(self, pk):
+        keys = [(self.inv_nums, self.devices.pop(pk)[0].casefold())]
+        keys.extend((self.words, word) for word in self.title_words.pop(pk))
+        for index, key in keys:
+            del index[bisect_left(index, (key, pk))]
+
+    def device_saved(self, device):
+        with self.lock:
+            # Not built yet, the first search loads the current rows.
+            if self.devices is None:
+                return
+            if device.pk in self.devices:
+                self.forget(device.pk)
+            self.remember(device.pk, device.inv_num, device.title, device.department_id, device.type_id,
+                          insert=insort)
+
+    def device_deleted(self, pk):
+        with self.lock:
+            if self.devices is not None and pk in self.devices:
+                self.forget(pk)
+
+    @staticmethod
+    def prefix_range(keys, prefix):
+        return bisect_left(keys, (prefix,)), bisect_left(keys, (prefix + '\U0010ffff',))
+
+    def search(self, query, limit=10):
+        """
+        Up to `limit` devices whose inventory number starts with `query`, in inventory number order, followed
+        by the devices with a title word starting with every word of `query`. Returns rows of
+        (pk, inv_num, title, department_id, type_id).
+        """
+        query = query.casefold().strip()
+        terms = get_words(query)
+        if not terms:
+            return []
+
+        with self.lock:
+            self.load()
+            start, end = self.prefix_range(self.inv_nums, query)
+            found = {pk: self.devices[pk] for key, pk in self.inv_nums[start:min(end, start + limit)]}
+
+            # Candidates come from the word of the query with the fewest matches, then have to match the others.
+            ranges = {term: self.prefix_range(self.words, term) for term in terms}
+            first = min(terms, key=lambda term: ranges[term][1] - ranges[term][0])
+            others = [term for term in terms if term != first]
+            for index in range(*ranges[first]):
+                if len(found) >= limit:
+                    break
+                pk = self.words[index][1]
+                if pk not in found and all(any(word.startswith(term) for word in self.title_words[pk])
+                                           for term in others):
+                    found[pk] = self.devices[pk]
+        return [(pk, *row) for pk, row in found.items()]
+
+    def suggest(self, query, limit=10):
+        """
+        search() results shaped as DeviceSerializer data.
+        """
+        departments = get_lookup_cache(Department)
+        dev_types = get_lookup_cache(DevType)
+        return [{
+            'id': pk,
+            'inv_num': inv_num,
+            'title': title,
+            'department': departments.get_by_pk(department_id).title,
+            'type': dev_types.get_by_pk(type_id).title,
+        } for pk, inv_num, title, department_id, type_id in self.search(query, limit)]
+
+
+DEVICE_AUTOCOMPLETE = DeviceAutocomplete()
@@ -0,0 +1,266 @@
+import asyncio
+import gzip
+import itertools
+import threading
+import time
+import tracemalloc
+from datetime import date, timedelta
+from urllib.parse import urlencode
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import Client, AsyncClient
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from .compression import brotli, compress
+from .renderers import FastJSONRenderer, orjson
+from .models import Ticket, Device, Position, Expenditure, WorkType, Category, Priority, Department, DevType
+
+
+def percentile(values, percent):
+    """
+    Nearest-rank percentile of a non-empty list.
+    """
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(latencies, elapsed):
+    return {
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def get_url(path, params):
+    # AsyncClient.get() of Django 3.1 drops `data`, the query string goes into the path for both clients.
+    return f'{path}?{urlencode(params)}' if params else path
+
+
+def run_wsgi(path, params, requests, concurrency, token=None):
+    """
+    `requests` GETs of `path` through the WSGI handler from `concurrency` threads, like a threaded WSGI server.
+    """
+    headers = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+    url = get_url(path, params)
+    counter = itertools.count()
+    latencies = []
+    errors = []
+
+    def worker():
+        client = Client()
+        try:
+            while next(counter) < requests:
+                started = time.perf_counter()
+                response = client.get(url, **headers)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - started, errors
+
+
+def run_asgi(path, params, requests, concurrency, token=None):
+    """
+    The same load through the ASGI handler, `concurrency` requests in flight on one event loop.
+    """
+    headers = {'authorization': f'Token {token}'} if token else {}
+    url = get_url(path, params)
+    counter = itertools.count()
+    latencies = []
+    errors = []
+
+    async def worker():
+        client = AsyncClient()
+        while next(counter) < requests:
+            started = time.perf_counter()
+            response = await client.get(url, **headers)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+
+    async def run():
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    started = time.perf_counter()
+    asyncio.run(run())
+    return latencies, time.perf_counter() - started, errors
+
+
+def get_scenarios():
+    """
+    Requests of every endpoint in api.urls, with the query strings the frontend sends. Detail endpoints use
+    the newest object of their table, scenarios whose table is empty are left out.
+    """
+    last = {model: model._default_manager.order_by('-pk').values_list('pk', flat=True).first()
+            for model in (Ticket, Device, Position, Expenditure, User, WorkType, Category, Priority, Department,
+                          DevType)}
+    today = date.today()
+    month = {'date_gte': f'{today - timedelta(days=30):%Y-%m-%d}T00:00:00', 'date_lte': f'{today:%Y-%m-%d}T00:00:00'}
+    year = {'date_gte': f'{today - timedelta(days=365):%Y-%m-%d}T00:00:00', 'date_lte': f'{today:%Y-%m-%d}T00:00:00'}
+    page = {'sort': 'id', 'order': 'desc', 'start': 0, 'end': 20}
+    device = Device.objects.filter(pk=last[Device]).values('inv_num', 'title').first() or {}
+    department = Department.objects.filter(pk=last[Department]).values_list('title', flat=True).first()
+
+    scenarios = [
+        ('tickets', 'ticket-list', None, {**page, **year}),
+        ('tickets_filtered', 'ticket-list', None, {**page, **month, 'status': '1', 'department': department or ''}),
+        ('tickets_description', 'ticket-list', None, {**page, **year, 'description_like': 'не работает'}),
+        ('tickets_inventory', 'ticket-list', None, {**page, 'inventory_like': device.get('inv_num', '')[:6]}),
+        ('tickets_sort_device', 'ticket-list', None, {**page, 'sort': 'device', 'order': 'asc'}),
+        ('tickets_deep_page', 'ticket-list', None, {**page, 'start': 5000, 'end': 5020}),
+        ('tickets_cursor', 'ticket-list', None, {'cursor': '', 'limit': 20, 'sort': 'id', 'order': 'desc'}),
+        ('ticket', 'ticket-detail', Ticket, {}),
+        ('tickets_export', 'ticket-export', None, {**month, 'type': 'ndjson'}),
+        ('devices', 'device-list', None, {**page, 'department': 'Любая', 'type': 'Любой'}),
+        ('devices_title', 'device-list', None, {**page, 'title_like': device.get('title', '').split(' ')[0]}),
+        ('devices_inventory', 'device-list', None, {**page, 'inventory_like': device.get('inv_num', '')[:6]}),
+        ('device', 'device-detail', Device, {}),
+        ('positions', 'position-list', None, {}),
+        ('positions_contains', 'position-list', None, {'contains': 'Картридж'}),
+        ('position', 'position-detail', Position, {}),
+        ('expenditures', 'expenditure-list', None, {}),
+        ('expenditure', 'expenditure-detail', Expenditure, {}),
+        ('users', 'user-list', None, {}),
+        ('user', 'user-detail', User, {}),
+        ('worktypes', 'worktype-list', None, {}),
+        ('worktype', 'worktype-detail', WorkType, {}),
+        ('categories', 'category-list', None, {}),
+        ('category', 'category-detail', Category, {}),
+        ('priorities', 'priority-list', None, {}),
+        ('priority', 'priority-detail', Priority, {}),
+        ('departments', 'department-list', None, {}),
+        ('department', 'department-detail', Department, {}),
+        ('devtypes', 'devtype-list', None, {}),
+        ('devtype', 'devtype-detail', DevType, {}),
+        ('dashboard', 'ticket_per_date', None, {**year, 'status': '1'}),
+        ('dashboard_series', 'ticket_series', None, {**year, 'granularity': 'week'}),
+        ('report', 'ticket_report', None, {**year, 'dimensions': 'month,department,category',
+                                           'measures': 'count,closed_count'}),
+        ('cube', 'ticket_cube', None, {**year, 'dimensions': 'department,status',
+                                       'measures': 'count,resolution_days'}),
+        ('changes', 'changes', None, {'since': 0}),
+        ('devices_autocomplete', 'device-autocomplete', None, {'q': device.get('title', '')[:3]}),
+        ('positions_stock', 'position-stock', None, {}),
+        ('async_tickets', 'async_ticket_list', None, {**page, **year}),
+        ('async_ticket', 'async_ticket_detail', Ticket, {}),
+        ('async_dashboard', 'async_ticket_per_date', None, {**year, 'status': '1'}),
+    ]
+    result = []
+    for name, url_name, detail_model, params in scenarios:
+        if detail_model is None:
+            result.append((name, get_url(reverse(url_name), params)))
+        elif last[detail_model] is not None:
+            result.append((name, get_url(reverse(url_name, kwargs={'pk': last[detail_model]}), params)))
+    return result
+
+
+def fetch(client, url, headers):
+    response = client.get(url, **headers)
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+def measure(url, repeat, token=None):
+    """
+    Latency percentiles of `repeat` sequential requests after a warm-up request, then the queries and the
+    peak of Python memory allocated by one more request each. Queries of the async views run on executor
+    threads and are not counted.
+    """
+    client = Client()
+    headers = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+    response = fetch(client, url, headers)
+
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fetch(client, url, headers)
+        latencies.append(time.perf_counter() - started)
+
+    # Counted with a wrapper, the query log of CaptureQueriesContext is cleared at the start of every request.
+    queries = []
+
+    def count_query(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    with connections[DEFAULT_DB_ALIAS].execute_wrapper(count_query):
+        fetch(client, url, headers)
+
+    tracemalloc.start()
+    try:
+        fetch(client, url, headers)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    result = summarize(latencies, sum(latencies))
+    result.update({
+        'status': response.status_code,
+        'queries': len(queries),
+        'peak_kb': peak / 1024,
+    })
+    return result
+
+
+def compare(results, baseline, threshold):
+    """
+    Regressions against a baseline: p95 slower by more than `threshold` (a fraction) or more queries.
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            regressions.append(f'{name}: p95 {before["p95_ms"]:.1f} -> {result["p95_ms"]:.1f} ms')
+        if result['queries'] > before['queries']:
+            regressions.append(f'{name}: {before["queries"]} -> {result["queries"]} queries')
+    return regressions
+
+
+def render_time(renderer, data, repeat):
+    """
+    Mean CPU time of rendering `data`, in milliseconds.
+    """
+    started = time.process_time()
+    for _ in range(repeat):
+        renderer.render(data)
+    return (time.process_time() - started) / repeat * 1000
+
+
+def measure_payload(url, repeat, token=None):
+    """
+    Render CPU time of the data of a JSON response with the stdlib encoder of JSONRenderer and with
+    FastJSONRenderer, and its size raw and compressed as CompressionMiddleware sends it. A renderer or an
+    encoding whose package is not installed is reported as None.
+    """
+    client = Client()
+    headers = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+    response = client.get(url, HTTP_ACCEPT='application/json', **headers)
+    data = response.data
+    raw = JSONRenderer().render(data)
+    wire = client.get(url, HTTP_ACCEPT='application/json', HTTP_ACCEPT_ENCODING='br, gzip', **headers)
+    return {
+        'status': response.status_code,
+        'stdlib_ms': render_time(JSONRenderer(), data, repeat),
+        'orjson_ms': render_time(FastJSONRenderer(), data, repeat) if orjson is not None else None,
+        'raw_kb': len(raw) / 1024,
+        'gzip_kb': len(gzip.compress(raw, compresslevel=6)) / 1024,
+        'br_kb': len(compress(raw, 'br')) / 1024 if brotli is not None else None,
+        'wire_kb': len(wire.content) / 1024,
+        'wire_encoding': wire.get('Content-Encoding', 'identity'),
+    }
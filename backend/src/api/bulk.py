@@ -0,0 +1,289 @@
+from collections import defaultdict
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Max
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import as_serializer_error
+from .models import Ticket, Device, DevType, Department, WorkType, Priority, Category, Position, Expenditure, \
+    OutOfStock, StockMovement
+from .serializers import BulkTicketSerializer, DeviceImportSerializer
+from .lookups import get_lookup_cache
+from .autocomplete import DEVICE_AUTOCOMPLETE
+from .cube import TICKET_CUBE
+from .generations import bump_generation, bump_periods
+from .rollups import record_tickets_created, record_devices_moved
+from .changes import stamp, touch
+
+
+def reserve_ids(model, count):
+    """
+    Primary keys for `count` new rows on backends where bulk_create() does not return them (SQLite).
+    Must run after the transaction has written, so that it already holds the database write lock.
+    """
+    last_id = model._default_manager.aggregate(last_id=Max('pk'))['last_id'] or 0
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [model._meta.db_table])
+            sequence = cursor.fetchone()
+        last_id = max(last_id, sequence[0] if sequence else 0)
+    return range(last_id + 1, last_id + count + 1)
+
+
+class BulkTicketImport:
+    """
+    Validates a batch of tickets as a whole and writes it with bulk_create(): related objects are resolved
+    with one query per table for the batch, and tickets, expenditures and work_done rows are inserted
+    in batches inside one transaction. Either every ticket is created, or nothing is and `errors` maps
+    the index of every invalid item to its errors. Stock spent by another request between validation and
+    save() makes save() raise OutOfStock, with the errors of the items that asked for the position.
+
+    bulk_create() skips Model.save() and signals, so stock, its ledger, daily counters, table generations and
+    change numbers are updated here explicitly, the search index follows through its triggers.
+    """
+    batch_size = 1000
+
+    def __init__(self, items):
+        self.items = items
+        self.errors = {}
+        self.rows = []
+
+    def is_valid(self):
+        # One serializer validates every item, building its fields once per item would dominate the import.
+        serializer = BulkTicketSerializer()
+        for index, item in enumerate(self.items):
+            try:
+                self.rows.append((index, serializer.run_validation(item)))
+            except ValidationError as exc:
+                self.errors[index] = as_serializer_error(exc)
+
+        self.resolve_relations()
+        self.check_stock()
+        return not self.errors
+
+    def add_error(self, index, field, message):
+        self.errors.setdefault(index, {}).setdefault(field, []).append(message)
+
+    def get_errors(self):
+        return [{'index': index, 'errors': errors} for index, errors in sorted(self.errors.items())]
+
+    def resolve_relations(self):
+        owners = dict(User.objects.filter(username__in={row['owner'] for _, row in self.rows})
+                      .values_list('username', 'id'))
+        devices = dict(Device.objects.filter(inv_num__in={row['device']['inv_num'] for _, row in self.rows})
+                       .values_list('inv_num', 'id'))
+        positions = {position.title: position for position in Position.objects.filter(
+            title__in={exp['position'] for _, row in self.rows for exp in row.get('expenditures', [])})}
+        self.positions = positions
+
+        for index, row in self.rows:
+            row['owner_id'] = owners.get(row['owner'])
+            if row['owner_id'] is None:
+                self.add_error(index, 'owner', f'Object with username={row["owner"]} does not exist.')
+            row['device_id'] = devices.get(row['device']['inv_num'])
+            if row['device_id'] is None:
+                self.add_error(index, 'device', f'Object with inv_num={row["device"]["inv_num"]} does not exist.')
+            row['category_id'] = self.resolve_lookup(index, Category, 'category', row['category'])
+            if row.get('priority') is not None:
+                row['priority_id'] = self.resolve_lookup(index, Priority, 'priority', row['priority'])
+            row['work_done_ids'] = {self.resolve_lookup(index, WorkType, 'work_done', title)
+                                    for title in row.get('work_done', [])}
+            for exp in row.get('expenditures', []):
+                if exp['position'] not in positions:
+                    self.add_error(index, 'expenditures', f'Object with title={exp["position"]} does not exist.')
+
+    def resolve_lookup(self, index, model, field, title):
+        try:
+            return get_lookup_cache(model).get(title).pk
+        except model.DoesNotExist:
+            self.add_error(index, field, f'Object with title={title} does not exist.')
+
+    def check_stock(self):
+        requested = defaultdict(int)
+        indexes = defaultdict(list)
+        for index, row in self.rows:
+            for exp in row.get('expenditures', []):
+                if exp['position'] in self.positions:
+                    requested[exp['position']] += exp['quantity']
+                    indexes[exp['position']].append(index)
+        for title, quantity in requested.items():
+            if quantity > self.positions[title].quantity:
+                for index in indexes[title]:
+                    self.add_error(index, 'expenditures',
+                                   f'Not enough "{title}" in stock: {quantity} requested, '
+                                   f'{self.positions[title].quantity} available.')
+
+    def save(self):
+        with transaction.atomic():
+            # Bumping the generations first also takes the write lock on SQLite before ids are reserved.
+            bump_generation(Ticket, Expenditure, Position)
+
+            tickets = [Ticket(created=row.get('created'), closed=row.get('closed'), owner_id=row['owner_id'],
+                              description=row['description'], device_id=row['device_id'],
+                              priority_id=row.get('priority_id'), category_id=row['category_id'],
+                              status=row['status']) for _, row in self.rows]
+            if not connection.features.can_return_rows_from_bulk_insert:
+                for ticket, pk in zip(tickets, reserve_ids(Ticket, len(tickets))):
+                    ticket.pk = pk
+            stamp(tickets)
+            Ticket.objects.bulk_create(tickets, batch_size=self.batch_size)
+
+            expenditures = []
+            work_done = []
+            stock = defaultdict(int)
+            indexes = defaultdict(list)
+            WorkDone = Ticket.work_done.through
+            for ticket, (index, row) in zip(tickets, self.rows):
+                for exp in row.get('expenditures', []):
+                    position = self.positions[exp['position']]
+                    expenditures.append(Expenditure(position=position, quantity=exp['quantity'], ticket=ticket))
+                    stock[position] += exp['quantity']
+                    indexes[position].append(index)
+                work_done.extend(WorkDone(ticket_id=ticket.pk, worktype_id=pk) for pk in row['work_done_ids'])
+
+            if not connection.features.can_return_rows_from_bulk_insert:
+                for expenditure, pk in zip(expenditures, reserve_ids(Expenditure, len(expenditures))):
+                    expenditure.pk = pk
+            Expenditure.objects.bulk_create(expenditures, batch_size=self.batch_size)
+            WorkDone.objects.bulk_create(work_done, batch_size=self.batch_size)
+            for position in sorted(stock, key=lambda position: position.pk):
+                try:
+                    Position.change_stock(position.pk, -stock[position])
+                except OutOfStock:
+                    # Stock was spent by another request after validation, rolls the whole batch back.
+                    for index in sorted(set(indexes[position])):
+                        self.add_error(index, 'expenditures',
+                                       f'Not enough "{position.title}" in stock: {stock[position]} requested.')
+                    raise
+            StockMovement.objects.bulk_create([
+                StockMovement(position=expenditure.position, delta=-expenditure.quantity,
+                              kind=StockMovement.EXPENDITURE, expenditure_id=expenditure.pk)
+                for expenditure in expenditures
+            ], batch_size=self.batch_size)
+            record_tickets_created(tickets)
+            bump_periods(ticket.created for ticket in tickets)
+        return tickets
+
+
+class DeviceImport:
+    """
+    Creates or updates devices by inventory number from a stream of (line number, row, error), see
+    api.parsers, reading `batch_size` rows at a time. Departments and types of a batch are resolved at once,
+    and with `create_missing` unknown ones are created. Every batch is written with bulk_create() and
+    bulk_update() in a transaction of its own, an invalid row is reported and skipped without stopping
+    the import. Within a batch the last row of an inventory number wins, as if the rows were saved in turn.
+
+    The bulk writes skip signals, so table generations, change numbers, the daily ticket counters, the
+    autocomplete index and the ticket cube are updated here explicitly, the search index follows through its
+    triggers.
+    """
+    batch_size = 1000
+    fields = ('inv_num', 'title', 'department', 'type')
+
+    def __init__(self, rows, create_missing=False, batch_size=None):
+        self.rows = rows
+        self.create_missing = create_missing
+        self.batch_size = batch_size or self.batch_size
+        self.counts = {'created': 0, 'updated': 0, 'unchanged': 0}
+        self.errors = {}
+
+    def add_error(self, line, field, message):
+        self.errors.setdefault(line, {}).setdefault(field, []).append(message)
+
+    def run(self):
+        # One serializer validates every row, as in BulkTicketImport.
+        serializer = DeviceImportSerializer()
+        batch = []
+        for line, row, error in self.rows:
+            if error is not None:
+                self.add_error(line, 'non_field_errors', error)
+                continue
+            try:
+                batch.append((line, serializer.run_validation(row)))
+            except ValidationError as exc:
+                self.errors[line] = as_serializer_error(exc)
+                continue
+            if len(batch) >= self.batch_size:
+                self.save_batch(batch)
+                batch = []
+        if batch:
+            self.save_batch(batch)
+        return self.get_report()
+
+    def get_report(self):
+        errors = [{'line': line, 'errors': errors} for line, errors in sorted(self.errors.items())]
+        return {**self.counts, 'errors': errors}
+
+    def resolve(self, model, field, rows):
+        """
+        Primary keys of the titles in `field` of the rows by title, missing titles are created or reported.
+        """
+        cache = get_lookup_cache(model)
+        pks = {}
+        missing = set()
+        for title in {row[field] for _, row in rows}:
+            try:
+                pks[title] = cache.get(title).pk
+            except model.DoesNotExist:
+                missing.add(title)
+
+        if missing and self.create_missing:
+            model.objects.bulk_create([model(title=title) for title in sorted(missing)], ignore_conflicts=True)
+            bump_generation(model)
+            cache.clear()
+            pks.update(model.objects.filter(title__in=missing).values_list('title', 'pk'))
+        else:
+            for line, row in rows:
+                if row[field] in missing:
+                    self.add_error(line, field, f'Object with title={row[field]} does not exist.')
+        return pks
+
+    def save_batch(self, batch):
+        rows = list({row['inv_num']: (line, row) for line, row in batch}.values())
+        departments = self.resolve(Department, 'department', rows)
+        dev_types = self.resolve(DevType, 'type', rows)
+        rows = [(line, row) for line, row in rows if row['department'] in departments and row['type'] in dev_types]
+        if not rows:
+            return
+
+        counts = {'created': 0, 'updated': 0, 'unchanged': 0}
+        try:
+            with transaction.atomic():
+                bump_generation(Device)
+                existing = {device.inv_num: device for device in Device.objects.filter(
+                    inv_num__in=[row['inv_num'] for _, row in rows])}
+                created = []
+                updated = []
+                moved = {}
+                for _, row in rows:
+                    values = {'title': row['title'], 'department_id': departments[row['department']],
+                              'type_id': dev_types[row['type']]}
+                    device = existing.get(row['inv_num'])
+                    if device is None:
+                        created.append(Device(inv_num=row['inv_num'], **values))
+                    elif any(getattr(device, name) != value for name, value in values.items()):
+                        if device.department_id != values['department_id']:
+                            moved[device.pk] = (device.department_id, values['department_id'])
+                        for name, value in values.items():
+                            setattr(device, name, value)
+                        updated.append(device)
+                    else:
+                        counts['unchanged'] += 1
+                stamp(created + updated)
+                Device.objects.bulk_create(created)
+                Device.objects.bulk_update(updated, ['title', 'department', 'type', 'change_seq'])
+                touch(Ticket, Ticket.objects.filter(device__in=[device.pk for device in updated])
+                      .values_list('pk', flat=True))
+                record_devices_moved(moved)
+        except IntegrityError:
+            # An inventory number was taken by another request meanwhile.
+            for line, _ in rows:
+                self.add_error(line, 'non_field_errors', 'Conflicting concurrent change, the row was not imported.')
+            return
+
+        counts['created'] = len(created)
+        counts['updated'] = len(updated)
+        for name, count in counts.items():
+            self.counts[name] += count
+        DEVICE_AUTOCOMPLETE.clear()
+        for pk in moved:
+            TICKET_CUBE.device_changed(pk)
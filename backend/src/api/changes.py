@@ -0,0 +1,156 @@
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.db.models import BigIntegerField, Case, Value, When
+from rest_framework.exceptions import ValidationError
+from .models import Ticket, Device, Department, DevType, Position, Category, Priority, WorkType, Tombstone, \
+    TableGeneration, next_change_seq
+
+CHANGE_TRACKED = (Ticket, Device, Position)
+
+# Titles the feed renders into rows other than their own, {model: (field, {ChangeTracked model: lookup})}.
+RENDERED_TITLES = {
+    Department: ('title', {Device: 'department', Ticket: 'device__department'}),
+    DevType: ('title', {Device: 'type', Ticket: 'device__type'}),
+    Position: ('title', {Ticket: 'expenditures__position'}),
+    Category: ('title', {Ticket: 'category'}),
+    Priority: ('title', {Ticket: 'priority'}),
+    WorkType: ('title', {Ticket: 'work_done'}),
+    User: ('username', {Ticket: 'owner'}),
+}
+
+
+def touch(model, pks, batch_size=500, using=None):
+    """
+    Numbers the rows `pks` of a ChangeTracked model anew, for changes of what they are rendered from besides
+    their own row: the device, expenditures and work types of a ticket, titles of other rows. Every row gets
+    a number of its own.
+    """
+    pks = sorted(set(pk for pk in pks if pk is not None))
+    if not pks:
+        return
+    with transaction.atomic(using=using):
+        first = next_change_seq(len(pks), using=using)
+        for start in range(0, len(pks), batch_size):
+            batch = pks[start:start + batch_size]
+            numbers = Case(*(When(pk=pk, then=Value(first + start + i)) for i, pk in enumerate(batch)),
+                           output_field=BigIntegerField())
+            model._default_manager.using(using).filter(pk__in=batch).update(change_seq=numbers)
+
+
+def touch_renamed(model, pk):
+    """
+    Numbers anew the rows that render the title of the `model` row `pk`, see RENDERED_TITLES.
+    """
+    for tracked, lookup in RENDERED_TITLES[model][1].items():
+        touch(tracked, tracked._default_manager.filter(**{lookup: pk}).values_list('pk', flat=True))
+
+
+def stamp(objs):
+    """
+    Numbers unsaved rows or rows to be written with bulk_update() from the change sequence, in the
+    transaction of the write.
+    """
+    if objs:
+        first = next_change_seq(len(objs))
+        for i, obj in enumerate(objs):
+            obj.change_seq = first + i
+
+
+def number_unnumbered(using='default', batch_size=500, **kwargs):
+    """
+    Numbers the rows that have no change number, from before the change sequence, in the order of their
+    ids. A full sync of the feed starts after 0 and would leave them out. Runs on post_migrate.
+    """
+    tables = set(connections[using].introspection.table_names())
+    if TableGeneration._meta.db_table not in tables:
+        return
+    for model in CHANGE_TRACKED:
+        if model._meta.db_table not in tables:
+            continue
+        rows = model._default_manager.using(using).filter(change_seq=0).order_by('pk').values_list('pk', flat=True)
+        while True:
+            pks = list(rows[:batch_size])
+            if not pks:
+                break
+            touch(model, pks, batch_size, using)
+
+
+def record_deleted(instance):
+    Tombstone.objects.create(table=instance._meta.label_lower, object_id=instance.pk,
+                             change_seq=next_change_seq())
+
+
+class ChangeFeed:
+    """
+    Rows of the ChangeTracked models created or changed after the change number `since`, and tombstones of the
+    rows deleted since, in the order of their numbers, which is the commit order. A page ends at its last
+    number, which is the cursor to ask for the next one. With `since=0` the feed starts with every row there is
+    and leaves deletions out.
+
+    `sources` maps the name of every model in the feed to the queryset and serializer class its rows are
+    rendered with.
+    """
+    default_limit = 500
+    max_limit = 1000
+
+    def __init__(self, sources, query_params):
+        try:
+            self.since = int(query_params.get('since', 0))
+            if self.since < 0:
+                raise ValueError
+        except ValueError:
+            raise ValidationError({'since': ['Expected a change number, the cursor of the previous page or 0.']})
+
+        try:
+            self.limit = min(max(int(query_params.get('limit', self.default_limit)), 1), self.max_limit)
+        except ValueError:
+            raise ValidationError({'limit': ['Expected an integer.']})
+
+        names = [name for name in (name.strip() for name in query_params.get('types', '').split(',')) if name]
+        unknown = [name for name in names if name not in sources]
+        if unknown:
+            raise ValidationError({'types': [f'Unknown types: {", ".join(unknown)}. '
+                                             f'Expected: {", ".join(sources)}.']})
+        self.sources = {name: source for name, source in sources.items() if not names or name in names}
+
+    def get_entries(self):
+        """
+        (change_seq, name, pk, deleted) of the page, at most `limit` + 1 to tell whether there is more.
+        """
+        entries = []
+        for name, (queryset, _) in self.sources.items():
+            rows = queryset.model._default_manager.filter(change_seq__gt=self.since).order_by('change_seq')\
+                .values_list('change_seq', 'pk')[:self.limit + 1]
+            entries.extend((change_seq, name, pk, False) for change_seq, pk in rows)
+        if self.since:
+            names = {queryset.model._meta.label_lower: name for name, (queryset, _) in self.sources.items()}
+            tombstones = Tombstone.objects.filter(table__in=names, change_seq__gt=self.since)\
+                .order_by('change_seq').values_list('change_seq', 'table', 'object_id')[:self.limit + 1]
+            entries.extend((change_seq, names[table], pk, True) for change_seq, table, pk in tombstones)
+        entries.sort()
+        return entries[:self.limit + 1]
+
+    def get_data(self):
+        entries = self.get_entries()
+        more = len(entries) > self.limit
+        entries = entries[:self.limit]
+
+        rendered = {}
+        for name, (queryset, serializer_class) in self.sources.items():
+            pks = [pk for _, entry_name, pk, deleted in entries if entry_name == name and not deleted]
+            if pks:
+                serializer = serializer_class(queryset.filter(pk__in=pks), many=True)
+                rendered[name] = {item['id']: item for item in serializer.data}
+
+        changes = []
+        for change_seq, name, pk, deleted in entries:
+            data = None if deleted else rendered[name].get(pk)
+            if not deleted and data is None:
+                # Deleted after its number was read, its tombstone comes on a later page.
+                continue
+            changes.append({'type': name, 'id': pk, 'seq': change_seq, 'deleted': deleted, 'data': data})
+        return {
+            'changes': changes,
+            'cursor': entries[-1][0] if entries else self.since,
+            'more': more,
+        }
@@ -0,0 +1,135 @@
+import asyncio
+import gzip
+import zlib
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    # Optional, without it responses are only compressed with gzip.
+    brotli = None
+
+# Responses smaller than this many bytes are sent as they are, by default.
+COMPRESSION_MIN_SIZE = 1024
+
+
+def get_encodings():
+    # In order of preference between encodings the client accepts equally.
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def parse_accept_encoding(value):
+    """
+    {coding: q} of an Accept-Encoding header, 'gzip;q=0.5, br' gives {'gzip': 0.5, 'br': 1.0}.
+    Malformed weights count as 0.
+    """
+    weights = {}
+    for item in value.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, param_value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = max(0.0, min(float(param_value), 1.0))
+                except ValueError:
+                    q = 0.0
+        weights[coding] = q
+    return weights
+
+
+def choose_encoding(value):
+    """
+    The coding to compress a response with for the Accept-Encoding header `value`, or None to send it
+    as it is. A coding with q=0 is refused, `*` stands for the codings not named.
+    """
+    weights = parse_accept_encoding(value)
+    best, best_q = None, 0.0
+    for coding in get_encodings():
+        q = weights.get(coding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def compress_sequence(chunks, encoding):
+    """
+    Compresses a streamed body. Output is passed on as the compressor emits it, not after every chunk,
+    a flush per row of a streamed export would cost most of the compression.
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=5)
+        process, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        process, finish = compressor.compress, compressor.flush
+    for chunk in chunks:
+        data = process(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses of at least COMPRESSION_MIN_SIZE bytes with the coding negotiated by Accept-Encoding,
+    brotli when it is installed and accepted, gzip otherwise. Streaming responses are always compressed.
+    Goes right after MetricsMiddleware, which then records the bytes sent on the wire. Works in both handler
+    modes like MetricsMiddleware, without handing the response to a sync thread under ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Makes the handler await the instance, as MiddlewareMixin does.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding') or response.status_code in (204, 304):
+            return response
+        min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', COMPRESSION_MIN_SIZE)
+        if not response.streaming and len(response.content) < min_size:
+            return response
+
+        # Varies whether it is compressed or not, caches must not hand a compressed body to other clients.
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compress_sequence(response.streaming_content, encoding)
+            del response['Content-Length']
+        else:
+            content = compress(response.content, encoding)
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        # The compressed body is another representation with the same meaning.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = f'W/{etag}'
+        response['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,78 @@
+import hashlib
+from functools import partial, wraps
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+from .generations import get_generations
+
+
+def get_etag(request, models):
+    digest = hashlib.sha1()
+    digest.update(request.get_full_path().encode('utf-8'))
+    digest.update(request.META.get('HTTP_ACCEPT', '').encode('utf-8'))
+    digest.update(str(request.user.pk).encode('utf-8'))
+    for key, generation in get_generations(models):
+        digest.update(f'{key}={generation};'.encode('utf-8'))
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(request, etag):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    # If-None-Match uses the weak comparison.
+    return '*' in etags or etag in (tag[2:] if tag.startswith('W/') else tag for tag in etags)
+
+
+def set_cache_headers(request, response, etag):
+    response['ETag'] = etag
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    patch_vary_headers(response, ('Accept', 'Authorization', 'Cookie'))
+    return response
+
+
+def conditional_response(request, models, get_response):
+    """
+    Answers 304 Not Modified when the client already holds the representation for the current generations
+    of `models`, without running get_response. Otherwise returns its response with an ETag attached.
+    """
+    etag = get_etag(request, models)
+    if etag_matches(request, etag):
+        return set_cache_headers(request, Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+    response = get_response()
+    if response.status_code == status.HTTP_200_OK:
+        set_cache_headers(request, response, etag)
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    ETag and If-None-Match support for list and retrieve. `etag_models` lists every model the
+    representation is built from.
+    """
+    etag_models = ()
+
+    def list(self, request, *args, **kwargs):
+        get_response = partial(super().list, request, *args, **kwargs)
+        return conditional_response(request, self.etag_models, get_response)
+
+    def retrieve(self, request, *args, **kwargs):
+        get_response = partial(super().retrieve, request, *args, **kwargs)
+        return conditional_response(request, self.etag_models, get_response)
+
+
+def conditional_get(*models):
+    """
+    ConditionalGetMixin for function views, goes under @api_view.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            return conditional_response(request, models, partial(view, request, *args, **kwargs))
+        return wrapper
+    return decorator
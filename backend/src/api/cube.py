@@ -0,0 +1,331 @@
+import threading
+import time
+from datetime import date, datetime, timedelta
+from django.contrib.auth.models import User
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from .models import Ticket, Device, Department, Category, Priority
+from .lookups import get_lookup_cache
+
+try:
+    import numpy
+except ImportError:
+    # Optional, without it the cube endpoint answers 501.
+    numpy = None
+
+EPOCH = date(1970, 1, 1)
+
+# Day number of a missing date, below every real one.
+NO_DAY = -2 ** 31
+
+# Dictionary-encoded columns and the Ticket fields they are read from.
+ID_COLUMNS = (
+    ('device', 'device_id'),
+    ('department', 'device__department_id'),
+    ('category', 'category_id'),
+    ('priority', 'priority_id'),
+    ('owner', 'owner_id'),
+)
+
+PERIODS = ('year', 'month', 'week', 'day')
+
+DIMENSIONS = PERIODS + tuple(name for name, _ in ID_COLUMNS) + ('status',)
+
+MEASURES = ('count', 'closed_count', 'resolution_days')
+
+HISTOGRAMS = ('resolution_days', 'created')
+
+
+def to_day(value):
+    return NO_DAY if value is None else (value - EPOCH).days
+
+
+def from_day(day):
+    return None if day == NO_DAY else EPOCH + timedelta(days=int(day))
+
+
+class Encoding:
+    """
+    Dictionary encoding of a column of ids: dense codes in the order the ids were first seen.
+    """
+
+    def __init__(self):
+        self.codes = {}
+        self.ids = []
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.ids)
+            self.ids.append(value)
+        return code
+
+
+class TicketCube:
+    """
+    Tickets held in memory as NumPy columns: dictionary-encoded device, department, category, priority and
+    owner ids, created and closed day numbers and status. Group-by, filter and histogram queries run as
+    vectorized operations over the columns.
+
+    Before every query the cube re-reads the tickets saved or deleted in this process (see api.signals)
+    and the tickets with an id above the last one loaded, in one query. Changes other processes make
+    to existing tickets show up after the full reload every `ttl` seconds.
+    """
+
+    available = numpy is not None
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.columns = None
+            self.changed = set()
+            self.changed_devices = set()
+            self.loaded_at = time.monotonic()
+
+    def ticket_changed(self, pk):
+        with self.lock:
+            if self.columns is not None:
+                self.changed.add(pk)
+
+    def device_changed(self, pk):
+        with self.lock:
+            if self.columns is not None:
+                self.changed_devices.add(pk)
+
+    def read(self, queryset):
+        fields = ['pk'] + [field for _, field in ID_COLUMNS] + ['created', 'closed', 'status']
+        rows = {name: [] for name in fields}
+        for row in queryset.order_by('pk').values_list(*fields).iterator():
+            for name, value in zip(fields, row):
+                rows[name].append(value)
+
+        columns = {'pk': numpy.array(rows['pk'], dtype=numpy.int64)}
+        for name, field in ID_COLUMNS:
+            encode = self.encodings[name].encode
+            columns[name] = numpy.array([encode(value) for value in rows[field]], dtype=numpy.int32)
+        for name in ('created', 'closed'):
+            columns[name] = numpy.array([to_day(value) for value in rows[name]], dtype=numpy.int32)
+        columns['status'] = numpy.array(rows['status'], dtype=bool)
+        columns['alive'] = numpy.ones(len(rows['pk']), dtype=bool)
+        return columns
+
+    def load(self):
+        self.encodings = {name: Encoding() for name, _ in ID_COLUMNS}
+        self.columns = self.read(Ticket.objects.all())
+        self.changed = set()
+        self.changed_devices = set()
+        self.loaded_at = time.monotonic()
+
+    def refresh(self):
+        if self.columns is None or time.monotonic() - self.loaded_at > self.ttl:
+            self.load()
+            return
+
+        pks = self.columns['pk']
+        last_pk = int(pks[-1]) if len(pks) else 0
+        changed = self.read(Ticket.objects.filter(
+            Q(pk__gt=last_pk) | Q(pk__in=self.changed) | Q(device_id__in=self.changed_devices)))
+
+        # Rows are kept in id order, so a changed ticket is found by bisection. A ticket that is gone is
+        # marked dead, a new one is appended. Columns are replaced, not written to, queries running on
+        # a snapshot keep consistent columns.
+        positions = numpy.searchsorted(pks, changed['pk'])
+        existing = positions < len(pks)
+        existing[existing] = pks[positions[existing]] == changed['pk'][existing]
+        deleted = numpy.array(sorted(self.changed - set(changed['pk'].tolist())), dtype=numpy.int64)
+        deleted_positions = numpy.searchsorted(pks, deleted)
+        found = deleted_positions < len(pks)
+        found[found] = pks[deleted_positions[found]] == deleted[found]
+        self.changed = set()
+        self.changed_devices = set()
+        if not len(changed['pk']) and not found.any():
+            return
+
+        columns = {}
+        for name, column in self.columns.items():
+            column = column.copy()
+            column[positions[existing]] = changed[name][existing]
+            if name == 'alive':
+                column[deleted_positions[found]] = False
+            columns[name] = numpy.concatenate([column, changed[name][~existing]])
+        self.columns = columns
+
+    def snapshot(self):
+        with self.lock:
+            self.refresh()
+            return dict(self.columns), {name: list(encoding.ids) for name, encoding in self.encodings.items()}
+
+    def period(self, days, name):
+        known = days != NO_DAY
+        values = days.astype('datetime64[D]')
+        if name == 'week':
+            # 1970-01-01 was a Thursday, weeks start on Monday.
+            values = values - ((days + 3) % 7).astype('timedelta64[D]')
+        elif name == 'month':
+            values = values.astype('datetime64[M]').astype('datetime64[D]')
+        elif name == 'year':
+            values = values.astype('datetime64[Y]').astype('datetime64[D]')
+        return numpy.where(known, values.astype(numpy.int64), NO_DAY)
+
+    def get_mask(self, columns, ids, filters):
+        mask = columns['alive'].copy()
+        if filters.get('date_from') is not None:
+            mask &= columns['created'] >= to_day(filters['date_from'])
+        if filters.get('date_to') is not None:
+            mask &= (columns['created'] <= to_day(filters['date_to'])) & (columns['created'] != NO_DAY)
+        if filters.get('status') is not None:
+            mask &= columns['status'] == filters['status']
+        for name in ('department', 'category', 'priority'):
+            if filters.get(name) is not None:
+                codes = [code for code, pk in enumerate(ids[name]) if pk == filters[name]]
+                mask &= numpy.isin(columns[name], codes)
+        return mask
+
+    def group_by(self, dimensions, measures, filters):
+        """
+        Rows of `dimensions` values with `measures`, over the tickets passing `filters`: date_from, date_to,
+        status and department, category, priority ids.
+        """
+        columns, ids = self.snapshot()
+        mask = self.get_mask(columns, ids, filters)
+
+        keys = []
+        for name in dimensions:
+            if name in PERIODS:
+                column = self.period(columns['created'][mask], name)
+            else:
+                column = columns[name][mask]
+            values, codes = numpy.unique(column, return_inverse=True)
+            keys.append((name, values, codes.reshape(-1)))
+
+        if keys:
+            flat = numpy.ravel_multi_index([codes for _, _, codes in keys], [len(values) for _, values, _ in keys])
+            groups, inverse = numpy.unique(flat, return_inverse=True)
+            inverse = inverse.reshape(-1)
+        else:
+            groups, inverse = numpy.zeros(1, dtype=numpy.int64), numpy.zeros(int(mask.sum()), dtype=numpy.int64)
+
+        closed = ~columns['status'][mask]
+        results = {'count': numpy.bincount(inverse, minlength=len(groups))}
+        if 'closed_count' in measures or 'resolution_days' in measures:
+            results['closed_count'] = numpy.bincount(inverse, weights=closed, minlength=len(groups))
+        if 'resolution_days' in measures:
+            created, resolved = columns['created'][mask], columns['closed'][mask]
+            timed = closed & (created != NO_DAY) & (resolved != NO_DAY)
+            days = numpy.bincount(inverse, weights=numpy.where(timed, resolved - created, 0), minlength=len(groups))
+            timed_count = numpy.bincount(inverse, weights=timed, minlength=len(groups))
+            results['resolution_days'] = numpy.divide(days, timed_count, out=numpy.full(len(groups), numpy.nan),
+                                                      where=timed_count > 0)
+
+        coordinates = numpy.unravel_index(groups, [len(values) for _, values, _ in keys]) if keys else []
+        labels = self.get_labels([(name, values) for name, values, _ in keys], ids)
+        rows = []
+        for index in range(len(groups)):
+            row = {name: labels[name][int(coordinates[position][index])]
+                   for position, (name, _, _) in enumerate(keys)}
+            for name in measures:
+                value = results[name][index]
+                if name == 'resolution_days':
+                    row[name] = None if numpy.isnan(value) else round(float(value), 2)
+                else:
+                    row[name] = int(value)
+            rows.append(row)
+        return rows
+
+    def get_labels(self, dimensions, ids):
+        lookups = {'department': Department, 'category': Category, 'priority': Priority}
+        labels = {}
+        for name, values in dimensions:
+            if name in PERIODS:
+                labels[name] = [None if value == NO_DAY else from_day(value).isoformat()
+                                for value in values.tolist()]
+            elif name == 'status':
+                labels[name] = values.tolist()
+            else:
+                pks = [ids[name][code] for code in values.tolist()]
+                if name in lookups:
+                    cache = get_lookup_cache(lookups[name])
+                    titles = {pk: cache.get_by_pk(pk).title for pk in pks if pk is not None}
+                elif name == 'owner':
+                    titles = dict(User.objects.filter(pk__in=pks).values_list('pk', 'username'))
+                else:
+                    titles = dict(Device.objects.filter(pk__in=pks).values_list('pk', 'inv_num'))
+                labels[name] = [titles.get(pk) for pk in pks]
+        return labels
+
+    def histogram(self, name, bins, filters):
+        """
+        Counts of `bins` equal ranges of resolution days of the closed tickets, or of creation dates.
+        """
+        columns, ids = self.snapshot()
+        mask = self.get_mask(columns, ids, filters)
+        created = columns['created'][mask]
+        if name == 'resolution_days':
+            closed = columns['closed'][mask]
+            timed = ~columns['status'][mask] & (created != NO_DAY) & (closed != NO_DAY)
+            values = (closed - created)[timed]
+        else:
+            values = created[created != NO_DAY]
+        if not len(values):
+            return {'edges': [], 'counts': []}
+
+        counts, edges = numpy.histogram(values, bins=bins)
+        if name == 'created':
+            edges = [from_day(int(numpy.floor(edge))).isoformat() for edge in edges]
+        else:
+            edges = [round(float(edge), 2) for edge in edges]
+        return {'edges': edges, 'counts': counts.tolist()}
+
+
+def parse_query(query_params):
+    """
+    Validated parameters of a cube request: dimensions, measures, histogram, bins and filters.
+    """
+    dt_format = '%Y-%m-%dT%H:%M:%S'
+    query = {'filters': {}}
+    for param in ('date_gte', 'date_lte'):
+        value = query_params.get(param, '').split('.')[0]
+        if value:
+            try:
+                day = datetime.strptime(value, dt_format).date()
+            except ValueError:
+                raise ValidationError({param: [f'Expected format: {dt_format}']})
+            query['filters']['date_from' if param == 'date_gte' else 'date_to'] = day
+
+    for param, choices in (('dimensions', DIMENSIONS), ('measures', MEASURES)):
+        default = 'count' if param == 'measures' else ''
+        items = [item.strip() for item in query_params.get(param, default).split(',') if item.strip()]
+        unknown = [item for item in items if item not in choices]
+        if unknown:
+            raise ValidationError({param: [f'Unknown {param}: {", ".join(unknown)}. '
+                                           f'Expected: {", ".join(choices)}.']})
+        query[param] = tuple(choice for choice in choices if choice in items)
+    if len([name for name in query['dimensions'] if name in PERIODS]) > 1:
+        raise ValidationError({'dimensions': [f'At most one of: {", ".join(PERIODS)}.']})
+
+    query['histogram'] = query_params.get('histogram', '')
+    if query['histogram'] and query['histogram'] not in HISTOGRAMS:
+        raise ValidationError({'histogram': [f'Expected one of: {", ".join(HISTOGRAMS)}.']})
+    try:
+        query['bins'] = min(max(int(query_params.get('bins', 10)), 1), 1000)
+    except ValueError:
+        raise ValidationError({'bins': ['Expected an integer.']})
+
+    status = query_params.get('status', '')
+    if status in ('1', '0'):
+        query['filters']['status'] = status == '1'
+    for name, model in (('department', Department), ('category', Category), ('priority', Priority)):
+        title = query_params.get(name, '')
+        if title and title not in ('Любая', 'Любой'):
+            try:
+                query['filters'][name] = get_lookup_cache(model).get(title).pk
+            except model.DoesNotExist:
+                raise ValidationError({name: [f'Object with title={title} does not exist.']})
+    return query
+
+
+TICKET_CUBE = TicketCube()
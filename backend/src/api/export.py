@@ -0,0 +1,106 @@
+import csv
+import io
+from collections import defaultdict
+from itertools import islice
+from django.core.serializers.json import DjangoJSONEncoder
+from .models import Ticket, Expenditure, Priority, Category, Department, DevType
+from .lookups import get_lookup_cache
+
+TICKET_COLUMNS = ('id', 'created', 'closed', 'owner__username', 'description', 'device_id', 'device__inv_num',
+                  'device__title', 'device__department_id', 'device__type_id', 'priority_id', 'category_id',
+                  'status')
+
+CSV_HEADER = ('id', 'created', 'closed', 'owner', 'description', 'inv_num', 'device', 'department', 'device_type',
+              'work_done', 'priority', 'expenditures', 'category', 'status')
+
+
+class TicketExport:
+    """
+    Renders a filtered ticket queryset chunk by chunk: tickets are read as tuples through a database cursor and
+    only `chunk_size` of them with their work types and expenditures are in memory at a time, so an export
+    of any size starts sending right away and uses constant memory.
+    """
+    chunk_size = 2000
+
+    def __init__(self, queryset, chunk_size=None):
+        if chunk_size is not None:
+            self.chunk_size = chunk_size
+        if not queryset.query.order_by and not queryset.query.is_sliced:
+            queryset = queryset.order_by('pk')
+        self.queryset = queryset.values_list(*TICKET_COLUMNS)
+
+    def chunks(self, rows):
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def tickets(self):
+        for chunk in self.chunks(self.queryset.iterator(chunk_size=self.chunk_size)):
+            ids = [row[0] for row in chunk]
+            work_done = defaultdict(list)
+            for ticket_id, title in Ticket.work_done.through.objects.filter(ticket_id__in=ids)\
+                    .order_by('pk').values_list('ticket_id', 'worktype__title'):
+                work_done[ticket_id].append(title)
+            expenditures = defaultdict(list)
+            for pk, ticket_id, title, quantity in Expenditure.objects.filter(ticket_id__in=ids)\
+                    .order_by('pk').values_list('pk', 'ticket_id', 'position__title', 'quantity'):
+                expenditures[ticket_id].append({'id': pk, 'position': title, 'quantity': quantity})
+
+            for (pk, created, closed, owner, description, device_id, inv_num, device_title, department_id,
+                 device_type_id, priority_id, category_id, status) in chunk:
+                yield {
+                    'id': pk,
+                    'created': created,
+                    'closed': closed,
+                    'owner': owner,
+                    'description': description,
+                    'device': {
+                        'id': device_id,
+                        'inv_num': inv_num,
+                        'title': device_title,
+                        'department': self.title(Department, department_id),
+                        'type': self.title(DevType, device_type_id),
+                    },
+                    'work_done': work_done[pk],
+                    'priority': self.title(Priority, priority_id),
+                    'expenditures': expenditures[pk],
+                    'category': self.title(Category, category_id),
+                    'status': status,
+                }
+
+    @staticmethod
+    def title(model, pk):
+        return None if pk is None else get_lookup_cache(model).get_by_pk(pk).title
+
+    def ndjson(self):
+        encoder = DjangoJSONEncoder(ensure_ascii=False)
+        for chunk in self.chunks(self.tickets()):
+            yield ''.join(encoder.encode(ticket) + '\n' for ticket in chunk)
+
+    def csv(self):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_HEADER)
+        yield buffer.getvalue()
+        for chunk in self.chunks(self.tickets()):
+            buffer.seek(0)
+            buffer.truncate()
+            for ticket in chunk:
+                device = ticket['device']
+                writer.writerow((
+                    ticket['id'], ticket['created'], ticket['closed'], ticket['owner'], ticket['description'],
+                    device['inv_num'], device['title'], device['department'], device['type'],
+                    '; '.join(ticket['work_done']), ticket['priority'],
+                    '; '.join(f'{exp["position"]}: {exp["quantity"]}' for exp in ticket['expenditures']),
+                    ticket['category'], int(ticket['status']),
+                ))
+            yield buffer.getvalue()
+
+
+# Content type and renderer of every export format.
+EXPORT_FORMATS = {
+    'csv': ('text/csv', TicketExport.csv),
+    'ndjson': ('application/x-ndjson', TicketExport.ndjson),
+}
@@ -0,0 +1,115 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from .serializers import CachedSlugRelatedField
+
+
+def parse_fieldset(value):
+    """
+    Tree of the fields named in a `fields` parameter, 'id,device.inv_num' gives
+    {'id': {}, 'device': {'inv_num': {}}}. An empty subtree selects the field whole.
+    """
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in (name.strip() for name in path.split('.')):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+def plan_queryset(serializer, model, prefix=''):
+    """
+    (only, select_related, prefetch_related) arguments loading just what the fields of `serializer` read from
+    `model`. `only` is None when a field reads something else than a model field, then every column is loaded.
+    """
+    only, select_related, prefetch_related = [], [], []
+    for field in serializer.fields.values():
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            only = None
+            continue
+        path = prefix + field.source
+        nested = field.child if isinstance(field, serializers.ListSerializer) else field
+
+        if model_field.many_to_many or model_field.one_to_many:
+            related_model = model_field.related_model
+            if isinstance(nested, serializers.BaseSerializer):
+                related_only, related_select, related_prefetch = plan_queryset(nested, related_model)
+            elif isinstance(getattr(field, 'child_relation', None), serializers.PrimaryKeyRelatedField):
+                related_only, related_select, related_prefetch = [], [], []
+            else:
+                prefetch_related.append(path)
+                continue
+            queryset = related_model._default_manager.prefetch_related(*related_prefetch)
+            if related_select:
+                queryset = queryset.select_related(*related_select)
+            if related_only is not None and model_field.one_to_many:
+                # The key back to the prefetching rows, to group them by.
+                queryset = queryset.only(*related_only, model_field.field.name)
+            prefetch_related.append(Prefetch(path, queryset=queryset))
+        elif model_field.many_to_one or model_field.one_to_one:
+            if only is not None:
+                only.append(path)
+            if isinstance(nested, serializers.BaseSerializer):
+                select_related.append(path)
+                nested_only, nested_select, nested_prefetch = plan_queryset(nested, model_field.related_model,
+                                                                            f'{path}__')
+                only = None if only is None or nested_only is None else only + nested_only
+                select_related.extend(nested_select)
+                prefetch_related.extend(nested_prefetch)
+            elif isinstance(field, serializers.SlugRelatedField) and not isinstance(field, CachedSlugRelatedField):
+                select_related.append(path)
+                if only is not None:
+                    only.append(f'{path}__{field.slug_field}')
+            # Primary keys and cached slugs are read from the key column itself.
+        elif only is not None:
+            only.append(path)
+    return only, select_related, prefetch_related
+
+
+class SparseFieldsViewMixin:
+    """
+    `fields` and `expand` query parameters for list and retrieve, passed on to a serializer with SparseFieldsMixin.
+    The queryset is cut down to the selected fields: no columns, joins or prefetches for the fields left out.
+    """
+
+    def get_sparse_params(self):
+        if self.request is None or self.request.method not in ('GET', 'HEAD'):
+            return None
+        params = self.request.query_params
+        if 'fields' not in params and 'expand' not in params:
+            return None
+        return {
+            'fieldset': parse_fieldset(params['fields']) if 'fields' in params else None,
+            'expand': set(parse_fieldset(params.get('expand', ''))),
+        }
+
+    def get_serializer(self, *args, **kwargs):
+        sparse_params = self.get_sparse_params()
+        if sparse_params is not None:
+            kwargs.update(sparse_params)
+        return super().get_serializer(*args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.get_sparse_params() is None:
+            return queryset
+
+        only, select_related, prefetch_related = plan_queryset(self.get_serializer(), queryset.model)
+        queryset = queryset.select_related(None).prefetch_related(None)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        if only is not None:
+            # The column sorted by is read by the pagination cursor.
+            sort = self.request.query_params.get('sort', '')
+            try:
+                if sort and queryset.model._meta.get_field(sort).concrete:
+                    only.append(sort)
+            except FieldDoesNotExist:
+                pass
+            queryset = queryset.only(*only)
+        return queryset
@@ -0,0 +1,66 @@
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from .models import Ticket, Device, DevType, Department, WorkType, Priority, Category, Position, Expenditure, \
+    TableGeneration
+
+
+# Models whose writes bump a generation counter, see api.signals.
+TRACKED_MODELS = (Ticket, Device, DevType, Department, WorkType, Priority, Category, Position, Expenditure, User)
+
+
+def get_key(model):
+    return model._meta.label_lower
+
+
+def get_period_key(day):
+    """
+    Key of the tickets created in the month of `day`, bumped on every change of such a ticket, its work types
+    or expenditures. Lets a cached report over a range of dates outlive changes outside of the range.
+    """
+    return f'{get_key(Ticket)}@{day:%Y-%m}'
+
+
+def get_period_keys(date_from, date_to):
+    keys = []
+    month = date_from.replace(day=1)
+    while month <= date_to:
+        keys.append(get_period_key(month))
+        month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return keys
+
+
+def get_generations(models):
+    """
+    Current generation of every model, in one query. A model that has never been written has generation 0.
+    """
+    return get_key_generations([get_key(model) for model in models])
+
+
+def get_key_generations(keys):
+    generations = dict(TableGeneration.objects.filter(table__in=keys).values_list('table', 'generation'))
+    return [(key, generations.get(key, 0)) for key in keys]
+
+
+def bump_generation(*models):
+    bump_keys(get_key(model) for model in models)
+
+
+def bump_periods(days):
+    # Dates of instances created from strings are still strings.
+    created = Ticket._meta.get_field('created')
+    bump_keys(sorted({get_period_key(created.to_python(day)) for day in days if day is not None}))
+
+
+def bump_keys(keys):
+    for key in keys:
+        counter = TableGeneration.objects.filter(table=key)
+        if counter.update(generation=F('generation') + 1):
+            continue
+        try:
+            with transaction.atomic():
+                TableGeneration.objects.create(table=key, generation=1)
+        except IntegrityError:
+            # Created concurrently by another request.
+            counter.update(generation=F('generation') + 1)
@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import OrderedDict
+from .models import WorkType, Priority, Category, DevType, Department
+
+
+class LookupCache:
+    """
+    Per-process cache of a small, rarely changed table, addressed by primary key and by slug.
+
+    While the table has no more than `maxsize` rows it is held whole, a bigger table degrades to an LRU of
+    the last `maxsize` rows. A miss is looked up in the database either way: the row may have been created
+    by another process since the table was loaded. Entries are dropped on save and delete of any row (see
+    api.signals) and after `ttl` seconds, which bounds staleness across processes.
+    Cached instances are shared between threads and must be treated as read-only.
+    """
+
+    def __init__(self, model, slug_field='title', maxsize=1000, ttl=300):
+        self.model = model
+        self.slug_field = slug_field
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.rows = None
+            self.complete = False
+            self.by_pk = OrderedDict()
+            self.by_slug = OrderedDict()
+            self.loaded_at = time.monotonic()
+
+    def load(self):
+        if time.monotonic() - self.loaded_at > self.ttl:
+            self.clear()
+        if self.rows is not None:
+            return
+        rows = list(self.model._default_manager.order_by('pk')[:self.maxsize + 1])
+        self.rows = rows
+        self.complete = len(rows) <= self.maxsize
+        if self.complete:
+            for obj in rows:
+                self.remember(obj)
+
+    def remember(self, obj):
+        self.by_pk[obj.pk] = obj
+        self.by_pk.move_to_end(obj.pk)
+        slug = getattr(obj, self.slug_field)
+        self.by_slug[slug] = obj
+        self.by_slug.move_to_end(slug)
+        if not self.complete:
+            while len(self.by_pk) > self.maxsize:
+                self.by_pk.popitem(last=False)
+            while len(self.by_slug) > self.maxsize:
+                self.by_slug.popitem(last=False)
+
+    def all(self):
+        with self.lock:
+            self.load()
+            if self.complete:
+                return list(self.rows)
+        return list(self.model._default_manager.order_by('pk'))
+
+    def lookup(self, index_name, field, value):
+        with self.lock:
+            self.load()
+            index = getattr(self, index_name)
+            obj = index.get(value)
+            if obj is not None:
+                index.move_to_end(value)
+                return obj
+        obj = self.model._default_manager.get(**{field: value})
+        with self.lock:
+            if self.complete and obj.pk not in self.by_pk:
+                self.rows = sorted(self.rows + [obj], key=lambda row: row.pk)
+                self.complete = len(self.rows) <= self.maxsize
+            self.remember(obj)
+        return obj
+
+    def get(self, slug):
+        return self.lookup('by_slug', self.slug_field, slug)
+
+    def get_by_pk(self, pk):
+        return self.lookup('by_pk', 'pk', pk)
+
+
+LOOKUP_CACHES = {model: LookupCache(model) for model in (WorkType, Priority, Category, DevType, Department)}
+
+
+def get_lookup_cache(model):
+    return LOOKUP_CACHES.get(model)
+
+
+def clear_lookup_caches():
+    for cache in LOOKUP_CACHES.values():
+        cache.clear()
@@ -0,0 +1,65 @@
+import json
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from dj_rest_auth.models import TokenModel
+from api.benchmark import get_scenarios, measure, compare
+
+
+class Command(BaseCommand):
+    help = 'Measures latency, queries and memory of every API endpoint and compares them with a baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help='Scenarios to run, all by default.')
+        parser.add_argument('--repeat', type=int, default=20, help='Measured requests per scenario.')
+        parser.add_argument('--user', help='Username to authenticate as, anonymous by default.')
+        parser.add_argument('--save', metavar='PATH', help='Write the results as JSON, to be used as a baseline.')
+        parser.add_argument('--baseline', metavar='PATH', help='Results saved earlier with --save to compare with.')
+        parser.add_argument('--threshold', type=float, default=20,
+                            help='Allowed p95 slowdown against the baseline, in percent.')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be positive')
+        token = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f'No user {options["user"]}')
+            token = TokenModel.objects.get_or_create(user=user)[0].key
+
+        baseline = {}
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                baseline = json.load(file)['scenarios']
+
+        scenarios = get_scenarios()
+        unknown = set(options['scenarios']) - {name for name, _ in scenarios}
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+
+        self.stdout.write(f'{"scenario":<22} {"status":>6} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} '
+                          f'{"queries":>7} {"peak KB":>9} {"p95 vs base":>11}')
+        results = {}
+        # Requests are made in process by the test client, which sends `Host: testserver`.
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for name, url in scenarios:
+                if options['scenarios'] and name not in options['scenarios']:
+                    continue
+                result = results[name] = measure(url, options['repeat'], token)
+                change = ''
+                if name in baseline:
+                    change = f'{(result["p95_ms"] / baseline[name]["p95_ms"] - 1) * 100:+.0f}%'
+                self.stdout.write(f'{name:<22} {result["status"]:>6} {result["p50_ms"]:>8.1f} '
+                                  f'{result["p95_ms"]:>8.1f} {result["p99_ms"]:>8.1f} {result["queries"]:>7} '
+                                  f'{result["peak_kb"]:>9.0f} {change:>11}')
+
+        if options['save']:
+            with open(options['save'], 'w') as file:
+                json.dump({'repeat': options['repeat'], 'scenarios': results}, file, indent=2, sort_keys=True)
+
+        regressions = compare(results, baseline, options['threshold'] / 100)
+        if regressions:
+            raise CommandError('Regressions against the baseline:\n' + '\n'.join(regressions))
@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.urls import reverse
+from dj_rest_auth.models import TokenModel
+from api.benchmark import get_url, measure_payload
+
+
+def format_value(value, width):
+    # Not installed.
+    return f'{"-":>{width}}' if value is None else f'{value:>{width}.2f}'
+
+
+class Command(BaseCommand):
+    help = 'Measures render CPU time and bytes on the wire of ticket list pages of several sizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limits', default='20,100,500', help='Comma separated page sizes.')
+        parser.add_argument('--repeat', type=int, default=20, help='Renders measured per page and renderer.')
+        parser.add_argument('--user', help='Username to authenticate as, anonymous by default.')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be positive')
+        try:
+            limits = [int(limit) for limit in options['limits'].split(',')]
+        except ValueError:
+            raise CommandError('--limits must be comma separated integers')
+        token = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f'No user {options["user"]}')
+            token = TokenModel.objects.get_or_create(user=user)[0].key
+
+        self.stdout.write(f'{"limit":>6} {"stdlib ms":>10} {"orjson ms":>10} {"raw KB":>8} {"gzip KB":>8} '
+                          f'{"br KB":>8} {"wire KB":>8} {"encoding":>9}')
+        for limit in limits:
+            url = get_url(reverse('ticket-list'), {'cursor': '', 'limit': limit, 'sort': 'id', 'order': 'desc'})
+            # Requests are made in process by the test client, which sends `Host: testserver`.
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                result = measure_payload(url, options['repeat'], token)
+            if result['status'] != 200:
+                raise CommandError(f'{url} answered {result["status"]}')
+            self.stdout.write(f'{limit:>6} {result["stdlib_ms"]:>10.2f} {format_value(result["orjson_ms"], 10)} '
+                              f'{result["raw_kb"]:>8.2f} {result["gzip_kb"]:>8.2f} {format_value(result["br_kb"], 8)} '
+                              f'{result["wire_kb"]:>8.2f} {result["wire_encoding"]:>9}')
@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min, Max
+from django.test.utils import override_settings
+from django.urls import reverse
+from dj_rest_auth.models import TokenModel
+from api.models import Ticket, Device
+from api.benchmark import run_wsgi, run_asgi, summarize
+from api.cube import numpy
+
+
+class Command(BaseCommand):
+    help = ('Compares the read endpoints under WSGI and ASGI, and the async versions of the ticket list, detail '
+            'and dashboard under ASGI')
+
+    def add_arguments(self, parser):
+        parser.add_argument('endpoints', nargs='*',
+                            help='Endpoints to benchmark: list, detail, dashboard, cube, changes, autocomplete, '
+                                 'stock. All by default.')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and path.')
+        parser.add_argument('--concurrency', type=int, default=16, help='Requests in flight at once.')
+        parser.add_argument('--user', help='Username to authenticate as, anonymous by default.')
+
+    def get_endpoints(self):
+        first = Ticket.objects.order_by('pk').values_list('pk', flat=True).first()
+        if first is None:
+            raise CommandError('No tickets to benchmark against')
+        dates = Ticket.objects.aggregate(first=Min('created'), last=Max('created'))
+        device_title = Device.objects.order_by('pk').values_list('title', flat=True).first() or ''
+        dashboard_params = {
+            'date_gte': f'{dates["first"]:%Y-%m-%d}T00:00:00',
+            'date_lte': f'{dates["last"]:%Y-%m-%d}T00:00:00',
+        }
+        return {
+            'list': (reverse('ticket-list'), reverse('async_ticket_list'), {'cursor': '', 'limit': 30}),
+            'detail': (reverse('ticket-detail', kwargs={'pk': first}),
+                       reverse('async_ticket_detail', kwargs={'pk': first}), {}),
+            'dashboard': (reverse('ticket_per_date'), reverse('async_ticket_per_date'), dashboard_params),
+            # Without async versions.
+            'cube': (reverse('ticket_cube'), None, {**dashboard_params, 'dimensions': 'department,status',
+                                                    'measures': 'count,resolution_days'}),
+            'changes': (reverse('changes'), None, {'since': 0}),
+            'autocomplete': (reverse('device-autocomplete'), None, {'q': device_title[:3]}),
+            'stock': (reverse('position-stock'), None, {}),
+        }
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be positive')
+        token = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f'No user {options["user"]}')
+            token = TokenModel.objects.get_or_create(user=user)[0].key
+
+        endpoints = self.get_endpoints()
+        for name in options['endpoints']:
+            if name not in endpoints:
+                raise CommandError(f'Unknown endpoint {name}, expected one of: {", ".join(endpoints)}')
+        names = options['endpoints'] or list(endpoints)
+        if numpy is None and 'cube' in names:
+            # The cube endpoint answers 501 without numpy.
+            if options['endpoints']:
+                raise CommandError('The cube endpoint needs numpy')
+            names.remove('cube')
+        self.stdout.write(f'{"endpoint":<12} {"path":<12} {"rps":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}')
+        for name in names:
+            sync_path, async_path, params = endpoints[name]
+            runs = [
+                ('wsgi', run_wsgi, sync_path),
+                ('asgi', run_asgi, sync_path),
+            ]
+            if async_path is not None:
+                runs.append(('asgi-async', run_asgi, async_path))
+            for label, run, path in runs:
+                # Requests are made in process by the test clients, which send `Host: testserver`.
+                with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                    latencies, elapsed, errors = run(path, params, options['requests'], options['concurrency'],
+                                                     token)
+                if errors:
+                    raise CommandError(f'{name} {label}: {len(errors)} requests failed, first with {errors[0]}')
+                summary = summarize(latencies, elapsed)
+                self.stdout.write(f'{name:<12} {label:<12} {summary["rps"]:>8.1f} {summary["p50_ms"]:>8.1f} '
+                                  f'{summary["p95_ms"]:>8.1f} {summary["p99_ms"]:>8.1f}')
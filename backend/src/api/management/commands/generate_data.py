@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.synthetic import SyntheticData
+
+
+class Command(BaseCommand):
+    help = 'Adds generated departments, devices, positions, users and tickets for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tickets', type=int, default=100000)
+        parser.add_argument('--devices', type=int, default=5000)
+        parser.add_argument('--departments', type=int, default=100)
+        parser.add_argument('--positions', type=int, default=500)
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--days', type=int, default=3 * 365, help='Tickets are spread over this many last days.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Tickets written per transaction.')
+        parser.add_argument('--seed', type=int, help='Seed for reproducible data.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['days'] < 1:
+            raise CommandError('--batch-size and --days must be positive')
+        for name in ('tickets', 'devices', 'departments', 'positions', 'users'):
+            if options[name] < 0:
+                raise CommandError(f'--{name} must not be negative')
+
+        data = SyntheticData(tickets=options['tickets'], devices=options['devices'],
+                             departments=options['departments'], positions=options['positions'],
+                             users=options['users'], days=options['days'], batch_size=options['batch_size'],
+                             seed=options['seed'], log=self.stdout.write if options['verbosity'] > 1 else None)
+        try:
+            data.generate()
+        except ValueError as exc:
+            raise CommandError(exc)
+        self.stdout.write(f'{options["tickets"]} tickets generated')
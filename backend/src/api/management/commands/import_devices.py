@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ParseError
+from api.bulk import DeviceImport
+from api.parsers import iter_csv_rows, iter_ndjson_rows
+
+
+class Command(BaseCommand):
+    help = 'Creates or updates devices by inventory number from a CSV or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with an inv_num,title,department,type header, or NDJSON file.')
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help='Format of the file, by its extension if not given.')
+        parser.add_argument('--create-missing', action='store_true',
+                            help='Create the departments and device types that do not exist yet.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows written per transaction.')
+        parser.add_argument('--encoding', default='utf-8')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        file_format = options['format'] or ('ndjson' if options['path'].endswith(('.ndjson', '.jsonl')) else 'csv')
+        read_rows = iter_ndjson_rows if file_format == 'ndjson' else iter_csv_rows
+
+        try:
+            with open(options['path'], 'rb') as lines:
+                report = DeviceImport(read_rows(lines, DeviceImport.fields, options['encoding']),
+                                      create_missing=options['create_missing'],
+                                      batch_size=options['batch_size']).run()
+        except (OSError, ParseError) as exc:
+            raise CommandError(exc)
+
+        for error in report['errors']:
+            messages = '; '.join(f'{field}: {" ".join(map(str, messages))}'
+                                 for field, messages in error['errors'].items())
+            self.stderr.write(f'Line {error["line"]}: {messages}')
+        self.stdout.write(f'{report["created"]} created, {report["updated"]} updated, '
+                          f'{report["unchanged"]} unchanged, {len(report["errors"])} rows with errors')
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.search import SEARCH_FIELDS, get_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index of tickets, devices and positions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', metavar='model',
+                            help='Models to reindex: ticket, device, position. All of them by default.')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of rows read and indexed per batch.')
+        parser.add_argument('--database', default='default',
+                            help='Database alias to rebuild the index in.')
+
+    def handle(self, *args, **options):
+        models = {model._meta.model_name: model for model in SEARCH_FIELDS}
+        names = options['models'] or list(models)
+        unknown = set(names) - set(models)
+        if unknown:
+            raise CommandError(f'Unknown model(s): {", ".join(sorted(unknown))}')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        backend = get_backend(options['database'])
+        backend.install([models[name] for name in names])
+        for name in names:
+            indexed = backend.rebuild(models[name], chunk_size=options['chunk_size'])
+            self.stdout.write(f'{name}: {indexed} rows indexed')
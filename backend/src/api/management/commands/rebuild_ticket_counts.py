@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.rollups import rebuild_daily_counts
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the daily ticket counters used by the dashboard from the ticket table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of counter rows inserted per query.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        created = rebuild_daily_counts(batch_size=options['batch_size'])
+        self.stdout.write(f'{created} daily counters written')
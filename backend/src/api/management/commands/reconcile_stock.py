@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.stock import reconcile_stock
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the stock of positions from the stock ledger and takes fresh ledger snapshots'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of positions reconciled per transaction.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report the positions whose stock drifted from the ledger.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        checked, drifts = reconcile_stock(batch_size=options['batch_size'], dry_run=options['dry_run'])
+        for pk, quantity, ledger_quantity in drifts:
+            self.stdout.write(f'Position {pk}: {quantity} in stock, {ledger_quantity} by the ledger')
+        action = 'found' if options['dry_run'] else 'fixed'
+        self.stdout.write(f'{checked} positions checked, {len(drifts)} drifts {action}')
@@ -0,0 +1,228 @@
+import asyncio
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+# Upper bounds of the latency histogram buckets, in seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+UNRESOLVED_ROUTE = '<unresolved>'
+
+
+class RouteMetrics:
+    __slots__ = ('buckets', 'count', 'duration', 'queries', 'db_time', 'response_bytes')
+
+    def __init__(self, bucket_count):
+        self.buckets = [0] * (bucket_count + 1)
+        self.count = 0
+        self.duration = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.response_bytes = 0
+
+
+class MetricsRegistry:
+    """
+    Per-process request metrics by (route, method, status): a latency histogram and totals of SQL queries,
+    database time and response bytes. Every worker process exposes its own numbers.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.bucket_bounds = buckets
+        self.lock = threading.Lock()
+        self.routes = {}
+
+    def observe(self, route, method, status, duration, queries, db_time, response_bytes):
+        key = (route, method, status)
+        with self.lock:
+            metrics = self.routes.get(key)
+            if metrics is None:
+                metrics = self.routes[key] = RouteMetrics(len(self.bucket_bounds))
+            metrics.buckets[bisect_left(self.bucket_bounds, duration)] += 1
+            metrics.count += 1
+            metrics.duration += duration
+            metrics.queries += queries
+            metrics.db_time += db_time
+            metrics.response_bytes += response_bytes
+
+    def clear(self):
+        with self.lock:
+            self.routes = {}
+
+    def render(self):
+        """
+        The metrics in the Prometheus text exposition format.
+        """
+        with self.lock:
+            routes = sorted((key, self.copy(metrics)) for key, metrics in self.routes.items())
+
+        lines = [
+            '# HELP api_request_duration_seconds Request latency by route.',
+            '# TYPE api_request_duration_seconds histogram',
+        ]
+        for key, metrics in routes:
+            labels = format_labels(key)
+            cumulative = 0
+            for bound, count in zip(self.bucket_bounds, metrics.buckets):
+                cumulative += count
+                lines.append(f'api_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'api_request_duration_seconds_bucket{{{labels},le="+Inf"}} {metrics.count}')
+            lines.append(f'api_request_duration_seconds_sum{{{labels}}} {metrics.duration!r}')
+            lines.append(f'api_request_duration_seconds_count{{{labels}}} {metrics.count}')
+
+        totals = (
+            ('api_request_db_queries_total', 'SQL queries run by requests, by route.', 'queries'),
+            ('api_request_db_seconds_total', 'Time spent in SQL queries by requests, by route.', 'db_time'),
+            ('api_response_bytes_total', 'Response body bytes sent, by route.', 'response_bytes'),
+        )
+        for name, help_text, attribute in totals:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for key, metrics in routes:
+                lines.append(f'{name}{{{format_labels(key)}}} {getattr(metrics, attribute)!r}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def copy(metrics):
+        copy = RouteMetrics(len(metrics.buckets) - 1)
+        for attribute in RouteMetrics.__slots__:
+            value = getattr(metrics, attribute)
+            setattr(copy, attribute, list(value) if isinstance(value, list) else value)
+        return copy
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(key):
+    route, method, status = key
+    return f'route="{escape_label(route)}",method="{escape_label(method)}",status="{status}"'
+
+
+REGISTRY = MetricsRegistry()
+
+
+class QueryStats:
+    """
+    Database execute wrapper counting the queries of a request and the time spent in them.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+
+# QueryStats of the request being handled. Under ASGI sync views run in another thread, with other connections,
+# the context goes along with them.
+REQUEST_STATS = ContextVar('request_stats', default=None)
+
+
+def count_query(execute, sql, params, many, context):
+    stats = REQUEST_STATS.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def install_query_counter(connection, **kwargs):
+    """
+    connection_created receiver, every connection counts its queries into the REQUEST_STATS of the moment.
+    """
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+@contextmanager
+def counting_queries(stats):
+    token = REQUEST_STATS.set(stats)
+    try:
+        yield
+    finally:
+        REQUEST_STATS.reset(token)
+
+
+class MetricsMiddleware:
+    """
+    Records every request into REGISTRY under the name of its resolved URL pattern. Goes first in MIDDLEWARE,
+    so that the latency covers the other middleware as well. Streaming responses are recorded when the last
+    chunk has been sent. Works in both handler modes, under ASGI it must not make the requests behind it run
+    one at a time in a sync thread. Queries of the async views run on executor threads and are not counted.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Makes the handler await the instance, as MiddlewareMixin does.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        stats = QueryStats()
+        started = time.perf_counter()
+        with counting_queries(stats):
+            response = self.get_response(request)
+        return self.record(request, response, stats, started)
+
+    async def __acall__(self, request):
+        stats = QueryStats()
+        started = time.perf_counter()
+        with counting_queries(stats):
+            response = await self.get_response(request)
+        return self.record(request, response, stats, started)
+
+    def record(self, request, response, stats, started):
+        match = request.resolver_match
+        route = (match.url_name or match.view_name) if match else UNRESOLVED_ROUTE
+        if route == 'metrics':
+            return response
+
+        def observe(response_bytes):
+            REGISTRY.observe(route, request.method, response.status_code, time.perf_counter() - started,
+                             stats.queries, stats.db_time, response_bytes)
+
+        if response.streaming:
+            response.streaming_content = self.count_streamed(response.streaming_content, stats, observe)
+        else:
+            observe(len(response.content))
+        return response
+
+    @staticmethod
+    def count_streamed(content, stats, observe):
+        # Streamed content is produced, and queried for, as it is sent.
+        sent = 0
+        content = iter(content)
+        try:
+            while True:
+                with counting_queries(stats):
+                    chunk = next(content, None)
+                if chunk is None:
+                    break
+                sent += len(chunk)
+                yield chunk
+        finally:
+            observe(sent)
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint, answers only to the addresses in METRICS_ALLOWED_IPS.
+    """
+    if request.META.get('REMOTE_ADDR') not in getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1')):
+        return HttpResponseForbidden()
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
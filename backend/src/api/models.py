@@ -1,7 +1,52 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.utils import timezone
+
+# Key of the counter of the change sequence among the table generations.
+CHANGE_SEQUENCE = 'changes'
+
+
+def next_change_seq(count=1, using=None):
+    """
+    Takes `count` numbers of the change sequence and returns the first one. Called in the transaction of the
+    write the numbers are for, which then holds the counter locked until it commits: numbers are taken in
+    commit order, and a reader of the change feed never sees one before all the smaller ones.
+    """
+    counter = TableGeneration.objects.using(using).filter(table=CHANGE_SEQUENCE)
+    if not counter.update(generation=F('generation') + count):
+        try:
+            with transaction.atomic(using=using):
+                TableGeneration.objects.using(using).create(table=CHANGE_SEQUENCE, generation=count)
+        except IntegrityError:
+            # Created concurrently by another request.
+            counter.update(generation=F('generation') + count)
+    return counter.values_list('generation', flat=True).get() - count + 1
+
+
+class ChangeTracked(models.Model):
+    """
+    Rows reported by the change feed, see api.changes. Every save numbers the row anew from the change
+    sequence, writes that skip save() take their numbers with next_change_seq() themselves.
+    """
+    change_seq = models.BigIntegerField(default=0, db_index=True, editable=False,
+                                        verbose_name='Номер изменения')
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not update_fields:
+            return super().save(*args, **kwargs)
+        # Without a savepoint, an error marks the transaction for rollback all the same, see Model.save_base().
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            self.change_seq = next_change_seq(using=kwargs.get('using'))
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'change_seq'}
+            super().save(*args, **kwargs)
+
+    class Meta:
+        abstract = True
 
-class Ticket(models.Model):
+
+class Ticket(ChangeTracked):
     created = models.DateField(db_index=True, blank=True, null=True,
                                verbose_name='Дата создания')
     closed = models.DateField(blank=True, null=True, db_index=True, verbose_name='Дата закрытия')
@@ -18,12 +63,29 @@ class Ticket(models.Model):
                                  verbose_name='Категория')
     status = models.BooleanField(default=True, verbose_name='Статус')
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Values as they are stored in the database, used to tell what a save() actually changed.
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     def __str__(self):
         return f'Заявка №{self.id}'
 
     class Meta:
         verbose_name = 'Заявка'
         verbose_name_plural = 'Заявки'
+        # Filter combinations of the ticket list. A boolean filter is rendered as a bare `WHERE status`, which
+        # only a partial index can match: open or closed tickets in a range of dates, and open tickets in id
+        # order for the dashboard. Tickets of the devices of a department are read within a range of dates,
+        # status is checked in the index.
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(status=True), name='ticket_open_id'),
+            models.Index(fields=['created'], condition=models.Q(status=True), name='ticket_open_created'),
+            models.Index(fields=['created'], condition=models.Q(status=False), name='ticket_closed_created'),
+            models.Index(fields=['device', 'created', 'status'], name='ticket_device_created_status'),
+        ]
 
 
 class Priority(models.Model):
@@ -60,7 +122,7 @@ class Category(models.Model):
         verbose_name_plural = 'Категории заявок'
 
 
-class Device(models.Model):
+class Device(ChangeTracked):
     inv_num = models.CharField(max_length=30, db_index=True, unique=True, verbose_name='Инвентарный/сер. номер')
     title = models.CharField(max_length=50, db_index=True, verbose_name='Название устр.')
     department = models.ForeignKey('Department', related_name='devices', on_delete=models.PROTECT,
@@ -74,6 +136,9 @@ class Device(models.Model):
     class Meta:
         verbose_name = 'Устройство/оборудование'
         verbose_name_plural = 'Устройства/оборудование'
+        indexes = [
+            models.Index(fields=['department', 'type'], name='device_department_type'),
+        ]
 
 
 class DevType(models.Model):
@@ -98,16 +163,59 @@ class Department(models.Model):
         verbose_name_plural = 'Организации'
 
 
-class Position(models.Model):
+class OutOfStock(Exception):
+    def __init__(self, position_id, requested):
+        super().__init__(f'Not enough of position {position_id} in stock: {requested} requested.')
+        self.position_id = position_id
+
+
+class Position(ChangeTracked):
     title = models.CharField(max_length=100, unique=True, verbose_name='Наименование позиции')
     quantity = models.PositiveIntegerField(verbose_name='Количество, шт.')
 
+    def save(self, *args, **kwargs):
+        # Stock set directly, on creation or in a form, enters the ledger by the difference to the stored row.
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'quantity' not in update_fields:
+            return super().save(*args, **kwargs)
+
+        with transaction.atomic(using=kwargs.get('using')):
+            stored = None
+            if self.pk is not None and not kwargs.get('force_insert'):
+                stored = Position.objects.select_for_update().filter(pk=self.pk)\
+                    .values_list('quantity', flat=True).first()
+            super().save(*args, **kwargs)
+            delta = self._meta.get_field('quantity').to_python(self.quantity) - (stored or 0)
+            if delta:
+                StockMovement.objects.create(position=self, delta=delta, kind=StockMovement.RECEIPT if delta > 0
+                                             else StockMovement.ADJUSTMENT)
+
+    @classmethod
+    def change_stock(cls, position_id, delta):
+        """
+        Adds `delta` to the stock of a position (negative to take from it) in a single UPDATE, so concurrent
+        changes never overwrite each other, and the row takes a new number of the change sequence. Taking more
+        than there is raises OutOfStock and changes nothing.
+        The caller records the change in the ledger, see StockMovement.record(). A change left out of it is
+        drift to reconcile_stock, which sets the stock back to the ledger.
+        """
+        if not delta:
+            return
+        positions = cls._default_manager.filter(pk=position_id)
+        if delta < 0:
+            positions = positions.filter(quantity__gte=-delta)
+        if not positions.update(quantity=F('quantity') + delta, change_seq=next_change_seq()):
+            raise OutOfStock(position_id, -delta)
+
     def __str__(self):
         return self.title
 
     class Meta:
         verbose_name = 'Позиция'
         verbose_name_plural = 'Позиции (склад)'
+        constraints = [
+            models.CheckConstraint(check=models.Q(quantity__gte=0), name='position_quantity_non_negative'),
+        ]
 
 
 class Expenditure(models.Model):
@@ -118,18 +226,150 @@ class Expenditure(models.Model):
                                on_delete=models.CASCADE, verbose_name='Заявка')
 
     def save(self, *args, **kwargs):
-        self.position.quantity -= self.quantity
-        self.position.save()
-        super().save(*args, **kwargs)
-
-    def delete(self, *args, **kwargs):
-        self.position.quantity += self.quantity
-        self.position.save()
-        super().delete(*args, **kwargs)
+        # Stock moves by the difference to the stored row, in the same transaction as the row itself.
+        # Deleted expenditures return their stock in api.signals, which also covers deletion with the ticket.
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not {'position', 'position_id', 'quantity'} & set(update_fields):
+            return super().save(*args, **kwargs)
+
+        with transaction.atomic(using=kwargs.get('using')):
+            changes = {self.position_id: -self.quantity}
+            if self.pk is not None and not kwargs.get('force_insert'):
+                stored = Expenditure.objects.select_for_update().filter(pk=self.pk)\
+                    .values_list('position_id', 'quantity').first()
+                if stored is not None:
+                    changes[stored[0]] = changes.get(stored[0], 0) + stored[1]
+            # Positions are always locked in the same order, concurrent saves cannot deadlock on them.
+            for position_id in sorted(changes):
+                Position.change_stock(position_id, changes[position_id])
+            super().save(*args, **kwargs)
+            StockMovement.record(changes, self.pk)
 
     def __str__(self):
         return f'{self.position.title} : {self.quantity}'
 
     class Meta:
         verbose_name = 'Расход ЗИП со склада'
-        verbose_name_plural = 'Расход ЗИП со склада'
\ No newline at end of file
+        verbose_name_plural = 'Расход ЗИП со склада'
+
+
+class StockMovement(models.Model):
+    """
+    Append-only ledger of stock changes: the stock of a position is the sum of its movements. Rows are
+    never updated, a cancelled expenditure is a reversal of its own.
+    """
+    OPENING = 'opening'
+    RECEIPT = 'receipt'
+    EXPENDITURE = 'expenditure'
+    REVERSAL = 'reversal'
+    ADJUSTMENT = 'adjustment'
+    KINDS = [
+        (OPENING, 'Остаток на начало'),
+        (RECEIPT, 'Поступление'),
+        (EXPENDITURE, 'Расход'),
+        (REVERSAL, 'Возврат'),
+        (ADJUSTMENT, 'Списание'),
+    ]
+
+    position = models.ForeignKey('Position', related_name='movements', on_delete=models.CASCADE, db_index=False,
+                                 verbose_name='Позиция (склад)')
+    kind = models.CharField(max_length=20, choices=KINDS, verbose_name='Вид движения')
+    delta = models.IntegerField(verbose_name='Изменение, шт.')
+    # Kept after the expenditure is deleted, its reversal refers to it as well.
+    expenditure = models.ForeignKey('Expenditure', blank=True, null=True, related_name='+',
+                                    on_delete=models.DO_NOTHING, db_constraint=False, verbose_name='Расход')
+    created = models.DateTimeField(default=timezone.now, verbose_name='Время')
+
+    @classmethod
+    def record(cls, changes, expenditure_id=None):
+        """
+        Appends the stock changes made for an expenditure, {position_id: delta}, in one query.
+        """
+        cls.objects.bulk_create([
+            cls(position_id=position_id, delta=delta, kind=cls.EXPENDITURE if delta < 0 else cls.REVERSAL,
+                expenditure_id=expenditure_id)
+            for position_id, delta in sorted(changes.items()) if delta
+        ])
+
+    def __str__(self):
+        return f'{self.created} {self.position_id}: {self.delta:+d}'
+
+    class Meta:
+        verbose_name = 'Движение по складу'
+        verbose_name_plural = 'Движения по складу'
+        indexes = [
+            # Movements of a position after its snapshot.
+            models.Index(fields=['position', 'id'], name='stock_movement_position'),
+        ]
+
+
+class StockSnapshot(models.Model):
+    """
+    Stock of a position after one of its movements, so that the stock at any time is a snapshot plus
+    the movements since. Written by the reconcile_stock command.
+    """
+    position = models.ForeignKey('Position', related_name='snapshots', on_delete=models.CASCADE, db_index=False,
+                                 verbose_name='Позиция (склад)')
+    movement = models.ForeignKey('StockMovement', related_name='+', on_delete=models.CASCADE, db_index=False,
+                                 verbose_name='Последнее движение')
+    created = models.DateTimeField(verbose_name='Время последнего движения')
+    quantity = models.IntegerField(verbose_name='Количество, шт.')
+
+    def __str__(self):
+        return f'{self.created} {self.position_id}: {self.quantity}'
+
+    class Meta:
+        verbose_name = 'Снимок склада'
+        verbose_name_plural = 'Снимки склада'
+        constraints = [
+            models.UniqueConstraint(fields=['position', 'movement'], name='unique_stock_snapshot'),
+        ]
+
+
+class TicketDailyCount(models.Model):
+    day = models.DateField(verbose_name='Дата создания заявок')
+    department = models.ForeignKey('Department', related_name='daily_counts', on_delete=models.CASCADE,
+                                   verbose_name='Организация')
+    category = models.ForeignKey('Category', related_name='daily_counts', on_delete=models.CASCADE,
+                                 verbose_name='Категория')
+    open_count = models.IntegerField(default=0, verbose_name='Открытые заявки')
+    closed_count = models.IntegerField(default=0, verbose_name='Закрытые заявки')
+
+    def __str__(self):
+        return f'{self.day} {self.department_id}/{self.category_id}: {self.open_count}/{self.closed_count}'
+
+    class Meta:
+        verbose_name = 'Счетчик заявок за день'
+        verbose_name_plural = 'Счетчики заявок по дням'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'department', 'category'], name='unique_ticket_daily_count'),
+        ]
+
+
+class TableGeneration(models.Model):
+    table = models.CharField(max_length=100, primary_key=True, verbose_name='Таблица')
+    generation = models.BigIntegerField(default=0, verbose_name='Поколение')
+
+    def __str__(self):
+        return f'{self.table}: {self.generation}'
+
+    class Meta:
+        verbose_name = 'Поколение таблицы'
+        verbose_name_plural = 'Поколения таблиц'
+
+
+class Tombstone(models.Model):
+    """
+    Deleted row of a ChangeTracked model, reported by the change feed as a deletion.
+    """
+    table = models.CharField(max_length=100, verbose_name='Таблица')
+    object_id = models.BigIntegerField(verbose_name='Идентификатор')
+    change_seq = models.BigIntegerField(db_index=True, verbose_name='Номер изменения')
+    deleted = models.DateTimeField(default=timezone.now, verbose_name='Время удаления')
+
+    def __str__(self):
+        return f'{self.table} {self.object_id}'
+
+    class Meta:
+        verbose_name = 'Удалённая запись'
+        verbose_name_plural = 'Удалённые записи'
@@ -0,0 +1,172 @@
+import base64
+import binascii
+import json
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over (sort column, id): every page is a range seek from the last seen row, so
+    deep pages are as cheap as the first one and inserts do not shift the rows a client has not seen yet.
+    Active only when the request carries `cursor` (empty for the first page), NULLs sort as the smallest value.
+    """
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+    default_limit = 30
+    max_limit = 500
+    orders = {
+        'asc': False,
+        'desc': True,
+    }
+    invalid_cursor_message = 'Invalid cursor'
+
+    def is_active(self, request):
+        return self.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_active(request):
+            return None
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.limit = self.get_limit(request)
+        self.field, self.descending = self.get_ordering(queryset.model, request)
+
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor['r']
+        descending = self.descending != reverse
+
+        queryset = queryset.order_by(*self.get_order_by(descending))
+        if cursor is not None:
+            queryset = queryset.filter(self.get_seek_filter(cursor['v'], cursor['i'], descending))
+
+        rows = list(queryset[:self.limit + 1])
+        has_more = len(rows) > self.limit
+        rows = rows[:self.limit]
+
+        if reverse:
+            rows.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = cursor is not None
+
+        self.rows = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if not self.has_next or not self.rows:
+            return None
+        return self.encode_cursor(self.rows[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.rows:
+            return None
+        return self.encode_cursor(self.rows[0], reverse=True)
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+        except (KeyError, ValueError):
+            return self.default_limit
+        return min(max(limit, 1), self.max_limit)
+
+    def get_ordering(self, model, request):
+        # Without `sort` and `order` pages go by id. An ordering the seek cannot follow is refused, rather than
+        # served in an order the client did not ask for.
+        sort = request.query_params.get('sort', '')
+        order = request.query_params.get('order', '')
+
+        if not sort and not order:
+            return model._meta.pk, False
+        if order not in self.orders:
+            raise ValidationError({'order': [f'Expected one of: {", ".join(self.orders)}.']})
+        try:
+            field = model._meta.get_field(sort)
+        except FieldDoesNotExist:
+            field = None
+        if field is None or not field.concrete or field.many_to_many:
+            raise ValidationError({'sort': [f'Cannot page by "{sort}".']})
+        return field, self.orders[order]
+
+    def get_order_by(self, descending):
+        pk = self.field.model._meta.pk
+        if descending:
+            order_by = [F(self.field.attname).desc(nulls_last=True)]
+            if self.field is not pk:
+                order_by.append(F(pk.attname).desc())
+        else:
+            order_by = [F(self.field.attname).asc(nulls_first=True)]
+            if self.field is not pk:
+                order_by.append(F(pk.attname).asc())
+        return order_by
+
+    def get_seek_filter(self, value, pk_value, descending):
+        column = self.field.attname
+        pk = self.field.model._meta.pk.attname
+        after = 'lt' if descending else 'gt'
+
+        if self.field.primary_key:
+            return Q(**{f'{pk}__{after}': pk_value})
+
+        if value is None:
+            seek = Q(**{f'{column}__isnull': True, f'{pk}__{after}': pk_value})
+            if not descending:
+                seek |= Q(**{f'{column}__isnull': False})
+            return seek
+
+        seek = Q(**{f'{column}__{after}': value}) | Q(**{column: value, f'{pk}__{after}': pk_value})
+        if descending and self.field.null:
+            seek |= Q(**{f'{column}__isnull': True})
+        return seek
+
+    def encode_cursor(self, obj, reverse):
+        value = getattr(obj, self.field.attname)
+        payload = {
+            's': self.field.attname,
+            'd': int(self.descending),
+            'r': int(reverse),
+            'v': None if value is None else self.field.value_to_string(obj),
+            'i': obj.pk,
+        }
+        raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        cursor = base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+        url = remove_query_param(self.base_url, 'start')
+        url = remove_query_param(url, 'end')
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param, '')
+        if not encoded:
+            return None
+
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)).decode('utf-8'))
+            cursor = {
+                's': payload['s'],
+                'd': bool(payload['d']),
+                'r': bool(payload['r']),
+                'v': payload['v'],
+                'i': self.field.model._meta.pk.to_python(payload['i']),
+            }
+            if cursor['v'] is not None:
+                cursor['v'] = self.field.to_python(cursor['v'])
+        except (TypeError, ValueError, KeyError, UnicodeError, binascii.Error, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if cursor['s'] != self.field.attname or cursor['d'] != self.descending:
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
@@ -0,0 +1,100 @@
+import csv
+import json
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+
+try:
+    import orjson
+except ImportError:
+    # Optional, without it the stdlib decoder of JSONParser is used.
+    orjson = None
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSONParser decoding with orjson when it is installed. Like JSONParser it rejects NaN and infinities.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        body = stream.read() if stream is not None else b''
+        try:
+            if encoding.lower().replace('-', '') != 'utf8':
+                body = body.decode(encoding)
+            return orjson.loads(body)
+        except ValueError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+class NDJSONParser(BaseParser):
+    """
+    Newline delimited JSON: one object per line, parsed into a list. Blank lines are skipped.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        items = []
+        for number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line.decode(encoding)))
+            except ValueError as exc:
+                raise ParseError(f'NDJSON parse error on line {number} - {exc}')
+        return items
+
+
+def decode_lines(lines, encoding):
+    for number, line in enumerate(lines):
+        line = line.decode(encoding)
+        yield line.lstrip('\ufeff') if number == 0 else line
+
+
+def iter_csv_rows(lines, fields, encoding='utf-8'):
+    """
+    (line number, row, error) of every row of a CSV file with a header, read lazily from an iterable of byte
+    lines. A file without one of `fields` in its header raises ParseError before the first row. Reading stops
+    at a line that cannot be decoded or parsed, with an error for that line.
+    """
+    reader = csv.DictReader(decode_lines(lines, encoding))
+    try:
+        missing = [field for field in fields if field not in (reader.fieldnames or ())]
+        if missing:
+            raise ParseError(f'CSV header lacks the columns: {", ".join(missing)}.')
+        for row in reader:
+            yield reader.line_num, row, None
+    except (UnicodeDecodeError, csv.Error) as exc:
+        yield reader.line_num + 1, None, f'CSV parse error, the rest of the file is skipped - {exc}'
+
+
+def iter_ndjson_rows(lines, fields=None, encoding='utf-8'):
+    """
+    (line number, object, error) of every non-blank line of an NDJSON file, read lazily from an iterable
+    of byte lines. A line that is not a JSON object gets an error and reading goes on.
+    """
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line.decode(encoding))
+        except ValueError as exc:
+            yield number, None, f'NDJSON parse error - {exc}'
+            continue
+        if not isinstance(row, dict):
+            yield number, None, 'Expected a JSON object.'
+            continue
+        yield number, row, None
+
+
+ROW_READERS = {
+    'text/csv': iter_csv_rows,
+    NDJSONParser.media_type: iter_ndjson_rows,
+}
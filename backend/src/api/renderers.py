@@ -0,0 +1,69 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    # Optional, without it the stdlib encoder of JSONRenderer is used.
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer encoding with orjson when it is installed. Everything orjson has no native form for, and dates
+    and times, which it would render differently, goes through DRF's JSONEncoder: the output matches
+    JSONRenderer's, except that NaN and infinities become null.
+    """
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        options = self.options
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            options |= orjson.OPT_INDENT_2
+        ret = orjson.dumps(data, default=JSONEncoder().default, option=options)
+        # Escaped like JSONRenderer does, they end a line in JavaScript.
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+def flatten(item, prefix=''):
+    """
+    Nested objects of `item` merged into it under dotted keys: {'device': {'id': 1}} gives {'device.id': 1}.
+    """
+    flat = {}
+    for key, value in item.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        else:
+            flat[f'{prefix}{key}'] = value
+    return flat
+
+
+def compact(items):
+    rows = [flatten(item) for item in items]
+    columns = list(rows[0]) if rows else []
+    return {'columns': columns, 'rows': [[row.get(column) for column in columns] for row in rows]}
+
+
+class CompactJSONRenderer(FastJSONRenderer):
+    """
+    Objects as flat rows under a single list of column names, `?format=compact`. Nested objects become dotted
+    columns, lists stay values. A paginated page keeps its links with the rows under `results`, errors are
+    rendered as plain JSON.
+    """
+    media_type = 'application/vnd.tickets.compact+json'
+    format = 'compact'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None and not response.exception and isinstance(data, (list, dict)):
+            if isinstance(data, list):
+                data = compact(data)
+            elif isinstance(data.get('results'), list):
+                data = {**data, 'results': compact(data['results'])}
+            else:
+                data = compact([data])
+        return super().render(data, accepted_media_type, renderer_context)
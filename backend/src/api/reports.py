@@ -0,0 +1,152 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDay, TruncWeek, TruncMonth, TruncYear
+from rest_framework.exceptions import ValidationError
+from .models import Ticket, Device, Department, DevType, Category, WorkType, Position
+from .generations import get_key, get_key_generations, get_period_keys
+
+# Name of every dimension: its expression over Ticket, whether it joins a to-many relation and the tables
+# it reads besides tickets, whose generations are part of the cache key of a report.
+DIMENSIONS = OrderedDict((
+    ('year', (TruncYear('created'), False, ())),
+    ('month', (TruncMonth('created'), False, ())),
+    ('week', (TruncWeek('created'), False, ())),
+    ('day', (TruncDay('created'), False, ())),
+    ('department', (F('device__department__title'), False, (Device, Department))),
+    ('device_type', (F('device__type__title'), False, (Device, DevType))),
+    ('category', (F('category__title'), False, (Category,))),
+    ('work_type', (F('work_done__title'), True, (WorkType,))),
+    ('position', (F('expenditures__position__title'), True, (Position,))),
+))
+
+PERIODS = ('year', 'month', 'week', 'day')
+
+MEASURES = ('count', 'closed_count', 'expenditure_quantity')
+
+
+def parse_list(value, choices, name):
+    items = [item for item in (item.strip() for item in value.split(',')) if item]
+    unknown = [item for item in items if item not in choices]
+    if unknown:
+        raise ValidationError({name: [f'Unknown {name}: {", ".join(unknown)}. Expected: {", ".join(choices)}.']})
+    # Listed in the declaration order, so that every spelling of a report shares one cache entry.
+    return tuple(choice for choice in choices if choice in items)
+
+
+class TicketReport:
+    """
+    Tickets created within a range of dates, grouped by `dimensions` and aggregated into `measures` with one
+    GROUP BY query. Work types and positions join to-many relations, so tickets are counted distinct.
+    """
+
+    def __init__(self, query_params):
+        dt_format = '%Y-%m-%dT%H:%M:%S'
+        try:
+            self.date_from = datetime.strptime(query_params.get('date_gte', '').split('.')[0], dt_format).date()
+            self.date_to = datetime.strptime(query_params.get('date_lte', '').split('.')[0], dt_format).date()
+        except ValueError:
+            raise ValidationError(f'date_gte and date_lte are required, expected format: {dt_format}')
+
+        self.dimensions = parse_list(query_params.get('dimensions', ''), tuple(DIMENSIONS), 'dimensions')
+        self.measures = parse_list(query_params.get('measures', 'count'), MEASURES, 'measures')
+        if not self.measures:
+            raise ValidationError({'measures': ['At least one measure is required.']})
+        if len([dimension for dimension in self.dimensions if dimension in PERIODS]) > 1:
+            raise ValidationError({'dimensions': [f'At most one of: {", ".join(PERIODS)}.']})
+
+        self.filter_params = {}
+        self.models = {model for name in self.dimensions for model in DIMENSIONS[name][2]}
+        department = query_params.get('department', '')
+        if department and department != 'Любая':
+            self.filter_params['device__department__title'] = department
+            self.models.update((Device, Department))
+        category = query_params.get('category', '')
+        if category:
+            self.filter_params['category__title'] = category
+            self.models.add(Category)
+        status = query_params.get('status', '')
+        if status in ('1', '0'):
+            self.filter_params['status'] = status == '1'
+
+    def get_key(self):
+        return (self.date_from, self.date_to, self.dimensions, self.measures,
+                tuple(sorted(self.filter_params.items())))
+
+    def get_generation_keys(self):
+        return get_period_keys(self.date_from, self.date_to) + sorted(get_key(model) for model in self.models)
+
+    def get_items(self):
+        fan_out = 'expenditure_quantity' in self.measures or any(DIMENSIONS[name][1] for name in self.dimensions)
+        aggregates = {
+            'count': Count('id', distinct=fan_out),
+            'closed_count': Count('id', filter=Q(status=False), distinct=fan_out),
+            'expenditure_quantity': Sum('expenditures__quantity'),
+        }
+        measures = {f'measure_{name}': aggregates[name] for name in self.measures}
+        queryset = Ticket.objects.filter(created__range=[self.date_from, self.date_to], **self.filter_params)
+        if not self.dimensions:
+            return [queryset.aggregate(**measures)]
+
+        # Annotations may not shadow the fields of Ticket, `category` among them.
+        columns = {f'dimension_{name}': DIMENSIONS[name][0] for name in self.dimensions}
+        return queryset.annotate(**columns).values(*columns).order_by(*columns).annotate(**measures)
+
+    def get_rows(self):
+        rows = []
+        for item in self.get_items():
+            row = {}
+            for name in self.dimensions:
+                value = item[f'dimension_{name}']
+                if name in PERIODS and value is not None:
+                    value = value.date().isoformat() if isinstance(value, datetime) else value.isoformat()
+                row[name] = value
+            for name in self.measures:
+                row[name] = item[f'measure_{name}'] or 0
+            rows.append(row)
+        return rows
+
+    def get_data(self):
+        return {
+            'dimensions': list(self.dimensions),
+            'measures': list(self.measures),
+            'rows': REPORT_CACHE.get(self),
+        }
+
+
+class ReportCache:
+    """
+    Per-process LRU of report rows by normalized parameters. Every lookup reads the generations of the months
+    the report covers and of the other tables it reads, in one query: a change of a ticket, its work types or
+    expenditures only invalidates the reports over its month.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def clear(self):
+        with self.lock:
+            self.entries = OrderedDict()
+
+    def get(self, report):
+        key = report.get_key()
+        generations = get_key_generations(report.get_generation_keys())
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == generations:
+                self.entries.move_to_end(key)
+                return entry[1]
+
+        rows = report.get_rows()
+        with self.lock:
+            self.entries[key] = (generations, rows)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return rows
+
+
+REPORT_CACHE = ReportCache()
@@ -0,0 +1,196 @@
+from collections import defaultdict
+from datetime import timedelta
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Count, F, Q, DEFERRED
+from .models import Ticket, Device, TicketDailyCount
+
+
+# Ticket columns the daily counters and the ticket reports depend on.
+STATE_FIELDS = ('created', 'device_id', 'category_id', 'status')
+
+
+def get_state(ticket):
+    return {name: getattr(ticket, name) for name in STATE_FIELDS}
+
+
+def get_saved_state(ticket):
+    """
+    State of the ticket row as it is in the database right now, None for a ticket that is not saved yet.
+    """
+    if ticket._state.adding or ticket.pk is None:
+        return None
+    loaded = getattr(ticket, '_loaded_values', {})
+    if all(name in loaded and loaded[name] is not DEFERRED for name in STATE_FIELDS):
+        return {name: loaded[name] for name in STATE_FIELDS}
+    return Ticket.objects.filter(pk=ticket.pk).values(*STATE_FIELDS).first()
+
+
+def remember_saved_state(ticket):
+    ticket._loaded_values = {field.attname: getattr(ticket, field.attname) for field in Ticket._meta.concrete_fields}
+
+
+class CounterDelta:
+    """
+    Accumulates +1/-1 changes per (day, department, category) and writes them with one UPDATE per touched row.
+    """
+
+    def __init__(self):
+        self.states = []
+        self.departments = {}
+
+    def add(self, state, sign, department_id=None):
+        if state is None or state['created'] is None:
+            return
+        if department_id is not None:
+            self.departments[state['device_id']] = department_id
+        self.states.append((state, sign))
+
+    def get_deltas(self):
+        by_device = defaultdict(lambda: [0, 0])
+        for state, sign in self.states:
+            by_device[(state['created'], state['device_id'], state['category_id'])][0 if state['status'] else 1] += sign
+
+        missing = {device_id for (_, device_id, _), delta in by_device.items() if any(delta)} - set(self.departments)
+        if missing:
+            self.departments.update(Device.objects.filter(pk__in=missing).values_list('id', 'department_id'))
+
+        deltas = defaultdict(lambda: [0, 0])
+        for (day, device_id, category_id), (open_delta, closed_delta) in by_device.items():
+            if open_delta or closed_delta:
+                delta = deltas[(day, self.departments[device_id], category_id)]
+                delta[0] += open_delta
+                delta[1] += closed_delta
+        return {key: delta for key, delta in deltas.items() if any(delta)}
+
+    def apply(self):
+        apply_deltas(self.get_deltas())
+
+
+def apply_deltas(deltas):
+    """
+    Adds [open, closed] deltas by (day, department, category) to the counters.
+    """
+    if not deltas:
+        return
+    with transaction.atomic():
+        for (day, department_id, category_id), (open_delta, closed_delta) in deltas.items():
+            bump(day, department_id, category_id, open_delta, closed_delta)
+
+
+def bump(day, department_id, category_id, open_delta, closed_delta):
+    counters = TicketDailyCount.objects.filter(day=day, department_id=department_id, category_id=category_id)
+    changes = {
+        'open_count': F('open_count') + open_delta,
+        'closed_count': F('closed_count') + closed_delta,
+    }
+    if counters.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            TicketDailyCount.objects.create(day=day, department_id=department_id, category_id=category_id,
+                                            open_count=open_delta, closed_count=closed_delta)
+    except IntegrityError:
+        # Created concurrently by another request.
+        counters.update(**changes)
+
+
+def cached_department(ticket):
+    if Ticket.device.is_cached(ticket) and ticket.device.pk == ticket.device_id:
+        return ticket.device.department_id
+    return None
+
+
+def record_ticket_saved(ticket, old_state):
+    delta = CounterDelta()
+    delta.add(old_state, -1)
+    delta.add(get_state(ticket), 1, cached_department(ticket))
+    delta.apply()
+    remember_saved_state(ticket)
+
+
+def record_ticket_deleted(old_state):
+    delta = CounterDelta()
+    delta.add(old_state, -1)
+    delta.apply()
+
+
+def record_tickets_created(tickets):
+    delta = CounterDelta()
+    for ticket in tickets:
+        delta.add(get_state(ticket), 1, cached_department(ticket))
+    delta.apply()
+
+
+def record_devices_moved(departments):
+    """
+    Moves the counts of the tickets of devices that changed department, `departments` maps device ids to their
+    (old, new) department ids. Call after the devices are saved, in the same transaction.
+    """
+    moved = {device_id: pair for device_id, pair in departments.items() if pair[0] != pair[1]}
+    if not moved:
+        return
+    rows = Ticket.objects.filter(device__in=moved, created__isnull=False)\
+        .values('created', 'device', 'category')\
+        .annotate(open_count=Count('id', filter=Q(status=True)), closed_count=Count('id', filter=Q(status=False)))\
+        .order_by()
+    deltas = defaultdict(lambda: [0, 0])
+    for row in rows:
+        for department_id, sign in zip(moved[row['device']], (-1, 1)):
+            delta = deltas[(row['created'], department_id, row['category'])]
+            delta[0] += sign * row['open_count']
+            delta[1] += sign * row['closed_count']
+    apply_deltas({key: delta for key, delta in deltas.items() if any(delta)})
+
+
+def rebuild_daily_counts(batch_size=1000, using='default'):
+    rows = Ticket.objects.using(using).filter(created__isnull=False)\
+        .values('created', 'device__department', 'category')\
+        .annotate(open_count=Count('id', filter=Q(status=True)), closed_count=Count('id', filter=Q(status=False)))\
+        .order_by()
+    with transaction.atomic(using=using):
+        TicketDailyCount.objects.using(using).all().delete()
+        counters = TicketDailyCount.objects.using(using).bulk_create(
+            (TicketDailyCount(day=row['created'], department_id=row['device__department'],
+                              category_id=row['category'], open_count=row['open_count'],
+                              closed_count=row['closed_count']) for row in rows.iterator()),
+            batch_size=batch_size,
+        )
+    return len(counters)
+
+
+def install_daily_counts(using='default', **kwargs):
+    """
+    Builds the daily counters of the tickets there are when the counter table is new and empty, the signals
+    only count the tickets saved from then on. Runs on post_migrate.
+    """
+    tables = set(connections[using].introspection.table_names())
+    if not {Ticket._meta.db_table, TicketDailyCount._meta.db_table} <= tables:
+        return
+    if not TicketDailyCount.objects.using(using).exists() and Ticket.objects.using(using).exists():
+        rebuild_daily_counts(using=using)
+
+
+GRANULARITIES = ('day', 'week', 'month')
+
+
+def bucket_start(day, granularity):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(start, granularity):
+    if granularity == 'week':
+        return start + timedelta(days=7)
+    if granularity == 'month':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def iter_buckets(date_from, date_to, granularity):
+    start = bucket_start(date_from, granularity)
+    while start <= date_to:
+        yield start
+        start = next_bucket(start, granularity)
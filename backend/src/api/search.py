@@ -0,0 +1,208 @@
+import re
+from django.db import connections
+from django.db.models import Q, Value, FloatField
+from .models import Ticket, Device, Position
+
+
+# Text columns served by the search index, one per model.
+SEARCH_FIELDS = {
+    Ticket: 'description',
+    Device: 'title',
+    Position: 'title',
+}
+
+WORD_RE = re.compile(r'\w+')
+
+
+def get_words(text):
+    return WORD_RE.findall(text or '')
+
+
+class LikeSearchBackend:
+    """
+    Fallback for databases without a text index: every word must occur in the column, no ranking.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def install(self, models=SEARCH_FIELDS):
+        pass
+
+    def rebuild(self, model, chunk_size=1000):
+        return model._default_manager.count()
+
+    def search(self, queryset, text):
+        field = SEARCH_FIELDS[queryset.model]
+        condition = Q()
+        for word in get_words(text):
+            condition &= Q(**{f'{field}__icontains': word})
+        return queryset.filter(condition).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    def prefix_lookup(self, lookup, prefix):
+        return {f'{lookup}__startswith': prefix}
+
+
+class SqliteSearchBackend(LikeSearchBackend):
+    """
+    FTS5 external-content tables kept current by triggers on insert, update and delete of the source rows,
+    so bulk_create() and QuerySet.update() keep the index in sync just like Model.save() and delete().
+    """
+    tokenize = 'unicode61 remove_diacritics 2'
+    prefix = '2 3'
+
+    @staticmethod
+    def index_table(model):
+        return f'{model._meta.db_table}_{SEARCH_FIELDS[model]}_fts'
+
+    def install(self, models=SEARCH_FIELDS):
+        with self.connection.cursor() as cursor:
+            for model in models:
+                table = model._meta.db_table
+                column = model._meta.get_field(SEARCH_FIELDS[model]).column
+                index = self.index_table(model)
+                cursor.execute('SELECT 1 FROM sqlite_master WHERE type = \'table\' AND name = %s', [index])
+                created = cursor.fetchone() is None
+                cursor.execute(
+                    f'CREATE VIRTUAL TABLE IF NOT EXISTS "{index}" USING fts5("{column}", content="{table}", '
+                    f'content_rowid="id", tokenize="{self.tokenize}", prefix="{self.prefix}")'
+                )
+                cursor.execute(
+                    f'CREATE TRIGGER IF NOT EXISTS "{index}_ai" AFTER INSERT ON "{table}" BEGIN '
+                    f'INSERT INTO "{index}"(rowid, "{column}") VALUES (new.id, new."{column}"); END'
+                )
+                cursor.execute(
+                    f'CREATE TRIGGER IF NOT EXISTS "{index}_ad" AFTER DELETE ON "{table}" BEGIN '
+                    f'INSERT INTO "{index}"("{index}", rowid, "{column}") VALUES (\'delete\', old.id, old."{column}"); '
+                    f'END'
+                )
+                cursor.execute(
+                    f'CREATE TRIGGER IF NOT EXISTS "{index}_au" AFTER UPDATE OF "{column}" ON "{table}" '
+                    f'WHEN old."{column}" IS NOT new."{column}" BEGIN '
+                    f'INSERT INTO "{index}"("{index}", rowid, "{column}") VALUES (\'delete\', old.id, old."{column}"); '
+                    f'INSERT INTO "{index}"(rowid, "{column}") VALUES (new.id, new."{column}"); END'
+                )
+                if created:
+                    # Rows from before the index, the triggers only see changes made from now on.
+                    cursor.execute(f'INSERT INTO "{index}"("{index}") VALUES (\'rebuild\')')
+
+    def rebuild(self, model, chunk_size=1000):
+        table = model._meta.db_table
+        column = model._meta.get_field(SEARCH_FIELDS[model]).column
+        index = self.index_table(model)
+        indexed = 0
+        last_id = 0
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'INSERT INTO "{index}"("{index}") VALUES (\'delete-all\')')
+            while True:
+                cursor.execute(
+                    f'SELECT id, "{column}" FROM "{table}" WHERE id > %s ORDER BY id LIMIT %s', [last_id, chunk_size]
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                cursor.executemany(f'INSERT INTO "{index}"(rowid, "{column}") VALUES (%s, %s)', rows)
+                indexed += len(rows)
+                last_id = rows[-1][0]
+            cursor.execute(f'INSERT INTO "{index}"("{index}") VALUES (\'optimize\')')
+        return indexed
+
+    def search(self, queryset, text):
+        words = get_words(text)
+        if not words:
+            return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+        model = queryset.model
+        index = self.index_table(model)
+        match = ' '.join('"{}"*'.format(word) for word in words)
+        return queryset.extra(
+            select={'search_rank': f'-"{index}".rank'},
+            tables=[index],
+            where=[f'"{index}".rowid = "{model._meta.db_table}"."id"', f'"{index}" MATCH %s'],
+            params=[match],
+        )
+
+    def prefix_lookup(self, lookup, prefix):
+        # LIKE cannot use the column index, a range on the BINARY collation can. LIKE folds the case of ASCII
+        # letters only, so the range matches the same rows as long as the prefix has none.
+        if any(char.isascii() and char.isalpha() for char in prefix):
+            return super().prefix_lookup(lookup, prefix)
+        return {f'{lookup}__gte': prefix, f'{lookup}__lt': prefix + '\U0010ffff'}
+
+
+class PostgresSearchBackend(LikeSearchBackend):
+    """
+    pg_trgm GIN indexes: substring search is served by the index and ranked by word similarity.
+    """
+
+    @staticmethod
+    def index_name(model):
+        return f'{model._meta.db_table}_{SEARCH_FIELDS[model]}_trgm'
+
+    def install(self, models=SEARCH_FIELDS):
+        with self.connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            for model in models:
+                column = model._meta.get_field(SEARCH_FIELDS[model]).column
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS "{self.index_name(model)}" ON "{model._meta.db_table}" '
+                    f'USING gin ("{column}" gin_trgm_ops)'
+                )
+
+    def rebuild(self, model, chunk_size=1000):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'REINDEX INDEX "{self.index_name(model)}"')
+        return model._default_manager.count()
+
+    def search(self, queryset, text):
+        words = get_words(text)
+        if not words:
+            return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+        model = queryset.model
+        column = f'"{model._meta.db_table}"."{model._meta.get_field(SEARCH_FIELDS[model]).column}"'
+        return queryset.extra(
+            select={'search_rank': f'word_similarity(%s, {column})'},
+            select_params=[' '.join(words)],
+            where=[f'{column} ILIKE %s' for _ in words],
+            params=['%{}%'.format(self.connection.ops.prep_for_like_query(word)) for word in words],
+        )
+
+
+def sqlite_has_fts5(connection):
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return 'ENABLE_FTS5' in {row[0] for row in cursor.fetchall()}
+
+
+_fts5_support = {}
+
+
+def get_backend(using='default'):
+    conn = connections[using]
+    if conn.vendor == 'sqlite':
+        if using not in _fts5_support:
+            _fts5_support[using] = sqlite_has_fts5(conn)
+        if _fts5_support[using]:
+            return SqliteSearchBackend(conn)
+    elif conn.vendor == 'postgresql':
+        return PostgresSearchBackend(conn)
+    return LikeSearchBackend(conn)
+
+
+def search(queryset, text):
+    """
+    Filters the queryset down to rows whose search field matches every word of the text (as a word prefix
+    on SQLite, as a substring on PostgreSQL), annotated with `search_rank` and ordered by it, best first.
+    """
+    return get_backend(queryset.db).search(queryset, text).order_by('-search_rank')
+
+
+def prefix_filter(lookup, prefix, using='default'):
+    return get_backend(using).prefix_lookup(lookup, prefix)
+
+
+def install_search_indexes(using='default', **kwargs):
+    # Tables of the app only exist after `migrate --run-syncdb`, a plain migrate must not fail on them.
+    tables = set(connections[using].introspection.table_names())
+    get_backend(using).install([model for model in SEARCH_FIELDS if model._meta.db_table in tables])
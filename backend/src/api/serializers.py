@@ -1,6 +1,100 @@
+from contextlib import contextmanager
+from functools import partial
+from django.core.exceptions import FieldDoesNotExist, ObjectDoesNotExist
+from django.db import transaction
+from django.utils.encoding import smart_str
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Ticket, Device, DevType, Department, WorkType, Priority, Category, Position, Expenditure
+from .models import Ticket, Device, DevType, Department, WorkType, Priority, Category, Position, Expenditure, \
+    OutOfStock
+from .lookups import get_lookup_cache
+
+
+@contextmanager
+def stock_errors(field):
+    """
+    Runs the block in a transaction and turns running out of stock into a validation error on `field`,
+    nothing written by the block is kept then.
+    """
+    try:
+        with transaction.atomic():
+            yield
+    except OutOfStock as exc:
+        title = Position.objects.filter(pk=exc.position_id).values_list('title', flat=True).first()
+        raise serializers.ValidationError({field: [f'Not enough "{title}" in stock.']})
+
+
+class CachedSlugRelatedField(serializers.SlugRelatedField):
+    """
+    SlugRelatedField for lookup tables: slugs are resolved and titles rendered from the process-wide lookup
+    cache, so neither reading nor writing a relation costs a query.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = get_lookup_cache(self.queryset.model)
+
+    def get_attribute(self, instance):
+        # Reads the foreign key column instead of the related object, which would cost a query unless joined.
+        if len(self.source_attrs) == 1:
+            try:
+                field = instance._meta.get_field(self.source_attrs[0])
+            except FieldDoesNotExist:
+                field = None
+            if field is not None and field.many_to_one:
+                pk = getattr(instance, field.attname)
+                return None if pk is None else self.cache.get_by_pk(pk)
+        return super().get_attribute(instance)
+
+    def to_internal_value(self, data):
+        try:
+            return self.cache.get(data)
+        except ObjectDoesNotExist:
+            self.fail('does_not_exist', slug_name=self.slug_field, value=smart_str(data))
+        except (TypeError, ValueError):
+            self.fail('invalid')
+
+
+class SparseFieldsMixin:
+    """
+    Serializer whose fields can be narrowed down to a `fieldset` tree (see api.fieldsets.parse_fieldset()),
+    nested serializers with this mixin included. Once narrowed or given `expand`, the relations in
+    `collapsed_fields` are rendered by a lighter field, usually their ids, unless listed in `expand` or narrowed
+    themselves.
+    """
+    collapsed_fields = {}
+
+    def __init__(self, *args, fieldset=None, expand=None, **kwargs):
+        self.fieldset = fieldset
+        self.expand = expand
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.fieldset is None and self.expand is None:
+            return fields
+
+        fieldset = self.fieldset or {name: {} for name in fields}
+        expand = self.expand or set()
+        for param, names in (('fields', fieldset), ('expand', expand)):
+            unknown = [name for name in names if name not in fields]
+            if unknown:
+                raise serializers.ValidationError({param: [f'Unknown fields: {", ".join(unknown)}. '
+                                                           f'Expected: {", ".join(fields)}.']})
+
+        selected = {}
+        for name, field in fields.items():
+            if name not in fieldset:
+                continue
+            nested = field.child if isinstance(field, serializers.ListSerializer) else field
+            if fieldset[name] and not isinstance(nested, SparseFieldsMixin):
+                raise serializers.ValidationError({'fields': [f'{name} has no fields of its own.']})
+            if name in self.collapsed_fields and name not in expand and not fieldset[name]:
+                field = self.collapsed_fields[name]()
+            elif fieldset[name]:
+                nested.fieldset = fieldset[name]
+            selected[name] = field
+        return selected
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -17,9 +111,9 @@ class WorkTypeSerializer(serializers.ModelSerializer):
         fields = ['id', 'title']
 
 
-class DeviceSerializer(serializers.ModelSerializer):
-    type = serializers.SlugRelatedField(slug_field='title', queryset=DevType.objects)
-    department = serializers.SlugRelatedField(slug_field='title', queryset=Department.objects)
+class DeviceSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    type = CachedSlugRelatedField(slug_field='title', queryset=DevType.objects)
+    department = CachedSlugRelatedField(slug_field='title', queryset=Department.objects)
 
     class Meta:
         model = Device
@@ -37,28 +131,42 @@ class PrioritySerializer(serializers.ModelSerializer):
         fields = ['number', 'title']
 
 
-class PositionSerializer(serializers.ModelSerializer):
+class PositionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Position
         fields = ['id', 'title', 'quantity']
 
 
-class ExpenditureSerializer(serializers.ModelSerializer):
+class ExpenditureSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     position = serializers.SlugRelatedField(slug_field='title', queryset=Position.objects)
 
     class Meta:
         model = Expenditure
         fields = ['id', 'position', 'quantity']
 
+    def create(self, validated_data):
+        with stock_errors('quantity'):
+            return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        with stock_errors('quantity'):
+            return super().update(instance, validated_data)
 
-class TicketSerializer(serializers.ModelSerializer):
+
+class TicketSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     device = DeviceSerializer()
     owner = serializers.SlugRelatedField(slug_field='username', queryset=User.objects)
-    priority = serializers.SlugRelatedField(slug_field='title', queryset=Priority.objects)
-    category = serializers.SlugRelatedField(slug_field='title', queryset=Category.objects)
-    work_done = serializers.SlugRelatedField(slug_field='title', many=True, queryset=WorkType.objects)
+    priority = CachedSlugRelatedField(slug_field='title', queryset=Priority.objects)
+    category = CachedSlugRelatedField(slug_field='title', queryset=Category.objects)
+    work_done = CachedSlugRelatedField(slug_field='title', many=True, queryset=WorkType.objects)
     expenditures = ExpenditureSerializer(many=True)
 
+    # Ids in a sparse representation, unless expanded.
+    collapsed_fields = {
+        'device': partial(serializers.PrimaryKeyRelatedField, read_only=True),
+        'expenditures': partial(serializers.PrimaryKeyRelatedField, many=True, read_only=True),
+    }
+
     class Meta:
         model = Ticket
         extra_kwargs = {'device': {'required': False}}
@@ -66,65 +174,140 @@ class TicketSerializer(serializers.ModelSerializer):
                   'work_done', 'priority', 'expenditures', 'category', 'status']
 
     def update(self, instance, validated_data):
-
-        # Ugly, but easy way to prevent unattended expenditure instances. it is better to use sets for defining
-        # which instance needs deletion/creation.
-        for exp in instance.expenditures.all():
-            exp.delete()
+        # Only the columns and rows that actually change are written, a PATCH of scalar fields is one UPDATE.
+        changed = []
 
         # Regular data
-        instance.created = validated_data.get('created', instance.created)
-        instance.closed = validated_data.get('closed', instance.closed)
-        instance.description = validated_data.get('description', instance.description)
-        instance.status = validated_data.get('status', instance.status)
-
-        # Nested objects
-        validated_data = self.validated_data_to_device_instance(validated_data)
-        validated_data = self.validated_data_to_expenditure_instances(validated_data)
+        for field in ('created', 'closed', 'description', 'status'):
+            if field in validated_data and getattr(instance, field) != validated_data[field]:
+                setattr(instance, field, validated_data[field])
+                changed.append(field)
+
+        # Related objects
+        for field in ('owner', 'priority', 'category'):
+            if field in validated_data:
+                value = validated_data[field]
+                if getattr(instance, f'{field}_id') != (value.pk if value is not None else None):
+                    setattr(instance, field, value)
+                    changed.append(field)
+
+        if 'device' in validated_data and instance.device.inv_num != validated_data['device']['inv_num']:
+            instance.device = self.get_device(validated_data['device']['inv_num'])
+            changed.append('device')
+
+        with stock_errors('expenditures'):
+            if changed:
+                instance.save(update_fields=changed)
+
+            # Nested objects
+            if 'expenditures' in validated_data:
+                self.update_expenditures(instance, validated_data['expenditures'])
+            if 'work_done' in validated_data:
+                self.update_work_done(instance, validated_data['work_done'])
 
-        instance.device = validated_data.get('device', instance.device)
-        instance.expenditures.set(validated_data.get('expenditures', instance.expenditures))
-        instance.owner = validated_data.get('owner', instance.owner)
-        instance.priority = validated_data.get('priority', instance.priority)
-        instance.work_done.set(validated_data.get('work_done', instance.work_done))
-        instance.category = validated_data.get('category', instance.category)
+        return instance
 
-        instance.save()
+    @staticmethod
+    def update_expenditures(instance, expenditures_data):
+        # Expenditures with the same position and quantity are kept, a changed quantity is saved in place
+        # and the rest is deleted or created, the model moves the stock by the difference.
+        stale = list(instance.expenditures.all())
+        missing = []
+        for exp_data in expenditures_data:
+            for expenditure in stale:
+                if expenditure.position_id == exp_data['position'].pk and expenditure.quantity == exp_data['quantity']:
+                    stale.remove(expenditure)
+                    break
+            else:
+                missing.append(exp_data)
+
+        changed = []
+        for exp_data in missing[:]:
+            for expenditure in stale:
+                if expenditure.position_id == exp_data['position'].pk:
+                    stale.remove(expenditure)
+                    missing.remove(exp_data)
+                    expenditure.quantity = exp_data['quantity']
+                    changed.append(expenditure)
+                    break
+
+        for expenditure in stale:
+            expenditure.delete()
+        for expenditure in changed:
+            expenditure.save(update_fields=['quantity'])
+        for exp_data in missing:
+            Expenditure(ticket=instance, **exp_data).save()
 
-        return instance
+    @staticmethod
+    def update_work_done(instance, work_done):
+        current = {work_type.pk for work_type in instance.work_done.all()}
+        wanted = {work_type.pk for work_type in work_done}
+        if wanted - current:
+            instance.work_done.add(*(wanted - current))
+        if current - wanted:
+            instance.work_done.remove(*(current - wanted))
 
     def create(self, validated_data):
-
         validated_data = self.validated_data_to_device_instance(validated_data)
-        validated_data = self.validated_data_to_expenditure_instances(validated_data)
-
         expenditures = validated_data.pop('expenditures')
         work_done = validated_data.pop('work_done')
 
-        instance = Ticket(**validated_data)
-        instance.save()
+        with stock_errors('expenditures'):
+            instance = Ticket(**validated_data)
+            instance.save()
 
-        instance.expenditures.set(expenditures)
-        instance.work_done.set(work_done)
+            for exp_data in expenditures:
+                Expenditure(ticket=instance, **exp_data).save()
+            instance.work_done.set(work_done)
         return instance
 
     @staticmethod
-    def validated_data_to_device_instance(data):
-        device = Device.objects.get(inv_num=data['device']['inv_num'])
-        data['device'] = device
+    def get_device(inv_num):
+        try:
+            return Device.objects.get(inv_num=inv_num)
+        except Device.DoesNotExist:
+            raise serializers.ValidationError({'device': [f'Object with inv_num={inv_num} does not exist.']})
+
+    def validated_data_to_device_instance(self, data):
+        data['device'] = self.get_device(data['device']['inv_num'])
         return data
 
-    @staticmethod
-    def validated_data_to_expenditure_instances(data):
-        expenditures = []
-
-        for exp_data in data['expenditures']:
-            serializer = ExpenditureSerializer(data=exp_data)
-            serializer.is_valid()
-            expenditure = serializer.save()
-            expenditures.append(expenditure)
-        data['expenditures'] = expenditures
-        return data
+
+class BulkDeviceSerializer(serializers.Serializer):
+    inv_num = serializers.CharField(max_length=30)
+
+
+class DeviceImportSerializer(serializers.Serializer):
+    """
+    One row of a device import. Department and type are kept as titles here and resolved for a batch of rows
+    at once by api.bulk.
+    """
+    inv_num = serializers.CharField(max_length=30)
+    title = serializers.CharField(max_length=50)
+    department = serializers.CharField(max_length=200)
+    type = serializers.CharField(max_length=50)
+
+
+class BulkExpenditureSerializer(serializers.Serializer):
+    position = serializers.CharField(max_length=100)
+    quantity = serializers.IntegerField(min_value=0)
+
+
+class BulkTicketSerializer(serializers.Serializer):
+    """
+    One item of a bulk ticket import, in the TicketSerializer format. Related objects are kept as slugs here
+    and resolved for the whole batch at once by api.bulk.
+    """
+    created = serializers.DateField(required=False, allow_null=True)
+    closed = serializers.DateField(required=False, allow_null=True)
+    owner = serializers.CharField(max_length=150)
+    description = serializers.CharField()
+    device = BulkDeviceSerializer()
+    work_done = serializers.ListField(child=serializers.CharField(max_length=200), required=False)
+    priority = serializers.CharField(max_length=100, required=False, allow_null=True)
+    expenditures = BulkExpenditureSerializer(many=True, required=False)
+    category = serializers.CharField(max_length=100)
+    status = serializers.BooleanField(required=False, default=True)
 
 
 class DevTypeSerializer(serializers.ModelSerializer):
@@ -0,0 +1,190 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.contrib.auth.models import User
+from django.dispatch import receiver
+from dj_rest_auth.models import TokenModel
+from .models import Ticket, Device, Position, Expenditure, StockMovement
+from .lookups import LOOKUP_CACHES
+from .autocomplete import DEVICE_AUTOCOMPLETE
+from .cube import TICKET_CUBE
+from .authentication import TOKEN_CACHE
+from .metrics import install_query_counter
+from .changes import RENDERED_TITLES, touch, touch_renamed, record_deleted
+from .generations import TRACKED_MODELS, bump_generation, bump_periods
+from .rollups import get_state, get_saved_state, record_ticket_saved, record_ticket_deleted, record_devices_moved
+
+
+@receiver(pre_save, sender=Ticket)
+def ticket_pre_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        instance._saved_state = get_saved_state(instance)
+
+
+@receiver(post_save, sender=Ticket)
+def ticket_post_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        saved_state = instance.__dict__.pop('_saved_state', None)
+        state = get_state(instance)
+        record_ticket_saved(instance, saved_state)
+        if state != saved_state:
+            bump_periods([state['created'], saved_state and saved_state['created']])
+        TICKET_CUBE.ticket_changed(instance.pk)
+
+
+@receiver(pre_delete, sender=Ticket)
+def ticket_pre_delete(sender, instance, **kwargs):
+    instance._saved_state = get_saved_state(instance)
+
+
+@receiver(post_delete, sender=Ticket)
+def ticket_post_delete(sender, instance, **kwargs):
+    saved_state = instance.__dict__.pop('_saved_state', None)
+    record_ticket_deleted(saved_state)
+    bump_periods([saved_state and saved_state['created']])
+    TICKET_CUBE.ticket_changed(instance.pk)
+
+
+@receiver(post_delete, sender=Expenditure)
+def expenditure_post_delete(sender, instance, **kwargs):
+    Position.change_stock(instance.position_id, instance.quantity)
+    StockMovement.record({instance.position_id: instance.quantity}, instance.pk)
+
+
+@receiver(post_save, sender=Expenditure)
+@receiver(post_delete, sender=Expenditure)
+def stock_changed(sender, raw=False, **kwargs):
+    # Stock is changed with QuerySet.update(), which does not send signals for Position itself.
+    if not raw:
+        bump_generation(Position)
+
+
+@receiver(post_save, sender=Expenditure)
+@receiver(post_delete, sender=Expenditure)
+def expenditure_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if Expenditure.ticket.is_cached(instance) and instance.ticket.pk == instance.ticket_id:
+        bump_periods([instance.ticket.created])
+    else:
+        bump_periods(Ticket.objects.filter(pk=instance.ticket_id).values_list('created', flat=True))
+
+
+@receiver(post_save, sender=Expenditure)
+@receiver(post_delete, sender=Expenditure)
+def ticket_expenditures_changed(sender, instance, raw=False, **kwargs):
+    # Expenditures are rendered with their ticket, the change feed sends it again.
+    if not raw:
+        touch(Ticket, [instance.ticket_id])
+
+
+@receiver(post_delete, sender=Ticket)
+@receiver(post_delete, sender=Device)
+@receiver(post_delete, sender=Position)
+def change_tracked_deleted(sender, instance, **kwargs):
+    record_deleted(instance)
+
+
+@receiver(pre_save, sender=Device)
+def device_pre_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance._state.adding:
+        return
+    if update_fields is not None and not {'department', 'department_id'} & update_fields:
+        return
+    instance._saved_department_id = Device.objects.filter(pk=instance.pk).values_list('department', flat=True).first()
+
+
+@receiver(post_save, sender=Device)
+def device_post_save(sender, instance, raw=False, created=False, **kwargs):
+    if not raw:
+        if not created:
+            # Rendered with its tickets, the change feed sends them again.
+            touch(Ticket, instance.tickets.values_list('pk', flat=True))
+        # The daily counters of its tickets are kept by the department of the device.
+        saved_department_id = instance.__dict__.pop('_saved_department_id', None)
+        if saved_department_id is not None:
+            record_devices_moved({instance.pk: (saved_department_id, instance.department_id)})
+        DEVICE_AUTOCOMPLETE.device_saved(instance)
+        TICKET_CUBE.device_changed(instance.pk)
+
+
+@receiver(post_delete, sender=Device)
+def device_post_delete(sender, instance, **kwargs):
+    DEVICE_AUTOCOMPLETE.device_deleted(instance.pk)
+
+
+@receiver(post_save, sender=TokenModel)
+@receiver(post_delete, sender=TokenModel)
+def token_changed(sender, instance, **kwargs):
+    # Deleted on logout by dj_rest_auth. The generation revokes it in the caches of other processes.
+    TOKEN_CACHE.revoke(instance.key)
+    bump_generation(TokenModel)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # Deactivated, or any other change of the user that requests read. Logins only stamp last_login, other
+    # processes keep their tokens.
+    TOKEN_CACHE.revoke_user(instance.pk)
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        bump_generation(TokenModel)
+
+
+def lookup_changed(sender, **kwargs):
+    LOOKUP_CACHES[sender].clear()
+
+
+for model in LOOKUP_CACHES:
+    post_save.connect(lookup_changed, sender=model, dispatch_uid=f'lookup_changed_save_{model._meta.label_lower}')
+    post_delete.connect(lookup_changed, sender=model, dispatch_uid=f'lookup_changed_delete_{model._meta.label_lower}')
+
+
+def rendered_title_pre_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    field = RENDERED_TITLES[sender][0]
+    if raw or instance._state.adding or (update_fields is not None and field not in update_fields):
+        return
+    instance._saved_title = sender._default_manager.filter(pk=instance.pk).values_list(field, flat=True).first()
+
+
+def rendered_title_post_save(sender, instance, raw=False, **kwargs):
+    saved_title = instance.__dict__.pop('_saved_title', None)
+    if not raw and saved_title is not None and saved_title != getattr(instance, RENDERED_TITLES[sender][0]):
+        touch_renamed(sender, instance.pk)
+
+
+for model in RENDERED_TITLES:
+    label = model._meta.label_lower
+    pre_save.connect(rendered_title_pre_save, sender=model, dispatch_uid=f'rendered_title_pre_save_{label}')
+    post_save.connect(rendered_title_post_save, sender=model, dispatch_uid=f'rendered_title_post_save_{label}')
+
+
+def table_changed(sender, raw=False, **kwargs):
+    if not raw:
+        bump_generation(sender)
+
+
+def work_done_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_generation(Ticket)
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        touch(Ticket, [instance.pk])
+    elif reverse and action in ('post_add', 'post_remove'):
+        touch(Ticket, pk_set)
+    elif reverse and action == 'pre_clear':
+        touch(Ticket, instance.tickets.values_list('pk', flat=True))
+    # Changed from the side of a work type, `instance` is the work type and `pk_set` holds ticket ids.
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        bump_periods([instance.created])
+    elif reverse and action in ('post_add', 'post_remove'):
+        bump_periods(Ticket.objects.filter(pk__in=pk_set).values_list('created', flat=True))
+    elif reverse and action == 'pre_clear':
+        bump_periods(instance.tickets.values_list('created', flat=True))
+
+
+for model in TRACKED_MODELS:
+    post_save.connect(table_changed, sender=model, dispatch_uid=f'table_changed_save_{model._meta.label_lower}')
+    post_delete.connect(table_changed, sender=model, dispatch_uid=f'table_changed_delete_{model._meta.label_lower}')
+
+m2m_changed.connect(work_done_changed, sender=Ticket.work_done.through)
+
+connection_created.connect(install_query_counter, dispatch_uid='install_query_counter')
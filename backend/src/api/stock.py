@@ -0,0 +1,109 @@
+from django.db import connections, transaction
+from django.db.models import Exists, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from .models import Position, StockMovement, StockSnapshot, next_change_seq
+from .generations import bump_generation
+
+
+def with_ledger_stock(positions, at=None):
+    """
+    Annotates positions with `ledger_quantity`, their stock by the ledger at the time `at` (now by default),
+    and `last_movement`, the id of their last movement up to then. The stock is the latest snapshot taken
+    by then plus the sum of the movements after it, a scan of the index on (position, id).
+
+    Movements are ordered by id and their times are taken on insert, so they are assumed to grow together.
+    """
+    snapshots = StockSnapshot.objects.filter(position=OuterRef('pk')).order_by('-movement')
+    movements = StockMovement.objects.filter(position=OuterRef('pk'))
+    if at is not None:
+        snapshots = snapshots.filter(created__lte=at)
+        movements = movements.filter(created__lte=at)
+
+    positions = positions.annotate(
+        snapshot_movement=Coalesce(Subquery(snapshots.values('movement')[:1]), Value(0)),
+        snapshot_quantity=Coalesce(Subquery(snapshots.values('quantity')[:1]), Value(0)),
+    )
+    delta = movements.filter(pk__gt=OuterRef('snapshot_movement')).order_by().values('position')\
+        .annotate(total=Sum('delta')).values('total')
+    return positions.annotate(
+        ledger_quantity=F('snapshot_quantity') + Coalesce(Subquery(delta, output_field=IntegerField()), Value(0)),
+        last_movement=Subquery(movements.order_by('-pk').values('pk')[:1]),
+    )
+
+
+def get_stock(at=None, positions=None):
+    """
+    {position_id: quantity} by the ledger at the time `at`, for all positions or the given queryset.
+    """
+    positions = Position.objects.all() if positions is None else positions
+    return dict(with_ledger_stock(positions, at).values_list('pk', 'ledger_quantity'))
+
+
+def record_openings(using='default', batch_size=500, **kwargs):
+    """
+    Records the stock of every position without movements as its opening balance, so the ledger of positions
+    from before it starts at the stock they had. Runs on post_migrate, once per position: after its opening
+    a position always has a movement. Positions created since go through Position.save(), which records their
+    stock as a receipt.
+    """
+    tables = set(connections[using].introspection.table_names())
+    if not {Position._meta.db_table, StockMovement._meta.db_table} <= tables:
+        return
+    # Locked, an expenditure saved meanwhile cannot move the stock between the read and the opening.
+    positions = Position.objects.using(using).select_for_update()\
+        .filter(~Exists(StockMovement.objects.filter(position=OuterRef('pk')))).order_by('pk')\
+        .values_list('pk', 'quantity')
+    last_pk = 0
+    while True:
+        with transaction.atomic(using=using):
+            openings = list(positions.filter(pk__gt=last_pk)[:batch_size])
+            if not openings:
+                break
+            last_pk = openings[-1][0]
+            StockMovement.objects.using(using).bulk_create([
+                StockMovement(position_id=pk, delta=quantity, kind=StockMovement.OPENING)
+                for pk, quantity in openings
+            ])
+
+
+def reconcile_stock(batch_size=500, dry_run=False):
+    """
+    Recomputes the stock of positions from the ledger, `batch_size` positions per transaction. A position
+    whose quantity drifted from its ledger is set to the ledger quantity, and every position with movements
+    since its latest snapshot gets a new one, which keeps the scans of with_ledger_stock() short.
+    Returns the number of positions checked and a list of (position_id, quantity, ledger_quantity) drifts.
+
+    Stock changed without a movement, QuerySet.update() or Position.change_stock() without
+    StockMovement.record(), counts as drift and is undone here.
+    """
+    checked = 0
+    drifts = []
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            # Locked, an expenditure saved meanwhile cannot slip between the ledger sum and the update.
+            pks = list(Position.objects.select_for_update().filter(pk__gt=last_pk).order_by('pk')
+                       .values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            last_pk = pks[-1]
+            positions = with_ledger_stock(Position.objects.filter(pk__in=pks))\
+                .values_list('pk', 'quantity', 'ledger_quantity', 'snapshot_movement', 'last_movement')
+            snapshots = []
+            for pk, quantity, ledger_quantity, snapshot_movement, last_movement in positions:
+                checked += 1
+                if quantity != ledger_quantity:
+                    drifts.append((pk, quantity, ledger_quantity))
+                    if not dry_run:
+                        Position.objects.filter(pk=pk).update(quantity=ledger_quantity, change_seq=next_change_seq())
+                        bump_generation(Position)
+                if last_movement is not None and last_movement != snapshot_movement:
+                    snapshots.append(StockSnapshot(position_id=pk, movement_id=last_movement,
+                                                   quantity=ledger_quantity))
+            if snapshots and not dry_run:
+                times = dict(StockMovement.objects.filter(pk__in=[snapshot.movement_id for snapshot in snapshots])
+                             .values_list('pk', 'created'))
+                for snapshot in snapshots:
+                    snapshot.created = times[snapshot.movement_id]
+                StockSnapshot.objects.bulk_create(snapshots)
+    return checked, drifts
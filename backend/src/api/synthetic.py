@@ -0,0 +1,208 @@
+import random
+from datetime import date, timedelta
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import F, Max
+from .models import Ticket, Device, DevType, Department, WorkType, Priority, Category, Position, Expenditure, \
+    StockMovement, next_change_seq
+from .bulk import reserve_ids
+from .changes import stamp
+from .generations import TRACKED_MODELS, bump_generation, bump_periods
+from .lookups import clear_lookup_caches
+from .autocomplete import DEVICE_AUTOCOMPLETE
+from .rollups import rebuild_daily_counts
+
+DEV_TYPES = ('АРМ', 'Ноутбук', 'Монитор', 'Принтер', 'МФУ', 'Сканер', 'Сервер', 'Коммутатор', 'ИБП', 'Телефон')
+CATEGORIES = ('ИВК', 'Сеть', 'Печать', 'Программное обеспечение', 'Оборудование', 'Учетные записи')
+PRIORITIES = ((1, 'Низкий'), (2, 'Средний'), (3, 'Высокий'))
+WORK_TYPES = ('Восстановление работоспособности', 'Замена комплектующих', 'Настройка ПО', 'Установка ПО',
+              'Чистка', 'Диагностика', 'Прокладка кабеля', 'Консультация')
+DEVICE_MODELS = ('Dell Inspiron 7577', 'HP ProBook 450', 'Lenovo ThinkCentre M720', 'Kyocera ECOSYS M2040',
+                 'HP LaserJet Pro M404', 'Samsung S24F350', 'Cisco SG350-28', 'APC Back-UPS 650',
+                 'Canon LiDE 300', 'Yealink T21P')
+POSITIONS = ('Клавиатура', 'Мышь', 'Картридж', 'Блок питания', 'Жесткий диск', 'SSD', 'Оперативная память',
+             'Патч-корд', 'Батарея ИБП', 'Кабель питания', 'Фотобарабан', 'Термопаста')
+PROBLEMS = ('Не работает', 'Не включается', 'Зависает', 'Не печатает', 'Шумит', 'Нет сети на', 'Медленно работает',
+            'Замятие бумаги в', 'Нет изображения на', 'Ошибка при загрузке')
+DETAILS = ('после обновления', 'с утра', 'периодически', 'при печати', 'после переезда', 'у нового сотрудника',
+           'в бухгалтерии', 'в приемной', 'на складе', 'после отключения электричества')
+
+
+class SyntheticData:
+    """
+    Fills the database with generated lookups, users, departments, devices, positions and tickets with work types
+    and expenditures, written with bulk_create() in batches. Rows are added next to the existing data, titles and
+    inventory numbers continue after the ones generated before.
+
+    Generated tickets spread over the last `days` days, stock of the generated positions is taken by their
+    expenditures and never goes below zero. Daily counters and table generations are rebuilt at the end.
+    """
+
+    def __init__(self, tickets=100000, devices=5000, departments=100, positions=500, users=50, days=3 * 365,
+                 batch_size=5000, seed=None, log=None):
+        self.counts = {
+            'tickets': tickets,
+            'devices': devices,
+            'departments': departments,
+            'positions': positions,
+            'users': users,
+        }
+        self.days = days
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+        self.log = log or (lambda message: None)
+
+    def generate(self):
+        self.create_lookups()
+        users = self.create_users()
+        departments = self.create_departments()
+        if self.counts['devices'] and not departments:
+            raise ValueError('Devices need at least one department')
+        devices = self.create_devices(departments)
+        self.stock = self.create_positions()
+        self.create_tickets(users, devices)
+
+        self.log('Rebuilding daily ticket counters')
+        rebuild_daily_counts()
+        bump_generation(*TRACKED_MODELS)
+        clear_lookup_caches()
+        DEVICE_AUTOCOMPLETE.clear()
+
+    def create_lookups(self):
+        for title in DEV_TYPES:
+            DevType.objects.get_or_create(title=title)
+        for title in CATEGORIES:
+            Category.objects.get_or_create(title=title)
+        for number, title in PRIORITIES:
+            Priority.objects.get_or_create(title=title, defaults={'number': number})
+        for title in WORK_TYPES:
+            WorkType.objects.get_or_create(title=title)
+        self.dev_types = list(DevType.objects.values_list('pk', flat=True))
+        self.categories = list(Category.objects.values_list('pk', flat=True))
+        self.priorities = list(Priority.objects.values_list('pk', flat=True))
+        self.work_types = list(WorkType.objects.values_list('pk', flat=True))
+
+    def next_number(self, queryset):
+        # Generated rows are numbered, a second run continues after the rows of the first one.
+        return queryset.count() + 1
+
+    def create_users(self):
+        first = self.next_number(User.objects.filter(username__startswith='tech'))
+        User.objects.bulk_create([User(username=f'tech{number}', password='!')
+                                  for number in range(first, first + self.counts['users'])],
+                                 batch_size=self.batch_size)
+        self.log(f'{self.counts["users"]} users')
+        return list(User.objects.values_list('pk', flat=True))
+
+    def create_departments(self):
+        first = self.next_number(Department.objects.filter(title__startswith='Организация '))
+        Department.objects.bulk_create([Department(title=f'Организация {number}')
+                                        for number in range(first, first + self.counts['departments'])],
+                                       batch_size=self.batch_size)
+        self.log(f'{self.counts["departments"]} departments')
+        return list(Department.objects.values_list('pk', flat=True))
+
+    def create_devices(self, departments):
+        first = self.next_number(Device.objects.filter(inv_num__startswith='SYN'))
+        numbers = range(first, first + self.counts['devices'])
+        for start in range(0, len(numbers), self.batch_size):
+            devices = [
+                Device(inv_num=f'SYN{number:08d}', title=self.random.choice(DEVICE_MODELS),
+                       department_id=self.random.choice(departments), type_id=self.random.choice(self.dev_types))
+                for number in numbers[start:start + self.batch_size]
+            ]
+            with transaction.atomic():
+                stamp(devices)
+                Device.objects.bulk_create(devices)
+        self.log(f'{self.counts["devices"]} devices')
+        return list(Device.objects.values_list('pk', flat=True))
+
+    def create_positions(self):
+        first = self.next_number(Position.objects.filter(title__contains=' №'))
+        # About a fifth of the tickets take one or two positions, 1-3 pieces each.
+        expected = self.counts['tickets'] * 0.6 / max(self.counts['positions'], 1)
+        last_pk = Position.objects.aggregate(last_pk=Max('pk'))['last_pk'] or 0
+        positions = [
+            Position(title=f'{self.random.choice(POSITIONS)} №{number}',
+                     quantity=int(expected * 1.5) + self.random.randint(10, 500))
+            for number in range(first, first + self.counts['positions'])
+        ]
+        with transaction.atomic():
+            stamp(positions)
+            Position.objects.bulk_create(positions, batch_size=self.batch_size)
+        StockMovement.objects.bulk_create([
+            StockMovement(position_id=pk, delta=quantity, kind=StockMovement.RECEIPT)
+            for pk, quantity in Position.objects.filter(pk__gt=last_pk).values_list('pk', 'quantity')
+        ], batch_size=self.batch_size)
+        self.log(f'{self.counts["positions"]} positions')
+        return dict(Position.objects.filter(title__contains=' №').values_list('pk', 'quantity'))
+
+    def create_tickets(self, users, devices):
+        if self.counts['tickets'] and not (users and devices):
+            raise ValueError('Tickets need at least one user and one device')
+        created = 0
+        while created < self.counts['tickets']:
+            count = min(self.batch_size, self.counts['tickets'] - created)
+            self.create_ticket_batch(count, users, devices)
+            created += count
+            self.log(f'{created} tickets')
+
+    def create_ticket_batch(self, count, users, devices):
+        today = date.today()
+        positions = list(self.stock)
+        WorkDone = Ticket.work_done.through
+
+        with transaction.atomic():
+            # Also takes the write lock on SQLite before ids are reserved.
+            bump_generation(Ticket)
+            tickets = []
+            for _ in range(count):
+                created = today - timedelta(days=self.random.randrange(self.days))
+                closed = self.random.random() < 0.8 and created < today
+                tickets.append(Ticket(
+                    created=created,
+                    closed=created + timedelta(days=self.random.randint(0, min(14, (today - created).days)))
+                    if closed else None,
+                    owner_id=self.random.choice(users),
+                    description=f'{self.random.choice(PROBLEMS)} {self.random.choice(DEVICE_MODELS)} '
+                                f'{self.random.choice(DETAILS)}',
+                    device_id=self.random.choice(devices),
+                    priority_id=self.random.choice(self.priorities) if self.random.random() < 0.9 else None,
+                    category_id=self.random.choice(self.categories),
+                    status=not closed,
+                ))
+            if not connection.features.can_return_rows_from_bulk_insert:
+                for ticket, pk in zip(tickets, reserve_ids(Ticket, len(tickets))):
+                    ticket.pk = pk
+            stamp(tickets)
+            Ticket.objects.bulk_create(tickets)
+
+            work_done = []
+            expenditures = []
+            taken = {}
+            for ticket in tickets:
+                for work_type in self.random.sample(self.work_types, self.random.randint(0, 3)):
+                    work_done.append(WorkDone(ticket_id=ticket.pk, worktype_id=work_type))
+                if positions and self.random.random() < 0.2:
+                    for position in self.random.sample(positions, min(len(positions), self.random.randint(1, 2))):
+                        quantity = self.random.randint(1, 3)
+                        if self.stock[position] >= quantity:
+                            self.stock[position] -= quantity
+                            taken[position] = taken.get(position, 0) + quantity
+                            expenditures.append(Expenditure(position_id=position, quantity=quantity,
+                                                            ticket_id=ticket.pk))
+            WorkDone.objects.bulk_create(work_done, batch_size=self.batch_size)
+            if not connection.features.can_return_rows_from_bulk_insert:
+                for expenditure, pk in zip(expenditures, reserve_ids(Expenditure, len(expenditures))):
+                    expenditure.pk = pk
+            Expenditure.objects.bulk_create(expenditures, batch_size=self.batch_size)
+            # Skips the ledger, the movements below must match or reconcile_stock undoes the change.
+            for position in sorted(taken):
+                Position.objects.filter(pk=position).update(quantity=F('quantity') - taken[position],
+                                                            change_seq=next_change_seq())
+            StockMovement.objects.bulk_create([
+                StockMovement(position_id=expenditure.position_id, delta=-expenditure.quantity,
+                              kind=StockMovement.EXPENDITURE, expenditure_id=expenditure.pk)
+                for expenditure in expenditures
+            ], batch_size=self.batch_size)
+            bump_periods(ticket.created for ticket in tickets)
@@ -0,0 +1,87 @@
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+from rest_framework import status
+from dj_rest_auth.models import TokenModel
+from api.models import Department, WorkType, Category, Priority, Position, DevType, Device, Ticket, Expenditure
+from api.lookups import clear_lookup_caches
+from api.benchmark import percentile
+
+
+class AsyncReadPathTest(TransactionTestCase):
+    # The async views query from executor threads, which only see committed data.
+    reset_sequences = True
+
+    def setUp(self):
+        clear_lookup_caches()
+        owner = User.objects.create(username='anon', password='!QAZ1qaz')
+        department = Department.objects.create(title='Божий дар')
+        work_type = WorkType.objects.create(title='Замена комплектующих')
+        priority = Priority.objects.create(number=1, title='Низкий')
+        category = Category.objects.create(title='ИВК')
+        dev_type = DevType.objects.create(title='АРМ')
+        device = Device.objects.create(inv_num='510100034', title='Dell Inspiron 7577', department=department,
+                                       type=dev_type)
+        position = Position.objects.create(title='Клавиатура', quantity=10)
+        for i in range(3):
+            ticket = Ticket.objects.create(created='2022-02-20', owner=owner, description=f'Заявка {i}',
+                                           device=device, priority=priority, category=category, status=bool(i))
+            ticket.work_done.add(work_type)
+            Expenditure.objects.create(position=position, quantity=1, ticket=ticket)
+
+        self.client = APIClient()
+        token = TokenModel.objects.create(user=owner)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def tearDown(self):
+        clear_lookup_caches()
+
+    def assertSameAsSync(self, async_url, sync_url, params=None):
+        res = self.client.get(async_url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json(), self.client.get(sync_url, params).json())
+        return res
+
+    def test_ticket_list(self):
+        self.assertSameAsSync(reverse('async_ticket_list'), reverse('ticket-list'))
+        self.assertSameAsSync(reverse('async_ticket_list'), reverse('ticket-list'),
+                              {'status': '1', 'sort': 'id', 'order': 'desc'})
+        res = self.client.get(reverse('async_ticket_list'), {'cursor': '', 'limit': 2})
+        sync_res = self.client.get(reverse('ticket-list'), {'cursor': '', 'limit': 2})
+        self.assertEqual(res.json()['results'], sync_res.json()['results'])
+        self.assertEqual(res.json()['next'].split('?')[1], sync_res.json()['next'].split('?')[1])
+
+    def test_ticket_detail(self):
+        self.assertSameAsSync(reverse('async_ticket_detail', kwargs={'pk': 2}),
+                              reverse('ticket-detail', kwargs={'pk': 2}))
+        res = self.client.get(reverse('async_ticket_detail', kwargs={'pk': 100}))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_dashboard(self):
+        params = {'date_gte': '2022-02-01T00:00:00', 'date_lte': '2022-02-28T00:00:00'}
+        res = self.assertSameAsSync(reverse('async_ticket_per_date'), reverse('ticket_per_date'), params)
+        self.assertEqual(res.json(), {'2022-02-20': 3})
+        res = self.client.get(reverse('async_ticket_per_date'))
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_conditional_get(self):
+        url = reverse('async_ticket_list')
+        res = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=res['ETag']).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+        Ticket.objects.filter(pk=1).get().save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=res['ETag']).status_code, status.HTTP_200_OK)
+
+    def test_read_only(self):
+        res = self.client.post(reverse('async_ticket_list'), {}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+class PercentileTest(TestCase):
+
+    def test_nearest_rank(self):
+        values = [0.5, 0.1, 0.4, 0.2, 0.3]
+        self.assertEqual(percentile(values, 50), 0.3)
+        self.assertEqual(percentile(values, 99), 0.5)
+        self.assertEqual(percentile([0.1], 95), 0.1)
@@ -0,0 +1,94 @@
+from unittest import mock
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth.models import User
+from rest_framework.test import APITestCase
+from rest_framework import status
+from dj_rest_auth.models import TokenModel
+from api.authentication import TOKEN_CACHE, TokenCache
+
+
+class CachedTokenAuthenticationTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='anon', password='!QAZ1qaz')
+        cls.token = TokenModel.objects.create(user=cls.user)
+
+    def setUp(self):
+        TOKEN_CACHE.clear()
+        self.addCleanup(TOKEN_CACHE.clear)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def get(self):
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.get(reverse('rest_user_details'))
+        return res, [query['sql'] for query in context.captured_queries]
+
+    def test_cached(self):
+        res, queries = self.get()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json()['username'], 'anon')
+        self.assertTrue(any('authtoken_token' in sql for sql in queries))
+        res, cached_queries = self.get()
+        self.assertEqual(res.json()['username'], 'anon')
+        # Only the generation of the token table.
+        self.assertEqual(len(cached_queries), 1)
+        self.assertIn('api_tablegeneration', cached_queries[0])
+
+    def test_invalid_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token 0000')
+        # 403, SessionAuthentication comes first and sends no WWW-Authenticate header.
+        self.assertEqual(self.get()[0].status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(TOKEN_CACHE.entries, {})
+
+    def test_revoked_on_logout(self):
+        self.get()
+        self.assertEqual(self.client.post(reverse('rest_logout')).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.get()[0].status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_revoked_on_token_delete(self):
+        self.get()
+        TokenModel.objects.filter(user=self.user).delete()
+        self.assertEqual(self.get()[0].status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_revoked_by_another_process(self):
+        self.get()
+        # The signals of the other process revoke the token in its own cache.
+        with mock.patch('api.signals.TOKEN_CACHE', TokenCache()):
+            TokenModel.objects.filter(user=self.user).delete()
+        self.assertIn(self.token.key, TOKEN_CACHE.entries)
+        self.assertEqual(self.get()[0].status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_login_keeps_tokens_of_other_processes(self):
+        self.get()
+        user = User.objects.get(pk=self.user.pk)
+        with mock.patch('api.signals.TOKEN_CACHE', TokenCache()):
+            user.save(update_fields=['last_login'])
+        self.assertEqual(len(self.get()[1]), 1)
+
+    def test_revoked_on_deactivation(self):
+        self.get()
+        user = User.objects.get(pk=self.user.pk)
+        user.is_active = False
+        user.save()
+        self.assertEqual(self.get()[0].status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_not_cached_when_revoked_meanwhile(self):
+        epoch = TOKEN_CACHE.epoch
+        TOKEN_CACHE.revoke(self.token.key)
+        TOKEN_CACHE.set(self.token.key, self.user, self.token, epoch)
+        self.assertIsNone(TOKEN_CACHE.get(self.token.key))
+
+    def test_ttl_and_lru(self):
+        cache = TokenCache(maxsize=2, ttl=0)
+        cache.set('a', self.user, self.token, cache.epoch)
+        self.assertIsNone(cache.get('a'))
+
+        cache = TokenCache(maxsize=2)
+        for key in 'abc':
+            cache.set(key, self.user, self.token, cache.epoch)
+        self.assertEqual(list(cache.entries), ['b', 'c'])
+        cache.revoke_user(self.user.pk)
+        self.assertEqual(cache.entries, {})
@@ -0,0 +1,82 @@
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework import status
+from api.models import Department, DevType, Device
+from api.autocomplete import DeviceAutocomplete, DEVICE_AUTOCOMPLETE
+
+
+class DeviceAutocompleteTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.department = Department.objects.create(title='Божий дар')
+        cls.dev_type = DevType.objects.create(title='АРМ')
+        for inv_num, title in (('510100034', 'Dell Inspiron 7577'), ('510100035', 'HP ProBook 450'),
+                               ('5102', 'Dell OptiPlex 3080'), ('HP-0001', 'Kyocera ECOSYS M2040')):
+            Device.objects.create(inv_num=inv_num, title=title, department=cls.department, type=cls.dev_type)
+
+    def setUp(self):
+        DEVICE_AUTOCOMPLETE.clear()
+        self.addCleanup(DEVICE_AUTOCOMPLETE.clear)
+        self.url = reverse('device-autocomplete')
+
+    def inv_nums(self, query, limit=10):
+        return [row[1] for row in DEVICE_AUTOCOMPLETE.search(query, limit)]
+
+    def test_inv_num_prefix(self):
+        self.assertEqual(self.inv_nums('5101'), ['510100034', '510100035'])
+        self.assertEqual(self.inv_nums('510'), ['510100034', '510100035', '5102'])
+        self.assertEqual(self.inv_nums('510', limit=2), ['510100034', '510100035'])
+        self.assertEqual(self.inv_nums('6'), [])
+
+    def test_title_words(self):
+        self.assertEqual(self.inv_nums('dell'), ['510100034', '5102'])
+        self.assertEqual(self.inv_nums('OPTI'), ['5102'])
+        self.assertEqual(self.inv_nums('dell insp'), ['510100034'])
+        self.assertEqual(self.inv_nums('   '), [])
+
+    def test_inv_num_matches_first(self):
+        # HP-0001 by inventory number, then the HP ProBook by title.
+        self.assertEqual(self.inv_nums('hp'), ['HP-0001', '510100035'])
+
+    def test_loaded_once(self):
+        with self.assertNumQueries(1):
+            self.inv_nums('5101')
+            self.inv_nums('dell')
+
+    def test_kept_current(self):
+        self.inv_nums('5101')
+        device = Device.objects.create(inv_num='51010001', title='Lenovo ThinkCentre', department=self.department,
+                                       type=self.dev_type)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.inv_nums('5101'), ['51010001', '510100034', '510100035'])
+            self.assertEqual(self.inv_nums('think'), ['51010001'])
+
+        device.inv_num = '7001'
+        device.title = 'Lenovo IdeaCentre'
+        device.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.inv_nums('5101'), ['510100034', '510100035'])
+            self.assertEqual(self.inv_nums('think'), [])
+            self.assertEqual(self.inv_nums('idea'), ['7001'])
+
+        device.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.inv_nums('7001'), [])
+            self.assertEqual(self.inv_nums('lenovo'), [])
+
+    def test_rebuilt_after_ttl(self):
+        index = DeviceAutocomplete(ttl=0)
+        self.assertEqual(len(index.search('5')), 3)
+        Device.objects.filter(inv_num='5102').update(inv_num='6102')
+        self.assertEqual(len(index.search('5')), 2)
+
+    def test_endpoint(self):
+        res = self.client.get(self.url, {'q': '5101', 'limit': 1})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json(), [{'id': 1, 'inv_num': '510100034', 'title': 'Dell Inspiron 7577',
+                                       'department': 'Божий дар', 'type': 'АРМ'}])
+        self.assertEqual(res.json()[0], self.client.get(reverse('device-detail', kwargs={'pk': 1})).json())
+        self.assertEqual(self.client.get(self.url).json(), [])
+        self.assertEqual(self.client.get(self.url, {'q': '5', 'limit': 'x'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,66 @@
+from django.db.models import Sum
+from django.contrib.auth.models import User
+from django.test import TestCase
+from dj_rest_auth.models import TokenModel
+from api.models import Department, Position, Device, Ticket, Expenditure, TicketDailyCount
+from api.synthetic import SyntheticData
+from api.stock import get_stock
+from api.lookups import clear_lookup_caches
+from api.benchmark import get_scenarios, measure, compare
+from api.cube import numpy
+
+
+class SyntheticDataTest(TestCase):
+
+    def setUp(self):
+        clear_lookup_caches()
+
+    def tearDown(self):
+        clear_lookup_caches()
+
+    def test_generate(self):
+        SyntheticData(tickets=300, devices=20, departments=3, positions=5, users=4, batch_size=100, seed=1).generate()
+        self.assertEqual(Ticket.objects.count(), 300)
+        self.assertEqual(Device.objects.count(), 20)
+        self.assertEqual(Department.objects.count(), 3)
+        self.assertEqual(User.objects.count(), 4)
+        self.assertTrue(Expenditure.objects.exists())
+        self.assertFalse(Position.objects.filter(quantity__lt=0).exists())
+        self.assertEqual(get_stock(), dict(Position.objects.values_list('pk', 'quantity')))
+        counted = TicketDailyCount.objects.aggregate(total=Sum('open_count') + Sum('closed_count'))['total']
+        self.assertEqual(counted, 300)
+
+        # A second run adds to the data of the first one.
+        SyntheticData(tickets=10, devices=5, departments=1, positions=1, users=1, seed=2).generate()
+        self.assertEqual(Ticket.objects.count(), 310)
+        self.assertEqual(Device.objects.count(), 25)
+
+
+class EndpointBenchmarkTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        SyntheticData(tickets=50, devices=5, departments=2, positions=3, users=2, seed=1).generate()
+
+    def setUp(self):
+        clear_lookup_caches()
+
+    def test_every_scenario_answers(self):
+        token = TokenModel.objects.create(user=User.objects.first()).key
+        scenarios = get_scenarios()
+        self.assertIn('async_dashboard', dict(scenarios))
+        self.assertLessEqual({'cube', 'changes', 'devices_autocomplete', 'positions_stock'}, set(dict(scenarios)))
+        for name, url in scenarios:
+            # The async views read from other threads, which do not see the data of this test's transaction.
+            if name.startswith('async_') or name == 'cube' and numpy is None:
+                continue
+            with self.subTest(name):
+                result = measure(url, repeat=1, token=token)
+                self.assertEqual(result['status'], 200)
+                self.assertGreater(result['queries'], 0)
+
+    def test_compare(self):
+        baseline = {'tickets': {'p95_ms': 10.0, 'queries': 4}, 'devices': {'p95_ms': 10.0, 'queries': 2}}
+        results = {'tickets': {'p95_ms': 11.0, 'queries': 4}, 'devices': {'p95_ms': 13.0, 'queries': 3},
+                   'users': {'p95_ms': 50.0, 'queries': 9}}
+        self.assertEqual(compare(results, baseline, 0.2), ['devices: p95 10.0 -> 13.0 ms', 'devices: 2 -> 3 queries'])
@@ -0,0 +1,258 @@
+import json
+import os
+import tempfile
+from unittest import mock
+from io import StringIO
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth.models import User
+from rest_framework.test import APITestCase
+from rest_framework import status
+from dj_rest_auth.models import TokenModel
+from api.models import Department, WorkType, Category, Priority, Position, DevType, Device, Ticket, \
+    Expenditure, TicketDailyCount, StockMovement
+from api.search import search
+from api.bulk import BulkTicketImport
+from api.autocomplete import DEVICE_AUTOCOMPLETE
+from api.lookups import clear_lookup_caches
+
+
+class TicketBulkCreateTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username='anon', password='!QAZ1qaz')
+        department = Department.objects.create(title='Божий дар')
+        WorkType.objects.create(title='Восстановление работоспособности')
+        WorkType.objects.create(title='Замена комплектующих')
+        Priority.objects.create(number=1, title='Низкий')
+        Category.objects.create(title='ИВК')
+        dev_type = DevType.objects.create(title='АРМ')
+        Device.objects.create(inv_num='510100034', title='Dell Inspiron 7577', department=department, type=dev_type)
+        Position.objects.create(title='Клавиатура', quantity=10)
+
+    def setUp(self):
+        token = TokenModel.objects.create(user=self.owner)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.url = reverse('ticket-bulk')
+
+    def ticket(self, **kwargs):
+        data = {
+            'created': '2022-02-20',
+            'closed': None,
+            'owner': 'anon',
+            'description': 'Не работает клавиша Shift',
+            'device': {'inv_num': '510100034'},
+            'work_done': ['Восстановление работоспособности', 'Замена комплектующих'],
+            'priority': 'Низкий',
+            'expenditures': [{'position': 'Клавиатура', 'quantity': 1}],
+            'category': 'ИВК',
+            'status': True,
+        }
+        data.update(kwargs)
+        return data
+
+    def test_create_json(self):
+        res = self.client.post(self.url, data=[self.ticket(), self.ticket(priority=None, expenditures=[])],
+                               format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.json(), {'created': 2, 'ids': [1, 2]})
+
+        res = self.client.get(reverse('ticket-detail', kwargs={'pk': 1}))
+        self.assertEqual(res.json()['work_done'], ['Восстановление работоспособности', 'Замена комплектующих'])
+        self.assertEqual(res.json()['expenditures'], [{'id': 1, 'position': 'Клавиатура', 'quantity': 1}])
+        self.assertIsNone(Ticket.objects.get(pk=2).priority)
+        self.assertEqual(Position.objects.get().quantity, 9)
+        self.assertEqual(list(StockMovement.objects.filter(kind=StockMovement.EXPENDITURE)
+                              .values_list('delta', 'expenditure')), [(-1, 1)])
+        self.assertEqual(TicketDailyCount.objects.get().open_count, 2)
+        self.assertEqual(search(Ticket.objects.all(), 'клавиша').count(), 2)
+
+    def test_create_ndjson(self):
+        body = '\n'.join(json.dumps(self.ticket(description=f'Заявка {i}')) for i in range(3)) + '\n'
+        res = self.client.post(self.url, data=body.encode('utf-8'), content_type='application/x-ndjson')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.json()['created'], 3)
+
+    def test_ids_follow_existing_tickets(self):
+        self.client.post(self.url, data=[self.ticket(expenditures=[])], format='json')
+        Ticket.objects.get().delete()
+        res = self.client.post(self.url, data=[self.ticket(expenditures=[])], format='json')
+        self.assertEqual(res.json()['ids'], [2])
+
+    def test_errors_per_item(self):
+        data = [
+            self.ticket(),
+            self.ticket(owner='nobody', device={'inv_num': '000'}),
+            self.ticket(work_done=['Обмотать изолентой'], created='вчера'),
+            self.ticket(expenditures=[{'position': 'Мышь', 'quantity': 1}]),
+        ]
+        res = self.client.post(self.url, data=data, format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = {item['index']: item['errors'] for item in res.json()['errors']}
+        self.assertEqual(set(errors), {1, 2, 3})
+        self.assertEqual(set(errors[1]), {'owner', 'device'})
+        self.assertEqual(set(errors[2]), {'created'})
+        self.assertEqual(set(errors[3]), {'expenditures'})
+        self.assertEqual(Ticket.objects.count(), 0)
+        self.assertEqual(Position.objects.get().quantity, 10)
+
+    def test_not_enough_stock(self):
+        data = [self.ticket(expenditures=[{'position': 'Клавиатура', 'quantity': 6}]) for _ in range(2)]
+        res = self.client.post(self.url, data=data, format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([item['index'] for item in res.json()['errors']], [0, 1])
+        self.assertEqual(Expenditure.objects.count(), 0)
+
+    def test_stock_spent_after_validation(self):
+        data = [self.ticket(expenditures=[]), self.ticket(), self.ticket()]
+        # Validation passes as if another request took the stock right after it.
+        with mock.patch.object(BulkTicketImport, 'check_stock'):
+            Position.objects.update(quantity=1)
+            res = self.client.post(self.url, data=data, format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.json(), {'errors': [
+            {'index': index, 'errors': {'expenditures': ['Not enough "Клавиатура" in stock: 2 requested.']}}
+            for index in (1, 2)
+        ]})
+        self.assertEqual(Ticket.objects.count(), 0)
+        self.assertEqual(Position.objects.get().quantity, 1)
+
+    def test_not_a_list(self):
+        res = self.client.post(self.url, data=self.ticket(), format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_not_authorized(self):
+        self.client.credentials()
+        res = self.client.post(self.url, data=[self.ticket()], format='json')
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_query_count_does_not_grow_with_batch(self):
+        def count_queries(size):
+            data = [self.ticket(description=f'Заявка {i}', expenditures=[]) for i in range(size)]
+            with CaptureQueriesContext(connection) as context:
+                res = self.client.post(self.url, data=data, format='json')
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            return len(context.captured_queries)
+
+        count_queries(1)
+        self.assertEqual(count_queries(5), count_queries(50))
+        self.assertEqual(Ticket.objects.count(), 56)
+
+
+class DeviceImportTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username='anon', password='!QAZ1qaz')
+        cls.department = Department.objects.create(title='Божий дар')
+        cls.dev_type = DevType.objects.create(title='АРМ')
+        Device.objects.create(inv_num='510100034', title='Dell Inspiron 7577', department=cls.department,
+                              type=cls.dev_type)
+        Device.objects.create(inv_num='510100035', title='HP ProBook 450', department=cls.department,
+                              type=cls.dev_type)
+
+    def setUp(self):
+        token = TokenModel.objects.create(user=self.owner)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.url = reverse('device-import')
+        DEVICE_AUTOCOMPLETE.clear()
+        self.addCleanup(DEVICE_AUTOCOMPLETE.clear)
+        clear_lookup_caches()
+        self.addCleanup(clear_lookup_caches)
+
+    def post(self, body, content_type='text/csv', **params):
+        url = f'{self.url}?create_missing=1' if params.get('create_missing') else self.url
+        return self.client.generic('POST', url, body.encode(), content_type=content_type)
+
+    def devices(self):
+        return list(Device.objects.order_by('inv_num').values_list('inv_num', 'title', 'department__title',
+                                                                    'type__title'))
+
+    def test_csv_upsert(self):
+        DEVICE_AUTOCOMPLETE.search('dell')
+        res = self.post('\ufeffinv_num,title,department,type\n'
+                        '510100034,Dell Inspiron 7577,Божий дар,АРМ\n'
+                        '510100035,HP ProBook 455,Божий дар,АРМ\n'
+                        '510100036,"Dell OptiPlex 3080, б/у",Божий дар,АРМ\n'
+                        '510100037,Kyocera ECOSYS M2040,Божий дар,Принтер\n'
+                        '510100038,,Божий дар,АРМ\n'
+                        '510100036,Dell OptiPlex 3090,Божий дар,АРМ\n')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json(), {'created': 1, 'updated': 1, 'unchanged': 1, 'errors': [
+            {'line': 5, 'errors': {'type': ['Object with title=Принтер does not exist.']}},
+            {'line': 6, 'errors': {'title': ['This field may not be blank.']}},
+        ]})
+        self.assertEqual(self.devices(), [
+            ('510100034', 'Dell Inspiron 7577', 'Божий дар', 'АРМ'),
+            ('510100035', 'HP ProBook 455', 'Божий дар', 'АРМ'),
+            ('510100036', 'Dell OptiPlex 3090', 'Божий дар', 'АРМ'),
+        ])
+        self.assertEqual([row[1] for row in DEVICE_AUTOCOMPLETE.search('dell')], ['510100034', '510100036'])
+
+    def test_ndjson_create_missing(self):
+        res = self.post('{"inv_num": "510100034", "title": "Dell Inspiron 7577", "department": "Тьмутаракань", '
+                        '"type": "Ноутбук"}\n'
+                        '\n'
+                        '{"inv_num": "510100036"\n'
+                        '["510100037"]\n', content_type='application/x-ndjson', create_missing=True)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json()['updated'], 1)
+        self.assertEqual([error['line'] for error in res.json()['errors']], [3, 4])
+        self.assertEqual(self.devices()[0], ('510100034', 'Dell Inspiron 7577', 'Тьмутаракань', 'Ноутбук'))
+        self.assertEqual(self.client.get(reverse('department-list')).json()[-1]['title'], 'Тьмутаракань')
+
+    def test_department_change_moves_ticket_counts(self):
+        category = Category.objects.create(title='ИВК')
+        device = Device.objects.get(inv_num='510100034')
+        for day, is_open in ((1, True), (1, False), (2, True)):
+            Ticket.objects.create(created=f'2022-02-{day:02d}', owner=self.owner, device=device, category=category,
+                                  description='Не работает', status=is_open)
+        Department.objects.create(title='Тьмутаракань')
+
+        res = self.post('inv_num,title,department,type\n510100034,Dell Inspiron 7577,Тьмутаракань,АРМ\n')
+        self.assertEqual(res.json()['updated'], 1)
+        url = reverse('ticket_series')
+        params = {'date_gte': '2022-02-01T00:00:00.000Z', 'date_lte': '2022-02-02T00:00:00.000Z'}
+        self.assertEqual(self.client.get(url, {**params, 'department': 'Тьмутаракань'}).json(), {
+            'granularity': 'day',
+            'open': {'2022-02-01': 1, '2022-02-02': 1},
+            'closed': {'2022-02-01': 1, '2022-02-02': 0},
+        })
+        res = self.client.get(url, {**params, 'department': 'Божий дар'})
+        self.assertEqual(res.json()['open'], {'2022-02-01': 0, '2022-02-02': 0})
+        self.assertEqual(res.json()['closed'], {'2022-02-01': 0, '2022-02-02': 0})
+
+    def test_invalid_files(self):
+        res = self.post('inv_num,title\n510100036,Dell OptiPlex 3080\n')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        res = self.post('inv_num,title,department,type\n', content_type='application/json')
+        self.assertEqual(res.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        self.client.credentials()
+        self.assertEqual(self.post('inv_num,title,department,type\n').status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_command_in_batches(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', delete=False) as file:
+            file.write('inv_num,title,department,type\n')
+            for i in range(5):
+                file.write(f'6101000{i},Lenovo ThinkCentre,Тьмутаракань,АРМ\n')
+        self.addCleanup(os.remove, file.name)
+
+        out, err = StringIO(), StringIO()
+        call_command('import_devices', file.name, '--batch-size', '2', stdout=out, stderr=err)
+        self.assertIn('0 created, 0 updated, 0 unchanged, 5 rows with errors', out.getvalue())
+        self.assertIn('Line 2: department: Object with title=Тьмутаракань does not exist.', err.getvalue())
+
+        with CaptureQueriesContext(connection) as context:
+            call_command('import_devices', file.name, '--batch-size', '2', '--create-missing', stdout=out)
+        self.assertIn('5 created, 0 updated, 0 unchanged, 0 rows with errors', out.getvalue())
+        self.assertEqual(Device.objects.filter(department__title='Тьмутаракань').count(), 5)
+        queries = len(context.captured_queries)
+
+        # Rows are resolved and written per batch, not per row.
+        with CaptureQueriesContext(connection) as context:
+            call_command('import_devices', file.name, '--batch-size', '5', stdout=out)
+        self.assertIn('0 created, 0 updated, 5 unchanged', out.getvalue())
+        self.assertLess(len(context.captured_queries), queries)
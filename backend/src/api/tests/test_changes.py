@@ -0,0 +1,155 @@
+from django.urls import reverse
+from django.contrib.auth.models import User
+from rest_framework.test import APITestCase
+from rest_framework import status
+from api.models import Department, WorkType, Category, Position, DevType, Device, Ticket, Expenditure
+from api.bulk import DeviceImport
+from api.changes import number_unnumbered
+from api.lookups import clear_lookup_caches
+
+
+class ChangeFeedTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username='anon', password='!QAZ1qaz')
+        cls.dev_type = DevType.objects.create(title='АРМ')
+        cls.department = Department.objects.create(title='Божий дар')
+        cls.category = Category.objects.create(title='ИВК')
+        cls.work_type = WorkType.objects.create(title='Замена комплектующих')
+        device = Device.objects.create(inv_num='510100034', title='Dell Inspiron 7577', type=cls.dev_type,
+                                       department=cls.department)
+        Position.objects.create(title='Клавиатура', quantity=100)
+        for day in (1, 2):
+            Ticket.objects.create(created=f'2022-02-{day:02d}', owner=cls.owner, description='Не работает',
+                                  device=device, category=cls.category)
+
+    def setUp(self):
+        clear_lookup_caches()
+        self.addCleanup(clear_lookup_caches)
+        self.url = reverse('changes')
+
+    def changes(self, **params):
+        res = self.client.get(self.url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK, res.content)
+        return res.json()
+
+    def test_initial_sync(self):
+        data = self.changes(since=0)
+        self.assertEqual([(change['type'], change['id']) for change in data['changes']],
+                         [('devices', 1), ('positions', 1), ('tickets', 1), ('tickets', 2)])
+        self.assertEqual(data['changes'][0]['data'], {'id': 1, 'inv_num': '510100034', 'title': 'Dell Inspiron 7577',
+                                                      'department': 'Божий дар', 'type': 'АРМ'})
+        self.assertEqual(data['changes'][3]['data']['created'], '2022-02-02')
+        self.assertEqual(data['cursor'], data['changes'][-1]['seq'])
+        self.assertFalse(data['more'])
+        self.assertEqual(self.changes(since=data['cursor']), {'changes': [], 'cursor': data['cursor'],
+                                                              'more': False})
+
+    def test_pages(self):
+        seen = []
+        cursor = 0
+        while True:
+            data = self.changes(since=cursor, limit=3)
+            seen.extend((change['type'], change['id']) for change in data['changes'])
+            cursor = data['cursor']
+            if not data['more']:
+                break
+        self.assertEqual(seen, [('devices', 1), ('positions', 1), ('tickets', 1), ('tickets', 2)])
+
+    def test_changes_since(self):
+        cursor = self.changes()['cursor']
+        ticket = Ticket.objects.get(pk=1)
+        ticket.description = 'Вышел из строя НЖМД'
+        ticket.save()
+        Expenditure(position=Position.objects.get(), quantity=2, ticket=Ticket.objects.get(pk=2)).save()
+        self.work_type.tickets.add(ticket)
+
+        data = self.changes(since=cursor)
+        self.assertEqual([(change['type'], change['id']) for change in data['changes']],
+                         [('positions', 1), ('tickets', 2), ('tickets', 1)])
+        self.assertEqual(data['changes'][0]['data']['quantity'], 98)
+        self.assertEqual(data['changes'][1]['data']['expenditures'], [{'id': 1, 'position': 'Клавиатура',
+                                                                        'quantity': 2}])
+        self.assertEqual(data['changes'][2]['data']['description'], 'Вышел из строя НЖМД')
+        self.assertEqual(data['changes'][2]['data']['work_done'], ['Замена комплектующих'])
+        seqs = [change['seq'] for change in data['changes']]
+        self.assertEqual(seqs, sorted(set(seqs)))
+
+    def test_tombstones(self):
+        device = Device.objects.create(inv_num='510100035', title='Dell Inspiron 7577', type=self.dev_type,
+                                       department=self.department)
+        cursor = self.changes()['cursor']
+        Ticket.objects.get(pk=2).delete()
+        device.delete()
+        data = self.changes(since=cursor)
+        self.assertEqual([(change['type'], change['id'], change['deleted']) for change in data['changes']],
+                         [('tickets', 2, True), ('devices', 2, True)])
+        self.assertIsNone(data['changes'][0]['data'])
+        self.assertEqual(self.changes(since=cursor, types='devices')['changes'][0]['id'], 2)
+        # A new client gets the rows there are, no deletions.
+        self.assertFalse(any(change['deleted'] for change in self.changes(since=0)['changes']))
+
+    def test_bulk_writes(self):
+        cursor = self.changes()['cursor']
+        report = DeviceImport([(1, {'inv_num': '510100034', 'title': 'HP ProBook', 'department': 'Божий дар',
+                                    'type': 'АРМ'}, None),
+                               (2, {'inv_num': '510100036', 'title': 'HP ProBook', 'department': 'Божий дар',
+                                    'type': 'АРМ'}, None)]).run()
+        self.assertEqual(report['errors'], [])
+        data = self.changes(since=cursor, types='devices,positions')
+        self.assertEqual(sorted((change['id'], change['data']['title']) for change in data['changes']),
+                         [(1, 'HP ProBook'), (2, 'HP ProBook')])
+        data = self.changes(since=cursor, types='tickets')
+        self.assertEqual([change['data']['device']['title'] for change in data['changes']], ['HP ProBook'] * 2)
+
+    def test_renames_send_rendering_rows(self):
+        Expenditure(position=Position.objects.get(), quantity=2, ticket=Ticket.objects.get(pk=2)).save()
+        cursor = self.changes()['cursor']
+        position = Position.objects.get()
+        position.quantity = 50
+        position.save()
+        self.assertEqual([change['type'] for change in self.changes(since=cursor)['changes']], ['positions'])
+
+        device = Device.objects.get()
+        device.title = 'HP ProBook'
+        device.save()
+        position.title = 'Клавиатура USB'
+        position.save()
+        self.department.title = 'НИИ ЧАВО'
+        self.department.save()
+        self.owner.username = 'anonymous'
+        self.owner.save()
+
+        tickets = [change['data'] for change in self.changes(since=cursor, types='tickets')['changes']]
+        self.assertEqual([ticket['id'] for ticket in tickets], [1, 2])
+        for ticket in tickets:
+            self.assertEqual(ticket['device']['title'], 'HP ProBook')
+            self.assertEqual(ticket['device']['department'], 'НИИ ЧАВО')
+            self.assertEqual(ticket['owner'], 'anonymous')
+        self.assertEqual(tickets[1]['expenditures'][0]['position'], 'Клавиатура USB')
+        devices = self.changes(since=cursor, types='devices')['changes']
+        self.assertEqual(devices[0]['data']['department'], 'НИИ ЧАВО')
+
+    def test_unnumbered_rows(self):
+        # Written before the change sequence.
+        Device.objects.update(change_seq=0)
+        Ticket.objects.filter(pk=2).update(change_seq=0)
+        self.assertEqual([(change['type'], change['id']) for change in self.changes()['changes']],
+                         [('positions', 1), ('tickets', 1)])
+        number_unnumbered()
+        seen = []
+        cursor = 0
+        while True:
+            data = self.changes(since=cursor, limit=1)
+            seen.extend((change['type'], change['id']) for change in data['changes'])
+            cursor = data['cursor']
+            if not data['more']:
+                break
+        self.assertEqual(seen, [('positions', 1), ('tickets', 1), ('tickets', 2), ('devices', 1)])
+        self.assertFalse(Device.objects.filter(change_seq=0).exists())
+
+    def test_invalid_params(self):
+        for params in ({'since': 'x'}, {'since': -1}, {'limit': 'x'}, {'types': 'tickets,users'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,82 @@
+from datetime import date
+from django.urls import reverse
+from django.contrib.auth.models import User
+from rest_framework.test import APITestCase
+from rest_framework import status
+from dj_rest_auth.models import TokenModel
+from api.models import Department, WorkType, Category, Priority, DevType, Device, Ticket
+
+
+class ConditionalGetTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username='anon', password='!QAZ1qaz')
+        department = Department.objects.create(title='Божий дар')
+        work_done = WorkType.objects.create(title='Восстановление работоспособности')
+        priority = Priority.objects.create(number=1, title='Низкий')
+        category = Category.objects.create(title='ИВК')
+        dev_type = DevType.objects.create(title='АРМ')
+        device = Device.objects.create(inv_num='510100034', title='Dell Inspiron 7577',
+                                       department=department, type=dev_type)
+        ticket = Ticket.objects.create(created=date(2022, 2, 20), owner=cls.owner, priority=priority,
+                                       device=device, category=category, description='Не работает клавиша Shift')
+        ticket.work_done.add(work_done)
+
+    def test_etag_and_cache_control(self):
+        res = self.client.get(reverse('ticket-list'))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertRegex(res['ETag'], r'^"[0-9a-f]{40}"$')
+        self.assertEqual(res['Cache-Control'], 'public, no-cache')
+        self.assertIn('Authorization', res['Vary'])
+
+        token = TokenModel.objects.create(user=self.owner)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        res = self.client.get(reverse('ticket-list'))
+        self.assertEqual(res['Cache-Control'], 'private, no-cache')
+
+    def test_not_modified(self):
+        url = reverse('ticket-detail', kwargs={'pk': 1})
+        etag = self.client.get(url)['ETag']
+        # Only the generation counters are read.
+        with self.assertNumQueries(1):
+            res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+        self.assertEqual(res.content, b'')
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=f'"other", W/{etag}')
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_write_changes_etag(self):
+        url = reverse('ticket-list')
+        etag = self.client.get(url)['ETag']
+        department = Department.objects.get()
+        department.title = 'НИИ ЧАВО'
+        department.save()
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json()[0]['device']['department'], 'НИИ ЧАВО')
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_work_done_changes_etag(self):
+        url = reverse('ticket-list')
+        etag = self.client.get(url)['ETag']
+        Ticket.objects.get().work_done.clear()
+        self.assertNotEqual(self.client.get(url)['ETag'], etag)
+
+    def test_unrelated_write_keeps_etag(self):
+        url = reverse('category-list')
+        etag = self.client.get(url)['ETag']
+        Priority.objects.create(number=2, title='Высокий')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_query_string_changes_etag(self):
+        url = reverse('ticket-list')
+        self.assertNotEqual(self.client.get(url, {'status': 1})['ETag'], self.client.get(url, {'status': 0})['ETag'])
+
+    def test_dashboard(self):
+        url = reverse('ticket_per_date')
+        params = {'date_gte': '2022-02-01T00:00:00.000Z', 'date_lte': '2022-02-28T00:00:00.000Z'}
+        etag = self.client.get(url, params)['ETag']
+        res = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
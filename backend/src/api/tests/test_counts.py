@@ -0,0 +1,95 @@
+from unittest import mock
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth.models import User
+from rest_framework.test import APITestCase
+from rest_framework import status
+from api.models import Department, Category, Position, DevType, Device, Ticket
+from api.counts import COUNT_CACHE, estimate_count
+from api.lookups import clear_lookup_caches
+from api.views import TicketViewSet
+
+
+class TotalCountTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username='anon', password='!QAZ1qaz')
+        dev_type = DevType.objects.create(title='АРМ')
+        cls.devices = [Device.objects.create(inv_num=f'51010003{i}', title='Dell Inspiron 7577', type=dev_type,
+                                             department=Department.objects.create(title=title))
+                       for i, title in enumerate(('Божий дар', 'Тьмутаракань'))]
+        cls.category = Category.objects.create(title='ИВК')
+        for day in range(1, 11):
+            Ticket.objects.create(created=f'2022-02-{day:02d}', owner=cls.owner, description='Не работает',
+                                  device=cls.devices[day % 2], category=cls.category, status=day > 3)
+        Position.objects.create(title='Клавиатура', quantity=100)
+        Position.objects.create(title='Мышь', quantity=100)
+
+    def setUp(self):
+        COUNT_CACHE.clear()
+        self.addCleanup(COUNT_CACHE.clear)
+        clear_lookup_caches()
+        self.addCleanup(clear_lookup_caches)
+        self.url = reverse('ticket-list')
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.get(url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK, res.content)
+        return res, [query['sql'] for query in context.captured_queries if 'COUNT(' in query['sql']]
+
+    def test_count(self):
+        res, _ = self.get(self.url, start=0, end=3, sort='id', order='desc', count=1)
+        self.assertEqual(len(res.json()), 3)
+        self.assertEqual(res['X-Total-Count'], '10')
+        self.assertFalse(res.has_header('X-Total-Count-Estimated'))
+
+        res, _ = self.get(self.url, start=0, end=3, status='1', department='Тьмутаракань', count=1)
+        self.assertEqual(res['X-Total-Count'], '3')
+        res, _ = self.get(self.url, cursor='', limit=2, date_gte='2022-02-05T00:00:00', count=1)
+        self.assertEqual(len(res.json()['results']), 2)
+        self.assertEqual(res['X-Total-Count'], '6')
+        res, _ = self.get(self.url, start=0, end=3)
+        self.assertFalse(res.has_header('X-Total-Count'))
+
+    def test_devices_and_positions(self):
+        res, _ = self.get(reverse('device-list'), start=0, end=1, department='Божий дар', count=1)
+        self.assertEqual(res['X-Total-Count'], '1')
+        res, _ = self.get(reverse('position-list'), contains='мышь', count=1)
+        self.assertEqual(res['X-Total-Count'], '1')
+
+    def test_cached_across_pages(self):
+        _, counts = self.get(self.url, start=0, end=3, department='Божий дар', count=1)
+        self.assertEqual(len(counts), 1)
+        res, counts = self.get(self.url, start=3, end=6, sort='created', order='asc', department='Божий дар',
+                               fields='id', count=1)
+        self.assertEqual(counts, [])
+        self.assertEqual(res['X-Total-Count'], '5')
+
+    def test_invalidated_by_writes(self):
+        self.get(self.url, department='Божий дар', count=1)
+        Ticket.objects.create(created='2022-02-11', owner=self.owner, description='Не работает',
+                              device=self.devices[0], category=self.category)
+        res, _ = self.get(self.url, department='Божий дар', count=1)
+        self.assertEqual(res['X-Total-Count'], '6')
+
+        device = Device.objects.get(inv_num='510100031')
+        device.department = Department.objects.get(title='Божий дар')
+        device.save()
+        res, _ = self.get(self.url, department='Божий дар', count=1)
+        self.assertEqual(res['X-Total-Count'], '11')
+
+    def test_estimated(self):
+        with mock.patch.object(TicketViewSet, 'count_exact_limit', 4):
+            res, _ = self.get(self.url, start=0, end=3, count=1)
+        self.assertEqual(res['X-Total-Count'], '10')
+        self.assertEqual(res['X-Total-Count-Estimated'], 'true')
+
+    def test_estimate_count(self):
+        self.assertEqual(estimate_count(Ticket.objects.all(), 4, windows=2), 10)
+        # Sampled from the tickets 1-2 and 6-7, of which the open ones are 6 and 7.
+        self.assertEqual(estimate_count(Ticket.objects.filter(status=True), 4, windows=2), 5)
+        self.assertEqual(estimate_count(Ticket.objects.filter(status=True), 10), 7)
+        self.assertEqual(estimate_count(Ticket.objects.none(), 4), 0)
@@ -0,0 +1,123 @@
+import unittest
+from datetime import date
+from unittest import mock
+from django.urls import reverse
+from django.contrib.auth.models import User
+from rest_framework.test import APITestCase
+from rest_framework import status
+from api.models import Department, Category, DevType, Device, Ticket
+from api.cube import TicketCube, TICKET_CUBE, numpy
+from api.reports import TicketReport
+
+QUARTER = {'date_gte': '2022-01-01T00:00:00', 'date_lte': '2022-03-31T23:59:59'}
+
+
+class TicketCubeTestMixin:
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username='anon', password='!QAZ1qaz')
+        dev_type = DevType.objects.create(title='АРМ')
+        cls.departments = [Department.objects.create(title=title) for title in ('Божий дар', 'Тьмутаракань')]
+        cls.devices = [Device.objects.create(inv_num=f'51010003{i}', title='Dell Inspiron 7577', type=dev_type,
+                                             department=department)
+                       for i, department in enumerate(cls.departments)]
+        cls.categories = [Category.objects.create(title='ИВК'), Category.objects.create(title='Сеть')]
+
+        # created, closed, device, category
+        for created, closed, device, category in (
+                (date(2022, 1, 10), date(2022, 1, 12), 0, 0),
+                (date(2022, 2, 1), None, 0, 0),
+                (date(2022, 2, 15), date(2022, 2, 16), 0, 1),
+                (date(2022, 2, 20), date(2022, 3, 1), 1, 0),
+                (date(2022, 3, 5), None, 1, 1),
+        ):
+            Ticket.objects.create(created=created, closed=closed, status=closed is None, owner=cls.owner,
+                                  description='Не работает', device=cls.devices[device],
+                                  category=cls.categories[category])
+
+    def setUp(self):
+        TICKET_CUBE.clear()
+        self.addCleanup(TICKET_CUBE.clear)
+        self.url = reverse('ticket_cube')
+
+    def cube(self, **params):
+        res = self.client.get(self.url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK, res.content)
+        return res.json()
+
+
+@unittest.skipUnless(numpy, 'NumPy is not installed')
+class TicketCubeTest(TicketCubeTestMixin, APITestCase):
+
+    def test_matches_report(self):
+        for params in ({'dimensions': 'month,department,category', 'measures': 'count,closed_count'},
+                       {'dimensions': 'week', 'measures': 'closed_count'},
+                       {'dimensions': 'category', 'department': 'Тьмутаракань', 'status': '0'},
+                       {'measures': 'count,closed_count'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.cube(**QUARTER, **params)['rows'],
+                                 TicketReport({**QUARTER, **params}).get_rows())
+
+    def test_resolution_days(self):
+        data = self.cube(dimensions='department,status', measures='count,resolution_days')
+        self.assertEqual(data['rows'], [
+            {'department': 'Божий дар', 'status': False, 'count': 2, 'resolution_days': 1.5},
+            {'department': 'Божий дар', 'status': True, 'count': 1, 'resolution_days': None},
+            {'department': 'Тьмутаракань', 'status': False, 'count': 1, 'resolution_days': 9.0},
+            {'department': 'Тьмутаракань', 'status': True, 'count': 1, 'resolution_days': None},
+        ])
+
+    def test_histogram(self):
+        data = self.cube(histogram='resolution_days', bins=4)
+        self.assertEqual(data, {'edges': [1.0, 3.0, 5.0, 7.0, 9.0], 'counts': [2, 0, 0, 1]})
+        data = self.cube(histogram='created', bins=2, category='Сеть')
+        self.assertEqual(data, {'edges': ['2022-02-15', '2022-02-24', '2022-03-05'], 'counts': [1, 1]})
+        self.assertEqual(self.cube(histogram='created', date_gte='2023-01-01T00:00:00'),
+                         {'edges': [], 'counts': []})
+
+    def test_loaded_once(self):
+        self.cube(dimensions='category')
+        # Only the changed tickets are read.
+        with self.assertNumQueries(1):
+            self.cube(dimensions='category')
+
+    def test_kept_current(self):
+        params = {'dimensions': 'department', 'measures': 'count,closed_count'}
+        self.cube(**params)
+        ticket = Ticket.objects.get(created=date(2022, 2, 1))
+        ticket.status = False
+        ticket.closed = date(2022, 2, 3)
+        ticket.save()
+        Ticket.objects.get(created=date(2022, 3, 5)).delete()
+        Ticket.objects.create(created=date(2022, 3, 6), owner=self.owner, description='Не работает',
+                              device=self.devices[1], category=self.categories[0])
+        self.assertEqual(self.cube(**params)['rows'], [
+            {'department': 'Божий дар', 'count': 3, 'closed_count': 3},
+            {'department': 'Тьмутаракань', 'count': 2, 'closed_count': 1},
+        ])
+
+        self.devices[1].department = self.departments[0]
+        self.devices[1].save()
+        self.assertEqual(self.cube(**params)['rows'], [{'department': 'Божий дар', 'count': 5, 'closed_count': 4}])
+
+    def test_reloaded_after_ttl(self):
+        cube = TicketCube(ttl=0)
+        self.assertEqual(cube.group_by(('status',), ('count',), {}), [{'status': False, 'count': 3},
+                                                                     {'status': True, 'count': 2}])
+        Ticket.objects.filter(status=True).update(status=False)
+        self.assertEqual(cube.group_by(('status',), ('count',), {}), [{'status': False, 'count': 5}])
+
+    def test_invalid_params(self):
+        for params in ({'dimensions': 'work_type'}, {'dimensions': 'month,week'}, {'histogram': 'count'},
+                       {'bins': 'x'}, {'date_gte': '2022-01-01'}, {'category': 'Принтеры'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TicketCubeUnavailableTest(TicketCubeTestMixin, APITestCase):
+
+    def test_not_implemented_without_numpy(self):
+        with mock.patch.object(TicketCube, 'available', False):
+            res = self.client.get(self.url, {'dimensions': 'month'})
+        self.assertEqual(res.status_code, status.HTTP_501_NOT_IMPLEMENTED)
@@ -0,0 +1,82 @@
+import csv
+import io
+import json
+from django.urls import reverse
+from django.contrib.auth.models import User
+from rest_framework.test import APITestCase
+from rest_framework import status
+from dj_rest_auth.models import TokenModel
+from api.models import Department, WorkType, Category, Priority, Position, DevType, Device, Ticket, Expenditure
+from api.export import TicketExport
+
+
+class TicketExportTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username='anon', password='!QAZ1qaz')
+        department = Department.objects.create(title='Божий дар')
+        Department.objects.create(title='Тьмутаракань')
+        work_type = WorkType.objects.create(title='Замена комплектующих')
+        priority = Priority.objects.create(number=1, title='Низкий')
+        category = Category.objects.create(title='ИВК')
+        dev_type = DevType.objects.create(title='АРМ')
+        device = Device.objects.create(inv_num='510100034', title='Dell Inspiron 7577', department=department,
+                                       type=dev_type)
+        position = Position.objects.create(title='Клавиатура', quantity=10)
+        for i in range(5):
+            ticket = Ticket.objects.create(created='2022-02-20', owner=cls.owner, description=f'Заявка {i}',
+                                           device=device, priority=priority if i else None, category=category,
+                                           status=bool(i % 2))
+            ticket.work_done.add(work_type)
+            Expenditure.objects.create(position=position, quantity=1, ticket=ticket)
+
+    def setUp(self):
+        token = TokenModel.objects.create(user=self.owner)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.url = reverse('ticket-export')
+
+    def read(self, response):
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_ndjson_matches_detail(self):
+        res = self.client.get(self.url, {'type': 'ndjson'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        tickets = [json.loads(line) for line in self.read(res).splitlines()]
+        self.assertEqual([ticket['id'] for ticket in tickets], [1, 2, 3, 4, 5])
+        self.assertEqual(tickets[1], self.client.get(reverse('ticket-detail', kwargs={'pk': 2})).json())
+        self.assertIsNone(tickets[0]['priority'])
+
+    def test_csv(self):
+        res = self.client.get(self.url)
+        self.assertEqual(res['Content-Disposition'], 'attachment; filename="tickets.csv"')
+        rows = list(csv.DictReader(io.StringIO(self.read(res))))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[1], {
+            'id': '2', 'created': '2022-02-20', 'closed': '', 'owner': 'anon', 'description': 'Заявка 1',
+            'inv_num': '510100034', 'device': 'Dell Inspiron 7577', 'department': 'Божий дар', 'device_type': 'АРМ',
+            'work_done': 'Замена комплектующих', 'priority': 'Низкий', 'expenditures': 'Клавиатура: 1',
+            'category': 'ИВК', 'status': '1',
+        })
+
+    def test_uses_list_filters(self):
+        res = self.client.get(self.url, {'type': 'ndjson', 'status': '1', 'sort': 'id', 'order': 'desc',
+                                         'start': 0, 'end': 1})
+        self.assertEqual([json.loads(line)['id'] for line in self.read(res).splitlines()], [4, 2])
+
+        res = self.client.get(self.url, {'type': 'ndjson', 'description_like': 'заявка'})
+        self.assertEqual(len(self.read(res).splitlines()), 5)
+
+        res = self.client.get(self.url, {'department': 'Тьмутаракань'})
+        self.assertEqual(len(self.read(res).splitlines()), 1)
+
+    def test_unknown_type(self):
+        res = self.client.get(self.url, {'type': 'xlsx'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_queries_per_chunk(self):
+        export = TicketExport(Ticket.objects.all(), chunk_size=2)
+        with self.assertNumQueries(1 + 3 * 2):
+            self.assertEqual(len(list(export.tickets())), 5)
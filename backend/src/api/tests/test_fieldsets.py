@@ -0,0 +1,94 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth.models import User
+from rest_framework.test import APITestCase
+from rest_framework import status
+from api.models import Department, WorkType, Category, Priority, Position, DevType, Device, Ticket, Expenditure
+from api.lookups import clear_lookup_caches
+
+
+class SparseFieldsetTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create(username='anon', password='!QAZ1qaz')
+        device = Device.objects.create(inv_num='510100034', title='Dell Inspiron 7577', type=DevType.objects.create(
+            title='АРМ'), department=Department.objects.create(title='Божий дар'))
+        priority = Priority.objects.create(number=1, title='Низкий')
+        category = Category.objects.create(title='ИВК')
+        work_type = WorkType.objects.create(title='Замена комплектующих')
+        position = Position.objects.create(title='Клавиатура', quantity=100)
+        for day in range(1, 6):
+            ticket = Ticket.objects.create(created=f'2022-02-{day:02d}', owner=owner, description='Не работает',
+                                           device=device, priority=priority, category=category)
+            ticket.work_done.set([work_type])
+            Expenditure(position=position, quantity=1, ticket=ticket).save()
+
+    def setUp(self):
+        clear_lookup_caches()
+        self.addCleanup(clear_lookup_caches)
+        self.url = reverse('ticket-list')
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.get(url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK, res.content)
+        return res, [query['sql'] for query in context.captured_queries]
+
+    def test_fields(self):
+        res, queries = self.get(self.url, fields='id,priority,created,owner,description,category')
+        self.assertEqual(res.json()[0], {'id': 1, 'priority': 'Низкий', 'created': '2022-02-01', 'owner': 'anon',
+                                         'description': 'Не работает', 'category': 'ИВК'})
+        ticket_query = next(sql for sql in queries if 'FROM "api_ticket"' in sql)
+        self.assertNotIn('api_device', ticket_query)
+        self.assertNotIn('"api_ticket"."closed"', ticket_query)
+        self.assertFalse(any('api_expenditure' in sql or 'api_ticket_work_done' in sql for sql in queries))
+
+    def test_nested_fields(self):
+        res, queries = self.get(self.url, fields='id,device.inv_num,device.department,expenditures.quantity')
+        self.assertEqual(res.json()[0], {'id': 1, 'device': {'inv_num': '510100034', 'department': 'Божий дар'},
+                                         'expenditures': [{'quantity': 1}]})
+        self.assertNotIn('"api_device"."title"', next(sql for sql in queries if 'FROM "api_ticket"' in sql))
+        self.assertNotIn('api_position', next(sql for sql in queries if 'FROM "api_expenditure"' in sql))
+
+    def test_collapsed_unless_expanded(self):
+        res, _ = self.get(self.url, fields='id,device,expenditures')
+        self.assertEqual(res.json()[0], {'id': 1, 'device': 1, 'expenditures': [1]})
+        res, _ = self.get(self.url, fields='id,device,expenditures', expand='device')
+        self.assertEqual(res.json()[0]['device'], {'id': 1, 'inv_num': '510100034', 'title': 'Dell Inspiron 7577',
+                                                   'department': 'Божий дар', 'type': 'АРМ'})
+        res, _ = self.get(reverse('ticket-detail', kwargs={'pk': 1}), expand='expenditures')
+        self.assertEqual(res.json()['device'], 1)
+        self.assertEqual(res.json()['expenditures'], [{'id': 1, 'position': 'Клавиатура', 'quantity': 1}])
+        self.assertEqual(res.json()['work_done'], ['Замена комплектующих'])
+
+    def test_unchanged_without_params(self):
+        res, _ = self.get(self.url)
+        self.assertEqual(set(res.json()[0]), {'id', 'created', 'closed', 'owner', 'description', 'device',
+                                              'work_done', 'priority', 'expenditures', 'category', 'status'})
+
+    def test_keyset_pages(self):
+        res, queries = self.get(self.url, fields='id', cursor='', limit=2, sort='created', order='desc')
+        self.assertEqual(res.json()['results'], [{'id': 5}, {'id': 4}])
+        self.assertEqual(len(queries), 2)
+        res = self.client.get(res.json()['next'])
+        self.assertEqual(res.json()['results'], [{'id': 3}, {'id': 2}])
+
+    def test_compact(self):
+        res, _ = self.get(self.url, fields='id,created,device.inv_num,work_done', format='compact')
+        self.assertEqual(res['Content-Type'], 'application/vnd.tickets.compact+json')
+        self.assertEqual(res.json()['columns'], ['id', 'created', 'device.inv_num', 'work_done'])
+        self.assertEqual(res.json()['rows'][0], [1, '2022-02-01', '510100034', ['Замена комплектующих']])
+        res, _ = self.get(reverse('device-list'), fields='inv_num,department', format='compact')
+        self.assertEqual(res.json(), {'columns': ['inv_num', 'department'], 'rows': [['510100034', 'Божий дар']]})
+        res, _ = self.get(reverse('position-detail', kwargs={'pk': 1}), format='compact')
+        self.assertEqual(res.json(), {'columns': ['id', 'title', 'quantity'], 'rows': [[1, 'Клавиатура', 95]]})
+
+    def test_invalid_fields(self):
+        for params in ({'fields': 'id,color'}, {'expand': 'color'}, {'fields': 'owner.username'},
+                       {'fields': 'device.color'}, {'fields': 'id,color', 'format': 'compact'}):
+            with self.subTest(params=params):
+                res = self.client.get(self.url, params)
+                self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('fields', res.json())
@@ -0,0 +1,135 @@
+import json
+from datetime import date
+from unittest import mock
+from django.urls import reverse
+from django.contrib.auth.models import User
+from rest_framework.test import APITestCase
+from rest_framework import status
+from dj_rest_auth.models import TokenModel
+from api.models import Department, WorkType, Category, Priority, DevType, Device, Ticket
+from api.lookups import LookupCache, clear_lookup_caches, get_lookup_cache
+
+
+class LookupCacheTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username='anon', password='!QAZ1qaz')
+        department = Department.objects.create(title='Божий дар')
+        WorkType.objects.create(title='Восстановление работоспособности')
+        WorkType.objects.create(title='Замена комплектующих')
+        Priority.objects.create(number=1, title='Низкий')
+        Category.objects.create(title='ИВК')
+        dev_type = DevType.objects.create(title='АРМ')
+        Device.objects.create(inv_num='510100034', title='Dell Inspiron 7577', department=department, type=dev_type)
+
+    def setUp(self):
+        clear_lookup_caches()
+
+    def test_get(self):
+        cache = get_lookup_cache(Category)
+        with self.assertNumQueries(1):
+            self.assertEqual(cache.get('ИВК').title, 'ИВК')
+            self.assertEqual(cache.get_by_pk(cache.get('ИВК').pk).title, 'ИВК')
+        with self.assertNumQueries(1):
+            with self.assertRaises(Category.DoesNotExist):
+                cache.get('Связь')
+
+    def test_row_created_behind_the_cache(self):
+        cache = get_lookup_cache(Category)
+        cache.all()
+        # Created by another process, no signal reaches this one.
+        Category.objects.bulk_create([Category(title='Связь')])
+        self.assertEqual(cache.get('Связь').title, 'Связь')
+        with self.assertNumQueries(0):
+            self.assertEqual(cache.get('Связь').title, 'Связь')
+            self.assertEqual([category.title for category in cache.all()], ['ИВК', 'Связь'])
+
+
+    def test_export_with_rows_created_behind_the_cache(self):
+        token = TokenModel.objects.create(user=self.owner)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        Ticket.objects.create(created=date(2022, 2, 19), owner=self.owner, description='Не работает',
+                              device=Device.objects.get(), category=Category.objects.get())
+        url = reverse('ticket-export')
+        b''.join(self.client.get(url, {'type': 'ndjson'}).streaming_content)
+        Department.objects.bulk_create([Department(title='НИИ ЧАВО')])
+        Device.objects.update(department=Department.objects.get(title='НИИ ЧАВО'))
+        res = self.client.get(url, {'type': 'ndjson'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        tickets = [json.loads(line) for line in b''.join(res.streaming_content).decode().splitlines()]
+        self.assertEqual([ticket['device']['department'] for ticket in tickets], ['НИИ ЧАВО'])
+
+    def test_invalidation(self):
+        cache = get_lookup_cache(Category)
+        category = cache.get('ИВК')
+        Category.objects.create(title='Связь')
+        self.assertEqual(cache.get('Связь').title, 'Связь')
+        Category.objects.get(title='ИВК').delete()
+        with self.assertRaises(Category.DoesNotExist):
+            cache.get('ИВК')
+        self.assertNotIn(category, cache.all())
+
+    def test_ttl(self):
+        cache = LookupCache(Category, ttl=60)
+        cache.all()
+        Category.objects.filter(title='ИВК').update(title='Связь')
+        self.assertEqual(cache.get('ИВК').title, 'ИВК')
+        with mock.patch('api.lookups.time.monotonic', return_value=cache.loaded_at + 61):
+            self.assertEqual(cache.get('Связь').title, 'Связь')
+
+    def test_bounded(self):
+        cache = LookupCache(WorkType, maxsize=1)
+        self.assertEqual(len(cache.all()), 2)
+        cache.get('Восстановление работоспособности')
+        with self.assertNumQueries(0):
+            cache.get('Восстановление работоспособности')
+        cache.get('Замена комплектующих')
+        self.assertEqual(len(cache.by_slug), 1)
+        with self.assertRaises(WorkType.DoesNotExist):
+            cache.get('Обмотать изолентой')
+
+    def test_lookup_list_served_from_cache(self):
+        self.client.get(reverse('category-list'))
+        # Only the table generation for the ETag.
+        with self.assertNumQueries(1):
+            res = self.client.get(reverse('category-list'))
+        self.assertEqual(res.json(), [{'id': 1, 'title': 'ИВК'}])
+
+    def test_ticket_write_resolves_slugs_from_cache(self):
+        token = TokenModel.objects.create(user=self.owner)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        data = {
+            'created': '2022-02-20',
+            'closed': None,
+            'owner': 'anon',
+            'description': 'Вышел из строя НЖМД',
+            'device': {'inv_num': '510100034', 'title': 'Dell Inspiron 7577', 'department': 'Божий дар',
+                       'type': 'АРМ'},
+            'work_done': ['Восстановление работоспособности', 'Замена комплектующих'],
+            'priority': 'Низкий',
+            'expenditures': [],
+            'category': 'ИВК',
+            'status': True
+        }
+        res = self.client.post(reverse('ticket-list'), data=data, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.json()['work_done'], data['work_done'])
+        with self.assertNumQueries(0):
+            get_lookup_cache(WorkType).get('Замена комплектующих')
+            get_lookup_cache(Priority).get('Низкий')
+
+        data['priority'] = 'Нет такого'
+        res = self.client.post(reverse('ticket-list'), data=data, format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('priority', res.json())
+
+    def test_ticket_read_renders_titles_from_cache(self):
+        Ticket.objects.create(created=date(2022, 2, 20), owner=self.owner, device=Device.objects.get(),
+                              category=Category.objects.get(), priority=Priority.objects.get(),
+                              description='Не работает клавиша Shift')
+        self.client.get(reverse('ticket-detail', kwargs={'pk': 1}))
+        with self.assertNumQueries(4):
+            res = self.client.get(reverse('ticket-detail', kwargs={'pk': 1}))
+        self.assertEqual((res.json()['priority'], res.json()['category']), ('Низкий', 'ИВК'))
+        self.assertEqual(res.json()['device']['department'], 'Божий дар')
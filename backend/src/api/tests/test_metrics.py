@@ -0,0 +1,113 @@
+from django.test import override_settings
+from django.urls import reverse
+from django.contrib.auth.models import User
+from rest_framework.test import APITestCase
+from rest_framework import status
+from dj_rest_auth.models import TokenModel
+from api.models import Department, Category, DevType, Device, Ticket
+from api.metrics import REGISTRY, MetricsRegistry, UNRESOLVED_ROUTE
+from api.tests.utils import time_concurrent
+
+
+class MetricsMiddlewareTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username='anon', password='!QAZ1qaz')
+        device = Device.objects.create(inv_num='510100034', title='Dell Inspiron 7577',
+                                       department=Department.objects.create(title='Божий дар'),
+                                       type=DevType.objects.create(title='АРМ'))
+        category = Category.objects.create(title='ИВК')
+        for i in range(3):
+            Ticket.objects.create(created='2022-02-20', owner=cls.owner, description=f'Заявка {i}', device=device,
+                                  category=category, status=True)
+
+    def setUp(self):
+        self.token = TokenModel.objects.create(user=self.owner)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        REGISTRY.clear()
+
+    def metrics(self, route, method='GET', status_code=200):
+        return REGISTRY.routes[(route, method, status_code)]
+
+    def test_records_route(self):
+        res = self.client.get(reverse('ticket-list'))
+        self.client.get(reverse('ticket-list'))
+        metrics = self.metrics('ticket-list')
+        self.assertEqual(metrics.count, 2)
+        self.assertEqual(sum(metrics.buckets), 2)
+        self.assertGreater(metrics.duration, 0)
+        self.assertGreater(metrics.queries, 0)
+        self.assertGreater(metrics.db_time, 0)
+        self.assertEqual(metrics.response_bytes, 2 * len(res.content))
+
+    def test_status_and_unresolved(self):
+        self.client.get(reverse('ticket-detail', kwargs={'pk': 100}))
+        self.client.get('/no/such/page/')
+        self.assertEqual(self.metrics('ticket-detail', status_code=404).count, 1)
+        self.assertEqual(self.metrics(UNRESOLVED_ROUTE, status_code=404).count, 1)
+
+    def test_streaming_recorded_when_sent(self):
+        res = self.client.get(reverse('ticket-export'), {'type': 'ndjson'})
+        self.assertNotIn(('ticket-export', 'GET', 200), REGISTRY.routes)
+        content = b''.join(res.streaming_content)
+        self.assertEqual(self.metrics('ticket-export').response_bytes, len(content))
+
+    async def test_asgi(self):
+        res = await self.async_client.get(reverse('ticket-list'), authorization=f'Token {self.token.key}')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        metrics = self.metrics('ticket-list')
+        self.assertEqual(metrics.count, 1)
+        # Counted in the thread the sync view runs in.
+        self.assertGreater(metrics.queries, 0)
+        self.assertEqual(metrics.response_bytes, len(res.content))
+
+    @override_settings(ROOT_URLCONF='api.tests.utils', MIDDLEWARE=['api.metrics.MetricsMiddleware'])
+    async def test_asgi_requests_run_concurrently(self):
+        elapsed, responses = await time_concurrent(self.async_client, '/slow/', 4)
+        self.assertEqual({res.status_code for res in responses}, {status.HTTP_200_OK})
+        self.assertLess(elapsed, 0.6)
+        self.assertEqual(self.metrics('slow').count, 4)
+
+        res = await self.async_client.get('/stream/')
+        self.assertNotIn(('stream', 'GET', 200), REGISTRY.routes)
+        content = b''.join(res.streaming_content)
+        self.assertEqual(self.metrics('stream').response_bytes, len(content))
+
+    def test_exposition(self):
+        self.client.get(reverse('ticket-list'))
+        res = self.client.get(reverse('metrics'))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['Content-Type'].startswith('text/plain; version=0.0.4'))
+        lines = res.content.decode('utf-8').splitlines()
+        labels = 'route="ticket-list",method="GET",status="200"'
+        self.assertIn('# TYPE api_request_duration_seconds histogram', lines)
+        self.assertIn(f'api_request_duration_seconds_bucket{{{labels},le="+Inf"}} 1', lines)
+        self.assertIn(f'api_request_duration_seconds_count{{{labels}}} 1', lines)
+        self.assertTrue(any(line.startswith(f'api_request_db_queries_total{{{labels}}} ') for line in lines))
+        # Scrapes are not recorded themselves.
+        self.assertNotIn('route="metrics"', res.content.decode('utf-8'))
+
+    def test_forbidden_for_remote_address(self):
+        res = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class MetricsRegistryTest(APITestCase):
+
+    def test_buckets_are_cumulative(self):
+        registry = MetricsRegistry(buckets=(0.1, 1.0))
+        for duration in (0.05, 0.1, 0.5, 3.0):
+            registry.observe('route', 'GET', 200, duration, 1, 0.01, 10)
+        lines = registry.render().splitlines()
+        labels = 'route="route",method="GET",status="200"'
+        self.assertIn(f'api_request_duration_seconds_bucket{{{labels},le="0.1"}} 2', lines)
+        self.assertIn(f'api_request_duration_seconds_bucket{{{labels},le="1.0"}} 3', lines)
+        self.assertIn(f'api_request_duration_seconds_bucket{{{labels},le="+Inf"}} 4', lines)
+        self.assertIn(f'api_request_db_queries_total{{{labels}}} 4', lines)
+        self.assertIn(f'api_response_bytes_total{{{labels}}} 40', lines)
+
+    def test_label_escaping(self):
+        registry = MetricsRegistry()
+        registry.observe('a"b\\c\nd', 'GET', 200, 0.01, 0, 0.0, 0)
+        self.assertIn('route="a\\"b\\\\c\\nd"', registry.render())
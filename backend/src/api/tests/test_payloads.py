@@ -0,0 +1,150 @@
+import gzip
+import io
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from unittest import mock
+from uuid import UUID
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from django.contrib.auth.models import User
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+from rest_framework import status
+from api import parsers, renderers
+from api.lookups import clear_lookup_caches
+from api.compression import choose_encoding, parse_accept_encoding
+from api.models import Department, Category, DevType, Device, Ticket
+from api.parsers import FastJSONParser
+from api.renderers import FastJSONRenderer
+from api.tests.utils import time_concurrent
+
+
+class FastJSONTest(APITestCase):
+    data = {
+        'decimal': Decimal('1.50'),
+        'date': date(2022, 2, 1),
+        'datetime': datetime(2022, 2, 1, 10, 30, 0, 123456, tzinfo=timezone.utc),
+        'naive': datetime(2022, 2, 1, 10, 30),
+        'time': time(10, 30),
+        'duration': timedelta(days=1, seconds=5),
+        'uuid': UUID('12345678-1234-5678-1234-567812345678'),
+        'lazy': gettext_lazy('Not found.'),
+        'text': 'Не работает ',
+        'nested': [{'id': 1, 'tags': ('a', 'b')}, None, True, 1.5],
+        1: 'int key',
+    }
+
+    def test_matches_json_renderer(self):
+        for data in (self.data, [self.data], {}, [], 'text', 0):
+            with self.subTest(data=data):
+                self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_indent(self):
+        rendered = FastJSONRenderer().render({'id': 1}, 'application/json; indent=2')
+        self.assertEqual(rendered, b'{\n  "id": 1\n}')
+
+    def test_without_orjson(self):
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+        with mock.patch.object(parsers, 'orjson', None):
+            self.assertEqual(FastJSONParser().parse(io.BytesIO(b'{"id": 1}')), {'id': 1})
+
+    def test_parse(self):
+        body = '{"description": "Не работает", "quantity": 1.5, "work_done": [1, 2]}'
+        self.assertEqual(FastJSONParser().parse(io.BytesIO(body.encode('utf-8'))),
+                         {'description': 'Не работает', 'quantity': 1.5, 'work_done': [1, 2]})
+        self.assertEqual(FastJSONParser().parse(io.BytesIO(body.encode('cp1251')), None, {'encoding': 'cp1251'}),
+                         {'description': 'Не работает', 'quantity': 1.5, 'work_done': [1, 2]})
+        for body in (b'{"id": ', b'{"id": NaN}', b'\xff'):
+            with self.subTest(body=body):
+                with self.assertRaises(ParseError):
+                    FastJSONParser().parse(io.BytesIO(body))
+
+
+class CompressionMiddlewareTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create(username='anon', password='!QAZ1qaz')
+        device = Device.objects.create(inv_num='510100034', title='Dell Inspiron 7577', type=DevType.objects.create(
+            title='АРМ'), department=Department.objects.create(title='Божий дар'))
+        category = Category.objects.create(title='ИВК')
+        for day in range(1, 21):
+            Ticket.objects.create(created=f'2022-02-{day:02d}', owner=owner, description='Не работает',
+                                  device=device, category=category)
+
+    def setUp(self):
+        clear_lookup_caches()
+        self.addCleanup(clear_lookup_caches)
+        self.url = reverse('ticket-list')
+
+    def test_negotiation(self):
+        self.assertEqual(parse_accept_encoding('gzip;q=0.5, BR, deflate;q=x'), {'gzip': 0.5, 'br': 1.0,
+                                                                                'deflate': 0.0})
+        for value, encoding in (('gzip', 'gzip'), ('gzip, deflate, br', 'gzip'), ('*', 'gzip'),
+                                ('gzip;q=0', None), ('*, gzip;q=0', None), ('identity', None), ('', None)):
+            with self.subTest(value=value):
+                self.assertEqual(choose_encoding(value), encoding)
+        with mock.patch('api.compression.brotli', object()):
+            self.assertEqual(choose_encoding('gzip, br'), 'br')
+            self.assertEqual(choose_encoding('gzip, br;q=0.5'), 'gzip')
+
+    def test_gzip(self):
+        plain = self.client.get(self.url)
+        res = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(int(res['Content-Length']), len(res.content))
+        self.assertLess(len(res.content), len(plain.content))
+        self.assertEqual(gzip.decompress(res.content), plain.content)
+        self.assertIn('Accept-Encoding', res['Vary'])
+        self.assertIn('Accept-Encoding', plain['Vary'])
+        self.assertFalse(plain.has_header('Content-Encoding'))
+
+    def test_refused(self):
+        res = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip;q=0, br;q=0')
+        self.assertFalse(res.has_header('Content-Encoding'))
+
+    def test_small_responses(self):
+        res = self.client.get(reverse('ticket-detail', kwargs={'pk': 1}), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(res.has_header('Content-Encoding'))
+        self.assertNotIn('Accept-Encoding', res.get('Vary', ''))
+        with override_settings(COMPRESSION_MIN_SIZE=0):
+            res = self.client.get(reverse('ticket-detail', kwargs={'pk': 1}), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+
+    def test_weak_etag(self):
+        res = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertTrue(res['ETag'].startswith('W/"'))
+        res = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertFalse(res.has_header('Content-Encoding'))
+
+    def test_streaming(self):
+        params = {'type': 'ndjson', 'date_gte': '2022-02-01T00:00:00', 'date_lte': '2022-02-28T00:00:00'}
+        plain = b''.join(self.client.get(reverse('ticket-export'), params).streaming_content)
+        res = self.client.get(reverse('ticket-export'), params, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertFalse(res.has_header('Content-Length'))
+        self.assertEqual(gzip.decompress(b''.join(res.streaming_content)), plain)
+
+    async def test_asgi(self):
+        plain = await self.async_client.get(self.url)
+        res = await self.async_client.get(self.url, **{'accept-encoding': 'gzip'})
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(res.content), plain.content)
+
+    @override_settings(ROOT_URLCONF='api.tests.utils', MIDDLEWARE=['api.compression.CompressionMiddleware'])
+    async def test_asgi_requests_run_concurrently(self):
+        elapsed, responses = await time_concurrent(self.async_client, '/slow/', 4)
+        self.assertEqual({res['Content-Encoding'] for res in responses}, {'gzip'})
+        self.assertLess(elapsed, 0.6)
+
+        plain = b''.join((await self.async_client.get('/stream/')).streaming_content)
+        res = await self.async_client.get('/stream/', **{'accept-encoding': 'gzip'})
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(res.streaming_content)), plain)
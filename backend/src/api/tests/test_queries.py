@@ -0,0 +1,200 @@
+import re
+import unittest
+from datetime import date
+from rest_framework.test import APITestCase
+from rest_framework import status
+from django.db import connection
+from django.urls import reverse
+from django.contrib.auth.models import User
+from api.models import Department, WorkType, Category, Priority, Position, DevType, \
+    Device, Ticket, Expenditure
+from api.tests.utils import QueryBudgetMixin
+
+
+# Queries allowed per anonymous GET with warm lookup caches, independent of the number of rows returned.
+# Every endpoint reads its table generations first, see api.conditional.
+QUERY_BUDGETS = {
+    'ticket-list': 4,
+    'ticket-detail': 4,
+    'user-list': 3,
+    'user-detail': 3,
+    'device-list': 2,
+    'device-detail': 2,
+    'expenditure-list': 2,
+    'expenditure-detail': 2,
+    'position-list': 2,
+    'position-detail': 2,
+    'department-list': 1,
+    'department-detail': 2,
+    'worktype-list': 1,
+    'worktype-detail': 2,
+    'category-list': 1,
+    'category-detail': 2,
+    'priority-list': 1,
+    'priority-detail': 2,
+    'devtype-list': 1,
+    'devtype-detail': 2,
+}
+
+DATES = {'date_gte': '2022-01-01T00:00:00', 'date_lte': '2022-12-31T23:59:59'}
+
+# Filter and sort combinations sent by the frontend, every query they run must be served by an index.
+QUERY_PLAN_CASES = (
+    ('ticket-list', {'status': '1', 'sort': 'id', 'order': 'desc', 'start': 0, 'end': 30}),
+    ('ticket-list', {'status': '1', 'sort': 'created', 'order': 'desc', 'start': 0, 'end': 30}),
+    ('ticket-list', {'status': '1', 'sort': 'id', 'order': 'desc', 'cursor': ''}),
+    ('ticket-list', {**DATES, 'sort': 'id', 'order': 'asc', 'start': 0, 'end': 30}),
+    ('ticket-list', {**DATES, 'status': '1', 'sort': 'created', 'order': 'desc', 'start': 0, 'end': 30}),
+    ('ticket-list', {**DATES, 'status': '0', 'sort': 'closed', 'order': 'desc', 'start': 0, 'end': 30}),
+    ('ticket-list', {**DATES, 'status': '1', 'department': 'Божий дар', 'sort': 'id', 'order': 'asc'}),
+    ('ticket-list', {**DATES, 'department': 'Божий дар', 'sort': 'priority', 'order': 'asc', 'cursor': ''}),
+    ('ticket-list', {**DATES, 'inventory_like': '5101', 'sort': 'id', 'order': 'asc'}),
+    ('ticket-export', {**DATES, 'status': '0', 'type': 'ndjson'}),
+    ('device-list', {'department': 'Божий дар'}),
+    ('device-list', {'department': 'Божий дар', 'type': 'АРМ', 'sort': 'inv_num', 'order': 'asc'}),
+    ('device-list', {'type': 'АРМ', 'sort': 'title', 'order': 'desc', 'start': 0, 'end': 30}),
+    ('device-list', {'inventory_like': '5101'}),
+)
+
+SCAN = re.compile(r'^SCAN (\w+)(?: USING (?:COVERING )?INDEX (\w+))?')
+
+
+class QueryBudgetTest(QueryBudgetMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username='anon', password='!QAZ1qaz')
+        cls.department = Department.objects.create(title='Божий дар')
+        cls.work_types = [WorkType.objects.create(title='Восстановление работоспособности'),
+                          WorkType.objects.create(title='Замена комплектующих')]
+        cls.priority = Priority.objects.create(number=1, title='Низкий')
+        cls.category = Category.objects.create(title='ИВК')
+        cls.dev_type = DevType.objects.create(title='АРМ')
+        cls.position = Position.objects.create(title='Клавиатура', quantity=1000)
+        cls.add_tickets(5)
+
+    @classmethod
+    def add_tickets(cls, count):
+        start = Ticket.objects.count()
+        for i in range(start, start + count):
+            device = Device.objects.create(inv_num=f'5101000{i}', title=f'Dell Inspiron {i}',
+                                           department=cls.department, type=cls.dev_type)
+            ticket = Ticket.objects.create(created=date(2022, 2, 20), owner=cls.owner, priority=cls.priority,
+                                           device=device, category=cls.category,
+                                           description=f'Не работает клавиша Shift {i}')
+            ticket.work_done.add(*cls.work_types)
+            Expenditure(position=cls.position, quantity=1, ticket=ticket).save()
+
+    def check_budget(self, name, kwargs=None, params=None):
+        url = reverse(name, kwargs=kwargs)
+        self.client.get(url, params)
+        with self.assertQueryBudget(QUERY_BUDGETS[name]):
+            res = self.client.get(url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res
+
+    def test_list_budgets(self):
+        for name in QUERY_BUDGETS:
+            if name.endswith('-list'):
+                with self.subTest(name=name):
+                    self.check_budget(name)
+
+    def test_detail_budgets(self):
+        for name in QUERY_BUDGETS:
+            if name.endswith('-detail'):
+                with self.subTest(name=name):
+                    self.check_budget(name, kwargs={'pk': 1})
+
+    def test_ticket_list_does_not_grow_with_page_size(self):
+        self.add_tickets(45)
+        res = self.check_budget('ticket-list', params={'sort': 'id', 'order': 'asc', 'start': 0, 'end': 50})
+        self.assertEqual(len(res.json()), 50)
+        res = self.check_budget('ticket-list', params={'sort': 'id', 'order': 'asc', 'cursor': '', 'limit': 50})
+        self.assertEqual(len(res.json()['results']), 50)
+
+    def test_budget_exceeded(self):
+        with self.assertRaises(AssertionError):
+            with self.assertQueryBudget(1):
+                list(Ticket.objects.all())
+                list(Device.objects.all())
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'Reads SQLite query plans')
+class QueryPlanTest(APITestCase):
+    """
+    Runs EXPLAIN QUERY PLAN for every query of the list endpoints and fails on a full scan of a table or of
+    an index. Scanning a partial index reads only the rows the filter selects and is allowed.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create(username='anon', password='!QAZ1qaz')
+        department = Department.objects.create(title='Божий дар')
+        dev_type = DevType.objects.create(title='АРМ')
+        category = Category.objects.create(title='ИВК')
+        for i in range(3):
+            device = Device.objects.create(inv_num=f'5101000{i}', title=f'Dell Inspiron {i}', department=department,
+                                           type=dev_type)
+            Ticket.objects.create(created=date(2022, 2, 20), owner=owner, device=device, category=category,
+                                  description=f'Не работает клавиша Shift {i}', status=bool(i % 2))
+
+        cls.partial_indexes = {index.name for model in (Ticket, Device) for index in model._meta.indexes
+                               if index.condition is not None}
+
+    def get_plans(self, name, params):
+        queries = []
+
+        def capture(execute, sql, sql_params, many, context):
+            queries.append((sql, sql_params))
+            return execute(sql, sql_params, many, context)
+
+        def fetch():
+            res = self.client.get(reverse(name), params)
+            if res.streaming:
+                b''.join(res.streaming_content)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        # Lookup tables are read whole once per process, only the queries of a request with warm caches count.
+        fetch()
+        with connection.execute_wrapper(capture):
+            fetch()
+
+        plans = []
+        with connection.cursor() as cursor:
+            for sql, sql_params in queries:
+                if sql.startswith('SELECT'):
+                    cursor.execute(f'EXPLAIN QUERY PLAN {sql}', sql_params)
+                    plans.append((sql, [row[-1] for row in cursor.fetchall()]))
+        return plans
+
+    def full_scans(self, plan):
+        scans = []
+        for step in plan:
+            match = SCAN.match(step)
+            if match and match.group(2) not in self.partial_indexes:
+                scans.append(step)
+        return scans
+
+    def test_no_full_scans(self):
+        for name, params in QUERY_PLAN_CASES:
+            with self.subTest(name=name, params=params):
+                for sql, plan in self.get_plans(name, params):
+                    scans = self.full_scans(plan)
+                    self.assertFalse(scans, f'{", ".join(scans)} in\n{sql}')
+
+    def test_composite_indexes_used(self):
+        cases = (
+            ('ticket-list', {**DATES, 'status': '1'}, 'ticket_open_created'),
+            ('ticket-list', {**DATES, 'status': '0'}, 'ticket_closed_created'),
+            ('ticket-list', {'status': '1', 'sort': 'id', 'order': 'asc', 'cursor': ''}, 'ticket_open_id'),
+            ('ticket-list', {**DATES, 'status': '1', 'department': 'Божий дар'}, 'ticket_device_created_status'),
+            ('device-list', {'department': 'Божий дар', 'type': 'АРМ'}, 'device_department_type'),
+        )
+        for name, params, index in cases:
+            with self.subTest(name=name, params=params):
+                steps = [step for sql, plan in self.get_plans(name, params) for step in plan]
+                self.assertTrue(any(index in step for step in steps), steps)
+
+    def test_full_scan_detected(self):
+        plan = self.get_plans('ticket-list', {'description_like': '', 'sort': 'description', 'order': 'asc'})
+        self.assertTrue(any(self.full_scans(steps) for sql, steps in plan))
@@ -0,0 +1,136 @@
+from datetime import date
+from django.urls import reverse
+from django.contrib.auth.models import User
+from rest_framework.test import APITestCase
+from rest_framework import status
+from api.models import Department, WorkType, Category, Position, DevType, Device, Ticket, Expenditure
+from api.reports import REPORT_CACHE
+
+FEBRUARY = {'date_gte': '2022-02-01T00:00:00', 'date_lte': '2022-02-28T23:59:59'}
+QUARTER = {'date_gte': '2022-01-01T00:00:00', 'date_lte': '2022-03-31T23:59:59'}
+
+
+class TicketReportTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username='anon', password='!QAZ1qaz')
+        dev_type = DevType.objects.create(title='АРМ')
+        cls.devices = [Device.objects.create(inv_num=f'51010003{i}', title='Dell Inspiron 7577', type=dev_type,
+                                             department=Department.objects.create(title=title))
+                       for i, title in enumerate(('Божий дар', 'Тьмутаракань'))]
+        cls.categories = [Category.objects.create(title='ИВК'), Category.objects.create(title='Сеть')]
+        cls.work_types = [WorkType.objects.create(title='Восстановление работоспособности'),
+                          WorkType.objects.create(title='Замена комплектующих')]
+        cls.positions = [Position.objects.create(title='Клавиатура', quantity=100),
+                         Position.objects.create(title='Мышь', quantity=100)]
+
+        # created, device, category, closed, work types, expenditures
+        for created, device, category, closed, work_types, expenditures in (
+                (date(2022, 1, 10), 0, 0, True, [0], []),
+                (date(2022, 2, 1), 0, 0, False, [0, 1], [(0, 2), (1, 1)]),
+                (date(2022, 2, 15), 0, 1, True, [1], [(0, 3)]),
+                (date(2022, 2, 20), 1, 0, True, [], [(1, 5)]),
+                (date(2022, 3, 5), 1, 1, False, [0], []),
+        ):
+            ticket = Ticket.objects.create(created=created, owner=cls.owner, description='Не работает',
+                                           device=cls.devices[device], category=cls.categories[category],
+                                           status=not closed)
+            ticket.work_done.set([cls.work_types[i] for i in work_types])
+            for position, quantity in expenditures:
+                Expenditure(position=cls.positions[position], quantity=quantity, ticket=ticket).save()
+
+    def setUp(self):
+        REPORT_CACHE.clear()
+        self.url = reverse('ticket_report')
+
+    def report(self, **params):
+        res = self.client.get(self.url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK, res.content)
+        return res.json()
+
+    def test_category_department_month(self):
+        data = self.report(**QUARTER, dimensions='month,department,category', measures='count,closed_count')
+        self.assertEqual(data['dimensions'], ['month', 'department', 'category'])
+        self.assertEqual(data['rows'], [
+            {'month': '2022-01-01', 'department': 'Божий дар', 'category': 'ИВК', 'count': 1, 'closed_count': 1},
+            {'month': '2022-02-01', 'department': 'Божий дар', 'category': 'ИВК', 'count': 1, 'closed_count': 0},
+            {'month': '2022-02-01', 'department': 'Божий дар', 'category': 'Сеть', 'count': 1, 'closed_count': 1},
+            {'month': '2022-02-01', 'department': 'Тьмутаракань', 'category': 'ИВК', 'count': 1,
+             'closed_count': 1},
+            {'month': '2022-03-01', 'department': 'Тьмутаракань', 'category': 'Сеть', 'count': 1,
+             'closed_count': 0},
+        ])
+
+    def test_work_types(self):
+        data = self.report(**FEBRUARY, dimensions='work_type', measures='count')
+        self.assertEqual(data['rows'], [
+            {'work_type': None, 'count': 1},
+            {'work_type': 'Восстановление работоспособности', 'count': 1},
+            {'work_type': 'Замена комплектующих', 'count': 2},
+        ])
+
+    def test_expenditures_by_position(self):
+        data = self.report(**QUARTER, dimensions='position', measures='expenditure_quantity,count')
+        self.assertEqual(data['measures'], ['count', 'expenditure_quantity'])
+        self.assertEqual(data['rows'], [
+            {'position': None, 'count': 2, 'expenditure_quantity': 0},
+            {'position': 'Клавиатура', 'count': 2, 'expenditure_quantity': 5},
+            {'position': 'Мышь', 'count': 2, 'expenditure_quantity': 6},
+        ])
+
+    def test_totals_are_not_multiplied_by_joins(self):
+        data = self.report(**FEBRUARY, dimensions='work_type', measures='count,expenditure_quantity')
+        self.assertEqual(data['rows'][2], {'work_type': 'Замена комплектующих', 'count': 2,
+                                           'expenditure_quantity': 6})
+        data = self.report(**FEBRUARY, measures='count,closed_count,expenditure_quantity')
+        self.assertEqual(data['rows'], [{'count': 3, 'closed_count': 2, 'expenditure_quantity': 11}])
+
+    def test_filters(self):
+        data = self.report(**QUARTER, dimensions='month', department='Тьмутаракань', status='0')
+        self.assertEqual(data['rows'], [{'month': '2022-02-01', 'count': 1}])
+
+    def test_invalid_params(self):
+        for params in ({}, {**QUARTER, 'dimensions': 'owner'}, {**QUARTER, 'dimensions': 'month,week'},
+                       {**QUARTER, 'measures': ''}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_cached_per_normalized_params(self):
+        self.report(**QUARTER, dimensions='month,category', measures='count,closed_count')
+        # Only the generations are read.
+        with self.assertNumQueries(1):
+            self.report(**QUARTER, dimensions=' category,month', measures='closed_count,count')
+
+    def test_invalidated_by_changes_in_range(self):
+        params = {'dimensions': 'month', 'measures': 'count,closed_count,expenditure_quantity'}
+        self.report(**FEBRUARY, **params)
+        march = self.report(date_gte='2022-03-01T00:00:00', date_lte='2022-03-31T23:59:59', **params)
+
+        ticket = Ticket.objects.get(created=date(2022, 2, 15))
+        ticket.status = True
+        ticket.save()
+        self.assertEqual(self.report(**FEBRUARY, **params)['rows'],
+                         [{'month': '2022-02-01', 'count': 3, 'closed_count': 1, 'expenditure_quantity': 11}])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.report(date_gte='2022-03-01T00:00:00', date_lte='2022-03-31T23:59:59',
+                                         **params), march)
+
+        Expenditure(position=self.positions[0], quantity=4, ticket=ticket).save()
+        self.assertEqual(self.report(**FEBRUARY, **params)['rows'][0]['expenditure_quantity'], 15)
+
+        ticket.created = date(2022, 3, 1)
+        ticket.save()
+        self.assertEqual(self.report(**FEBRUARY, **params)['rows'][0]['count'], 2)
+        self.assertEqual(self.report(date_gte='2022-03-01T00:00:00', date_lte='2022-03-31T23:59:59',
+                                     **params)['rows'][0]['count'], 2)
+
+    def test_invalidated_by_work_done(self):
+        params = {**FEBRUARY, 'dimensions': 'work_type'}
+        self.report(**params)
+        ticket = Ticket.objects.get(created=date(2022, 2, 20))
+        ticket.work_done.add(self.work_types[0])
+        self.assertEqual(self.report(**params)['rows'][0], {'work_type': 'Восстановление работоспособности',
+                                                            'count': 2})
+        self.work_types[0].tickets.remove(ticket)
+        self.assertEqual(self.report(**params)['rows'][0], {'work_type': None, 'count': 1})
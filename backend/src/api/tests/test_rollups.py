@@ -0,0 +1,184 @@
+from io import StringIO
+from datetime import date
+from django.core.management import call_command
+from django.db.models import Sum
+from django.urls import reverse
+from django.contrib.auth.models import User
+from rest_framework.test import APITestCase
+from api.models import Department, Category, DevType, Device, Ticket, TicketDailyCount
+from api.rollups import install_daily_counts
+
+
+class TicketDailyCountTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username='anon', password='!QAZ1qaz')
+        cls.departments = [Department.objects.create(title='Божий дар'), Department.objects.create(title='НИИ ЧАВО')]
+        cls.categories = [Category.objects.create(title='ИВК'), Category.objects.create(title='Связь')]
+        dev_type = DevType.objects.create(title='АРМ')
+        cls.devices = [Device.objects.create(inv_num=f'51010003{i}', title='Dell Inspiron 7577',
+                                             department=department, type=dev_type)
+                       for i, department in enumerate(cls.departments)]
+
+    def create_ticket(self, day, device=0, category=0, status=True):
+        return Ticket.objects.create(created=day, owner=self.owner, device=self.devices[device],
+                                     category=self.categories[category], description='Не работает клавиша Shift',
+                                     status=status)
+
+    def counters(self):
+        return list(TicketDailyCount.objects.exclude(open_count=0, closed_count=0)
+                    .order_by('day', 'department', 'category')
+                    .values_list('day', 'department', 'category', 'open_count', 'closed_count'))
+
+    def rebuilt_counters(self):
+        call_command('rebuild_ticket_counts', stdout=StringIO())
+        return self.counters()
+
+    def test_create(self):
+        self.create_ticket(date(2022, 2, 20))
+        self.create_ticket(date(2022, 2, 20))
+        self.create_ticket(date(2022, 2, 21), device=1, category=1, status=False)
+        counter = TicketDailyCount.objects.get(day=date(2022, 2, 20))
+        self.assertEqual((counter.open_count, counter.closed_count), (2, 0))
+        counter = TicketDailyCount.objects.get(day=date(2022, 2, 21))
+        self.assertEqual((counter.department, counter.category), (self.departments[1], self.categories[1]))
+        self.assertEqual((counter.open_count, counter.closed_count), (0, 1))
+
+    def test_close_and_reopen(self):
+        ticket = self.create_ticket(date(2022, 2, 20))
+        ticket = Ticket.objects.get(pk=ticket.pk)
+        ticket.status = False
+        ticket.closed = date(2022, 2, 22)
+        ticket.save()
+        counter = TicketDailyCount.objects.get()
+        self.assertEqual((counter.open_count, counter.closed_count), (0, 1))
+        ticket.status = True
+        ticket.save()
+        counter.refresh_from_db()
+        self.assertEqual((counter.open_count, counter.closed_count), (1, 0))
+
+    def test_move_and_delete(self):
+        ticket = self.create_ticket(date(2022, 2, 20))
+        ticket.created = date(2022, 3, 1)
+        ticket.device = self.devices[1]
+        ticket.save()
+        self.assertEqual(self.counters(), [(date(2022, 3, 1), self.departments[1].pk, self.categories[0].pk, 1, 0)])
+        self.assertEqual(self.counters(), self.rebuilt_counters())
+        Ticket.objects.get(pk=ticket.pk).delete()
+        self.assertEqual(TicketDailyCount.objects.aggregate(total=Sum('open_count'))['total'], 0)
+
+    def test_device_moved(self):
+        self.create_ticket(date(2022, 2, 20))
+        self.create_ticket(date(2022, 2, 20), status=False)
+        self.create_ticket(date(2022, 2, 21), category=1)
+        self.create_ticket(date(2022, 2, 21), device=1)
+        device = Device.objects.get(pk=self.devices[0].pk)
+        device.department = self.departments[1]
+        device.save()
+        self.assertEqual(self.counters(), [
+            (date(2022, 2, 20), self.departments[1].pk, self.categories[0].pk, 1, 1),
+            (date(2022, 2, 21), self.departments[1].pk, self.categories[0].pk, 1, 0),
+            (date(2022, 2, 21), self.departments[1].pk, self.categories[1].pk, 1, 0),
+        ])
+        self.assertEqual(self.counters(), self.rebuilt_counters())
+
+        device.title = 'HP ProBook'
+        # The device row, its change number (taken and read), the department it was in, its table generation
+        # and the renumbering of its tickets (their ids, the numbers taken and read, and the update in a savepoint).
+        with self.assertNumQueries(11):
+            device.save()
+        with self.assertNumQueries(10):
+            device.save(update_fields=['title'])
+
+    def test_description_edit_writes_no_counters(self):
+        ticket = self.create_ticket(date(2022, 2, 20))
+        ticket = Ticket.objects.get(pk=ticket.pk)
+        ticket.description = 'Вышел из строя НЖМД'
+        # The ticket row, its change number (taken and read) and its table generation.
+        with self.assertNumQueries(4):
+            ticket.save()
+
+    def test_rebuild(self):
+        self.create_ticket(date(2022, 2, 20))
+        self.create_ticket(date(2022, 2, 20), device=1, status=False)
+        TicketDailyCount.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_ticket_counts', '--batch-size', '1', stdout=out)
+        self.assertIn('2 daily counters written', out.getvalue())
+        self.assertEqual(TicketDailyCount.objects.aggregate(total=Sum('open_count'))['total'], 1)
+
+    def test_tickets_from_before_the_counters(self):
+        self.create_ticket(date(2022, 2, 20))
+        self.create_ticket(date(2022, 2, 20), device=1, status=False)
+        expected = self.counters()
+        TicketDailyCount.objects.all().delete()
+        install_daily_counts()
+        self.assertEqual(self.counters(), expected)
+        # Built once, counters that are there are left alone.
+        TicketDailyCount.objects.filter(department=self.departments[1]).delete()
+        install_daily_counts()
+        self.assertEqual(len(self.counters()), 1)
+
+    def test_dashboard(self):
+        self.create_ticket(date(2022, 2, 20))
+        self.create_ticket(date(2022, 2, 20), device=1)
+        self.create_ticket(date(2022, 2, 21), category=1, status=False)
+        url = reverse('ticket_per_date')
+        params = {'date_gte': '2022-02-01T00:00:00.000Z', 'date_lte': '2022-02-28T00:00:00.000Z'}
+        self.assertEqual(self.client.get(url, {**params, 'status': 1}).json(), {'2022-02-20': 2})
+        self.assertEqual(self.client.get(url, {**params, 'status': 0}).json(), {'2022-02-21': 1})
+        self.assertEqual(self.client.get(url, params).json(), {'2022-02-20': 2, '2022-02-21': 1})
+        self.assertEqual(self.client.get(url, {**params, 'department': 'НИИ ЧАВО'}).json(), {'2022-02-20': 1})
+        self.assertEqual(self.client.get(url, {**params, 'category': 'Связь'}).json(), {'2022-02-21': 1})
+
+
+class TicketSeriesTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create(username='anon', password='!QAZ1qaz')
+        department = Department.objects.create(title='Божий дар')
+        category = Category.objects.create(title='ИВК')
+        dev_type = DevType.objects.create(title='АРМ')
+        device = Device.objects.create(inv_num='510100034', title='Dell Inspiron 7577',
+                                       department=department, type=dev_type)
+        for day, status in ((date(2022, 1, 31), True), (date(2022, 2, 1), True), (date(2022, 2, 1), False),
+                            (date(2022, 2, 3), False), (date(2022, 3, 15), True)):
+            Ticket.objects.create(created=day, owner=owner, device=device, category=category,
+                                  description='Не работает клавиша Shift', status=status)
+
+    def get_series(self, date_gte, date_lte, **params):
+        url = reverse('ticket_series')
+        return self.client.get(url, {'date_gte': f'{date_gte}T00:00:00.000Z',
+                                     'date_lte': f'{date_lte}T00:00:00.000Z', **params})
+
+    def test_day_gap_filling(self):
+        with self.assertNumQueries(2):
+            res = self.get_series('2022-01-31', '2022-02-04')
+        self.assertEqual(res.json(), {
+            'granularity': 'day',
+            'open': {'2022-01-31': 1, '2022-02-01': 1, '2022-02-02': 0, '2022-02-03': 0, '2022-02-04': 0},
+            'closed': {'2022-01-31': 0, '2022-02-01': 1, '2022-02-02': 0, '2022-02-03': 1, '2022-02-04': 0},
+        })
+
+    def test_week(self):
+        res = self.get_series('2022-01-31', '2022-02-20', granularity='week')
+        self.assertEqual(res.json(), {
+            'granularity': 'week',
+            'open': {'2022-01-31': 2, '2022-02-07': 0, '2022-02-14': 0},
+            'closed': {'2022-01-31': 2, '2022-02-07': 0, '2022-02-14': 0},
+        })
+
+    def test_month(self):
+        res = self.get_series('2022-01-15', '2022-04-01', granularity='month')
+        self.assertEqual(res.json(), {
+            'granularity': 'month',
+            'open': {'2022-01-01': 1, '2022-02-01': 1, '2022-03-01': 1, '2022-04-01': 0},
+            'closed': {'2022-01-01': 0, '2022-02-01': 2, '2022-03-01': 0, '2022-04-01': 0},
+        })
+
+    def test_bad_params(self):
+        self.assertEqual(self.get_series('2022-01-15', '2022-04-01', granularity='year').status_code, 400)
+        res = self.client.get(reverse('ticket_series'), {'date_gte': 'yesterday'})
+        self.assertEqual(res.status_code, 400)
@@ -0,0 +1,122 @@
+from io import StringIO
+from datetime import date
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.contrib.auth.models import User
+from rest_framework.test import APITestCase
+from api.models import Department, Category, DevType, Position, Device, Ticket
+from api.search import search, get_backend, install_search_indexes, SqliteSearchBackend
+
+
+class SearchTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create(username='anon', password='!QAZ1qaz')
+        department = Department.objects.create(title='Божий дар')
+        category = Category.objects.create(title='ИВК')
+        dev_type = DevType.objects.create(title='АРМ')
+        device = Device.objects.create(inv_num='510100034', title='Dell Inspiron 7577',
+                                       department=department, type=dev_type)
+        for description in ('Не работает клавиша Shift', 'Клавиатура залита кофе, клавиша Enter залипает',
+                            'Вышел из строя НЖМД'):
+            Ticket.objects.create(created=date(2022, 2, 20), owner=owner, device=device, category=category,
+                                  description=description)
+
+    def descriptions(self, text):
+        return [ticket.description for ticket in search(Ticket.objects.all(), text)]
+
+    def test_backend(self):
+        if connection.vendor == 'sqlite':
+            self.assertIsInstance(get_backend(), SqliteSearchBackend)
+
+    def test_prefix_matching(self):
+        self.assertEqual(len(self.descriptions('клав')), 2)
+        self.assertEqual(self.descriptions('нжм'), ['Вышел из строя НЖМД'])
+        self.assertEqual(self.descriptions('клав shift'), ['Не работает клавиша Shift'])
+        self.assertEqual(self.descriptions('принтер'), [])
+
+    def test_ranking(self):
+        self.assertEqual(self.descriptions('клав')[0], 'Клавиатура залита кофе, клавиша Enter залипает')
+
+    def test_index_follows_save_and_delete(self):
+        ticket = Ticket.objects.get(description='Вышел из строя НЖМД')
+        ticket.description = 'Замена блока питания'
+        ticket.save()
+        self.assertEqual(self.descriptions('нжмд'), [])
+        self.assertEqual(self.descriptions('питания'), ['Замена блока питания'])
+        ticket.delete()
+        self.assertEqual(self.descriptions('питания'), [])
+
+    def test_index_follows_queryset_update(self):
+        Ticket.objects.filter(description='Вышел из строя НЖМД').update(description='Замена блока питания')
+        self.assertEqual(self.descriptions('питания'), ['Замена блока питания'])
+
+    def test_rebuild_command(self):
+        backend = get_backend()
+        if isinstance(backend, SqliteSearchBackend):
+            with connection.cursor() as cursor:
+                table = backend.index_table(Ticket)
+                cursor.execute(f'INSERT INTO "{table}"("{table}") VALUES (\'delete-all\')')
+            self.assertEqual(self.descriptions('клавиша'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', 'ticket', '--chunk-size', '2', stdout=out)
+        self.assertIn('ticket: 3 rows indexed', out.getvalue())
+        self.assertEqual(len(self.descriptions('клавиша')), 2)
+
+
+class SearchInstallTest(TransactionTestCase):
+
+    def test_install_indexes_existing_rows(self):
+        backend = get_backend()
+        if not isinstance(backend, SqliteSearchBackend):
+            self.skipTest('SQLite FTS5 only')
+        table = backend.index_table(Position)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE "{table}"')
+            for trigger in ('ai', 'ad', 'au'):
+                cursor.execute(f'DROP TRIGGER "{table}_{trigger}"')
+        # Rows from before the index.
+        Position.objects.create(title='Картридж HP 83A', quantity=5)
+        Position.objects.create(title='Клавиатура Logitech K120', quantity=3)
+        install_search_indexes()
+        self.assertEqual([position.title for position in search(Position.objects.all(), 'картр')],
+                         ['Картридж HP 83A'])
+        install_search_indexes()
+        self.assertEqual(search(Position.objects.all(), 'клав').count(), 1)
+
+
+class SearchViewTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        department = Department.objects.create(title='Божий дар')
+        dev_type = DevType.objects.create(title='АРМ')
+        Device.objects.create(inv_num='510100034', title='Dell Inspiron 7577', department=department, type=dev_type)
+        Device.objects.create(inv_num='340756', title='Microsoft Surface', department=department, type=dev_type)
+        Position.objects.create(title='Картридж HP 83A', quantity=5)
+        Position.objects.create(title='Клавиатура Logitech K120', quantity=3)
+
+    def test_device_title(self):
+        res = self.client.get(reverse('device-list'), {'title_like': 'insp'})
+        self.assertEqual([row['inv_num'] for row in res.json()], ['510100034'])
+
+    def test_device_inv_num_prefix(self):
+        res = self.client.get(reverse('device-list'), {'inventory_like': '3407'})
+        self.assertEqual([row['inv_num'] for row in res.json()], ['340756'])
+        res = self.client.get(reverse('device-list'), {'inventory_like': '0756'})
+        self.assertEqual(res.json(), [])
+
+    def test_device_inv_num_prefix_ignores_case(self):
+        Device.objects.create(inv_num='AB123', title='HP ProBook', department=Department.objects.get(),
+                              type=DevType.objects.get())
+        for prefix in ('ab', 'AB', 'aB1'):
+            with self.subTest(prefix=prefix):
+                res = self.client.get(reverse('device-list'), {'inventory_like': prefix})
+                self.assertEqual([row['inv_num'] for row in res.json()], ['AB123'])
+
+    def test_position_title(self):
+        res = self.client.get(reverse('position-list'), {'contains': 'картр'})
+        self.assertEqual([row['title'] for row in res.json()], ['Картридж HP 83A'])
@@ -0,0 +1,289 @@
+import threading
+from datetime import datetime
+from io import StringIO
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from django.contrib.auth.models import User
+from rest_framework.test import APITestCase
+from rest_framework import status
+from dj_rest_auth.models import TokenModel
+from api.models import Department, WorkType, Category, Priority, Position, DevType, Device, Ticket, \
+    Expenditure, OutOfStock, StockMovement, StockSnapshot
+from api.stock import get_stock, record_openings, reconcile_stock
+
+
+def create_ticket():
+    owner = User.objects.create(username='anon', password='!QAZ1qaz')
+    department = Department.objects.create(title='Божий дар')
+    dev_type = DevType.objects.create(title='АРМ')
+    device = Device.objects.create(inv_num='510100034', title='Dell Inspiron 7577', department=department,
+                                   type=dev_type)
+    return Ticket.objects.create(created='2022-02-20', owner=owner, description='Не работает клавиша Shift',
+                                 device=device, category=Category.objects.create(title='ИВК'))
+
+
+class ExpenditureStockTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ticket = create_ticket()
+        cls.keyboard = Position.objects.create(title='Клавиатура', quantity=10)
+        cls.mouse = Position.objects.create(title='Мышь', quantity=10)
+
+    def stock(self):
+        return dict(Position.objects.values_list('title', 'quantity'))
+
+    def test_create_update_delete(self):
+        expenditure = Expenditure.objects.create(position=self.keyboard, quantity=3, ticket=self.ticket)
+        self.assertEqual(self.stock(), {'Клавиатура': 7, 'Мышь': 10})
+
+        expenditure.save()
+        self.assertEqual(self.stock(), {'Клавиатура': 7, 'Мышь': 10})
+
+        expenditure.quantity = 1
+        expenditure.save()
+        self.assertEqual(self.stock(), {'Клавиатура': 9, 'Мышь': 10})
+
+        expenditure.position = self.mouse
+        expenditure.quantity = 4
+        expenditure.save()
+        self.assertEqual(self.stock(), {'Клавиатура': 10, 'Мышь': 6})
+
+        expenditure.delete()
+        self.assertEqual(self.stock(), {'Клавиатура': 10, 'Мышь': 10})
+
+    def test_deleted_with_ticket(self):
+        Expenditure.objects.create(position=self.keyboard, quantity=3, ticket=self.ticket)
+        self.ticket.delete()
+        self.assertEqual(self.stock()['Клавиатура'], 10)
+
+    def test_out_of_stock(self):
+        with self.assertRaises(OutOfStock):
+            Expenditure.objects.create(position=self.keyboard, quantity=11, ticket=self.ticket)
+        self.assertFalse(Expenditure.objects.exists())
+        self.assertEqual(self.stock()['Клавиатура'], 10)
+
+    def test_negative_stock_constraint(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Position.objects.filter(pk=self.keyboard.pk).update(quantity=-1)
+
+
+class TicketStockTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ticket = create_ticket()
+        Priority.objects.create(number=1, title='Низкий')
+        WorkType.objects.create(title='Замена комплектующих')
+        Position.objects.create(title='Клавиатура', quantity=2)
+
+    def setUp(self):
+        token = TokenModel.objects.create(user=self.ticket.owner)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def test_out_of_stock_rolls_ticket_back(self):
+        data = {
+            'created': '2022-02-20',
+            'closed': None,
+            'owner': 'anon',
+            'description': 'Не работает клавиша Shift',
+            'device': {'inv_num': '510100034', 'title': 'Dell Inspiron 7577', 'department': 'Божий дар',
+                       'type': 'АРМ'},
+            'work_done': ['Замена комплектующих'],
+            'priority': 'Низкий',
+            'expenditures': [{'position': 'Клавиатура', 'quantity': 3}],
+            'category': 'ИВК',
+            'status': True,
+        }
+        res = self.client.post(reverse('ticket-list'), data=data, format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.json(), {'expenditures': ['Not enough "Клавиатура" in stock.']})
+        self.assertEqual(Ticket.objects.count(), 1)
+        self.assertEqual(Position.objects.get().quantity, 2)
+
+    def test_expenditure_out_of_stock(self):
+        res = self.client.post(reverse('expenditure-list'), data={'position': 'Клавиатура', 'quantity': 3},
+                               format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('quantity', res.json())
+
+
+def moment(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+class StockLedgerTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ticket = create_ticket()
+        cls.keyboard = Position.objects.create(title='Клавиатура', quantity=10)
+        cls.mouse = Position.objects.create(title='Мышь', quantity=10)
+
+    def movements(self):
+        return list(StockMovement.objects.order_by('pk').values_list('position__title', 'kind', 'delta'))
+
+    def take(self, quantity, at):
+        expenditure = Expenditure.objects.create(position=self.keyboard, quantity=quantity, ticket=self.ticket)
+        StockMovement.objects.filter(expenditure=expenditure).update(created=at)
+        return expenditure
+
+    def test_movements(self):
+        ticket = Ticket.objects.get()
+        expenditure = Expenditure.objects.create(position=self.keyboard, quantity=3, ticket=ticket)
+        expenditure.quantity = 1
+        expenditure.save()
+        expenditure.position = self.mouse
+        expenditure.save()
+        ticket.delete()
+        self.keyboard.quantity = 15
+        self.keyboard.save()
+        self.keyboard.quantity = 12
+        self.keyboard.save()
+        self.mouse.title = 'Мышь USB'
+        self.mouse.save()
+
+        self.assertEqual(self.movements(), [
+            ('Клавиатура', StockMovement.RECEIPT, 10),
+            ('Мышь USB', StockMovement.RECEIPT, 10),
+            ('Клавиатура', StockMovement.EXPENDITURE, -3),
+            ('Клавиатура', StockMovement.REVERSAL, 2),
+            ('Клавиатура', StockMovement.REVERSAL, 1),
+            ('Мышь USB', StockMovement.EXPENDITURE, -1),
+            ('Мышь USB', StockMovement.REVERSAL, 1),
+            ('Клавиатура', StockMovement.RECEIPT, 5),
+            ('Клавиатура', StockMovement.ADJUSTMENT, -3),
+        ])
+        self.assertEqual(get_stock(), dict(Position.objects.values_list('pk', 'quantity')))
+
+    def test_stock_as_of(self):
+        StockMovement.objects.filter(position=self.keyboard).update(created=moment(2022, 1, 1))
+        self.take(3, moment(2022, 2, 1))
+        self.take(2, moment(2022, 3, 1))
+        for at, quantity in ((moment(2021, 12, 31), 0), (moment(2022, 1, 15), 10), (moment(2022, 2, 15), 7),
+                             (None, 5)):
+            with self.subTest(at=at):
+                self.assertEqual(get_stock(at)[self.keyboard.pk], quantity)
+
+        reconcile_stock()
+        self.assertEqual(StockSnapshot.objects.get(position=self.keyboard).quantity, 5)
+        self.take(1, moment(2022, 4, 1))
+        with self.assertNumQueries(1):
+            self.assertEqual(get_stock(), {self.keyboard.pk: 4, self.mouse.pk: 10})
+        self.assertEqual(get_stock(moment(2022, 2, 15))[self.keyboard.pk], 7)
+        self.assertEqual(get_stock(moment(2022, 3, 15))[self.keyboard.pk], 5)
+
+    def test_reconcile(self):
+        Expenditure.objects.create(position=self.keyboard, quantity=3, ticket=self.ticket)
+        Position.objects.update(quantity=99)
+
+        out = StringIO()
+        call_command('reconcile_stock', '--dry-run', stdout=out)
+        self.assertIn('2 positions checked, 2 drifts found', out.getvalue())
+        self.assertFalse(StockSnapshot.objects.exists())
+
+        out = StringIO()
+        call_command('reconcile_stock', '--batch-size', '1', stdout=out)
+        self.assertIn(f'Position {self.keyboard.pk}: 99 in stock, 7 by the ledger', out.getvalue())
+        self.assertEqual(dict(Position.objects.values_list('title', 'quantity')), {'Клавиатура': 7, 'Мышь': 10})
+        self.assertEqual(StockSnapshot.objects.count(), 2)
+
+        # Nothing moved since, neither drifts nor new snapshots.
+        self.assertEqual(reconcile_stock(), (2, []))
+        self.assertEqual(StockSnapshot.objects.count(), 2)
+
+    def test_positions_from_before_the_ledger(self):
+        # Rows the ledger has never seen.
+        Position.objects.bulk_create([Position(title='Кабель', quantity=98), Position(title='Тонер', quantity=0)])
+        cable, toner = Position.objects.filter(title__in=('Кабель', 'Тонер')).order_by('title')
+        record_openings()
+        record_openings()
+        self.assertEqual(list(StockMovement.objects.filter(position__in=(cable, toner)).order_by('pk')
+                              .values_list('position__title', 'kind', 'delta')), [
+            ('Кабель', StockMovement.OPENING, 98),
+            ('Тонер', StockMovement.OPENING, 0),
+        ])
+
+        # Restocked and taken from before the first reconciliation.
+        cable.quantity = 100
+        cable.save()
+        Expenditure.objects.create(position=cable, quantity=3, ticket=self.ticket)
+        self.assertEqual(reconcile_stock(), (4, []))
+        self.assertEqual(dict(Position.objects.values_list('title', 'quantity')),
+                         {'Клавиатура': 10, 'Мышь': 10, 'Кабель': 97, 'Тонер': 0})
+        self.assertEqual(get_stock()[cable.pk], 97)
+
+    def test_endpoint(self):
+        StockMovement.objects.update(created=moment(2022, 1, 1))
+        self.take(3, moment(2022, 2, 1))
+        url = reverse('position-stock')
+        self.assertEqual(self.client.get(url, {'at': '2022-01-15T00:00:00'}).json(), [
+            {'id': self.keyboard.pk, 'title': 'Клавиатура', 'quantity': 10},
+            {'id': self.mouse.pk, 'title': 'Мышь', 'quantity': 10},
+        ])
+        self.assertEqual(self.client.get(url).json()[0]['quantity'], 7)
+        self.assertEqual(self.client.get(url, {'at': '2022-01-15'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class StockConcurrencyTest(TransactionTestCase):
+    threads = 8
+    iterations = 25
+
+    def setUp(self):
+        self.ticket = create_ticket()
+        self.position = Position.objects.create(title='Клавиатура', quantity=150)
+
+    def run_concurrently(self, work):
+        errors = []
+
+        def worker():
+            try:
+                for _ in range(self.iterations):
+                    while True:
+                        try:
+                            work()
+                            break
+                        except OperationalError:
+                            # SQLite allows a single writer, a locked database is retried like a client would.
+                            continue
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return errors
+
+    def test_no_lost_updates(self):
+        position = self.position
+        ticket = self.ticket
+
+        def take():
+            try:
+                Expenditure.objects.create(position=position, quantity=1, ticket=ticket)
+            except OutOfStock:
+                pass
+
+        errors = self.run_concurrently(take)
+        self.assertEqual(errors, [])
+        taken = Expenditure.objects.count()
+        self.assertEqual(taken, 150)
+        self.assertEqual(Position.objects.get().quantity, 0)
+
+        def give_back():
+            expenditure = Expenditure.objects.filter(quantity=1).first()
+            if expenditure is not None:
+                expenditure.quantity = 0
+                expenditure.save()
+
+        errors = self.run_concurrently(give_back)
+        self.assertEqual(errors, [])
+        self.assertEqual(Position.objects.get().quantity, 150 - Expenditure.objects.filter(quantity=1).count())
+        self.assertEqual(get_stock(), {position.pk: Position.objects.get().quantity})
@@ -0,0 +1,104 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth.models import User
+from rest_framework.test import APITestCase
+from rest_framework import status
+from dj_rest_auth.models import TokenModel
+from api.models import Department, WorkType, Category, Priority, Position, DevType, Device, Ticket, Expenditure
+
+
+class TicketUpdateTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username='anon', password='!QAZ1qaz')
+        department = Department.objects.create(title='Божий дар')
+        WorkType.objects.create(title='Восстановление работоспособности')
+        WorkType.objects.create(title='Замена комплектующих')
+        Priority.objects.create(number=1, title='Низкий')
+        Category.objects.create(title='ИВК')
+        dev_type = DevType.objects.create(title='АРМ')
+        Device.objects.create(inv_num='510100034', title='Dell Inspiron 7577', department=department, type=dev_type)
+        Device.objects.create(inv_num='510100035', title='Dell Inspiron 7577', department=department, type=dev_type)
+        Position.objects.create(title='Клавиатура', quantity=10)
+        Position.objects.create(title='Мышь', quantity=10)
+
+    def setUp(self):
+        token = TokenModel.objects.create(user=self.owner)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.data = {
+            'created': '2022-02-20',
+            'closed': None,
+            'owner': 'anon',
+            'description': 'Не работает клавиша Shift',
+            'device': self.device('510100034'),
+            'work_done': ['Восстановление работоспособности'],
+            'priority': 'Низкий',
+            'expenditures': [{'position': 'Клавиатура', 'quantity': 1}, {'position': 'Мышь', 'quantity': 2}],
+            'category': 'ИВК',
+            'status': True,
+        }
+        res = self.client.post(reverse('ticket-list'), data=self.data, format='json')
+        self.url = reverse('ticket-detail', kwargs={'pk': res.json()['id']})
+
+    @staticmethod
+    def device(inv_num):
+        return {'inv_num': inv_num, 'title': 'Dell Inspiron 7577', 'department': 'Божий дар', 'type': 'АРМ'}
+
+    def stock(self):
+        return dict(Position.objects.values_list('title', 'quantity'))
+
+    @staticmethod
+    def writes(context, table):
+        return [query['sql'] for query in context.captured_queries
+                if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+                and f'"{table}"' in query['sql'].split('(')[0]]
+
+    def test_patch_scalar_fields_updates_one_row(self):
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.patch(self.url, data={'description': 'Не работает клавиша Ctrl'}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        ticket_writes = self.writes(context, 'api_ticket')
+        self.assertEqual(len(ticket_writes), 1)
+        self.assertIn('"description"', ticket_writes[0])
+        self.assertNotIn('"device_id"', ticket_writes[0])
+        self.assertEqual(self.writes(context, 'api_expenditure'), [])
+        self.assertEqual(self.writes(context, 'api_position'), [])
+        self.assertEqual(self.writes(context, 'api_ticket_work_done'), [])
+        self.assertEqual(Ticket.objects.get().description, 'Не работает клавиша Ctrl')
+
+    def test_put_unchanged_writes_nothing(self):
+        expenditure_ids = set(Expenditure.objects.values_list('id', flat=True))
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.put(self.url, data=self.data, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        for table in ('api_ticket', 'api_expenditure', 'api_position', 'api_ticket_work_done'):
+            self.assertEqual(self.writes(context, table), [])
+        self.assertEqual(set(Expenditure.objects.values_list('id', flat=True)), expenditure_ids)
+        self.assertEqual(self.stock(), {'Клавиатура': 9, 'Мышь': 8})
+
+    def test_put_changes_only_differing_expenditures(self):
+        kept = Expenditure.objects.get(position__title='Клавиатура')
+        self.data['expenditures'] = [{'position': 'Клавиатура', 'quantity': 1}, {'position': 'Мышь', 'quantity': 5}]
+        res = self.client.put(self.url, data=self.data, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(Expenditure.objects.filter(pk=kept.pk, quantity=1).exists())
+        self.assertEqual(Expenditure.objects.get(position__title='Мышь').quantity, 5)
+        self.assertEqual(self.stock(), {'Клавиатура': 9, 'Мышь': 5})
+
+        self.data['expenditures'] = []
+        self.client.put(self.url, data=self.data, format='json')
+        self.assertFalse(Expenditure.objects.exists())
+        self.assertEqual(self.stock(), {'Клавиатура': 10, 'Мышь': 10})
+
+    def test_patch_work_done_and_device(self):
+        res = self.client.patch(self.url, data={'work_done': ['Замена комплектующих'],
+                                                'device': self.device('510100035')}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json()['work_done'], ['Замена комплектующих'])
+        self.assertEqual(res.json()['device']['inv_num'], '510100035')
+
+        res = self.client.patch(self.url, data={'device': self.device('000')}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('device', res.json())
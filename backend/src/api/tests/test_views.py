@@ -928,3 +928,97 @@ class TicketViewSetTest(APITestCase):
 
 
 
+
+
+class TicketCursorPaginationTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username='anon', password='!QAZ1qaz')
+        department = Department.objects.create(title='Божий дар')
+        category = Category.objects.create(title='ИВК')
+        dev_type = DevType.objects.create(title='АРМ')
+        priorities = [None, Priority.objects.create(number=1, title='Низкий'),
+                      Priority.objects.create(number=2, title='Высокий')]
+        cls.device = Device.objects.create(inv_num='510100034', title='Dell Inspiron 7577',
+                                           department=department, type=dev_type)
+        cls.category = category
+        for i in range(11):
+            Ticket.objects.create(created=date(2022, 2, 1) + timedelta(days=i % 4), owner=cls.owner,
+                                  priority=priorities[i % 3], device=cls.device, category=category,
+                                  description=f'Заявка {i}', status=bool(i % 2))
+
+    def collect(self, params):
+        url = reverse('ticket-list')
+        res = self.client.get(url, {**params, 'cursor': '', 'limit': 3})
+        ids = []
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            ids.extend(row['id'] for row in res.json()['results'])
+            if res.json()['next'] is None:
+                return ids
+            res = self.client.get(res.json()['next'])
+
+    def expected_ids(self, sort, order):
+        def key(ticket):
+            value = getattr(ticket, Ticket._meta.get_field(sort).attname)
+            return (value is not None, value if value is not None else 0, ticket.id)
+        return [ticket.id for ticket in sorted(Ticket.objects.all(), key=key, reverse=order == 'desc')]
+
+    def test_all_sort_combinations(self):
+        for sort in ('id', 'priority', 'owner', 'device', 'category', 'created', 'status'):
+            for order in ('asc', 'desc'):
+                with self.subTest(sort=sort, order=order):
+                    ids = self.collect({'sort': sort, 'order': order})
+                    self.assertEqual(ids, self.expected_ids(sort, order))
+
+    def test_filters_are_applied(self):
+        ids = self.collect({'sort': 'priority', 'order': 'asc', 'status': 1})
+        self.assertEqual(ids, [pk for pk in self.expected_ids('priority', 'asc')
+                               if Ticket.objects.get(pk=pk).status])
+
+    def test_bare_list_without_cursor(self):
+        url = reverse('ticket-list')
+        res = self.client.get(url, {'sort': 'id', 'order': 'asc', 'start': 0, 'end': 3})
+        self.assertEqual([row['id'] for row in res.json()], [1, 2, 3])
+
+    def test_stable_under_inserts(self):
+        url = reverse('ticket-list')
+        res = self.client.get(url, {'sort': 'id', 'order': 'desc', 'cursor': '', 'limit': 4})
+        first_page = [row['id'] for row in res.json()['results']]
+        Ticket.objects.create(created=date(2022, 2, 1), owner=self.owner, device=self.device,
+                              category=self.category, description='Новая заявка')
+        res = self.client.get(res.json()['next'])
+        second_page = [row['id'] for row in res.json()['results']]
+        self.assertEqual(first_page, [11, 10, 9, 8])
+        self.assertEqual(second_page, [7, 6, 5, 4])
+
+    def test_previous_page(self):
+        url = reverse('ticket-list')
+        params = {'sort': 'priority', 'order': 'desc', 'cursor': '', 'limit': 4}
+        first = self.client.get(url, params).json()
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).json()
+        previous = self.client.get(second['previous']).json()
+        self.assertEqual(previous['results'], first['results'])
+
+    def test_unsupported_ordering(self):
+        url = reverse('ticket-list')
+        for params in ({'sort': 'work_done', 'order': 'asc'}, {'sort': 'device__title', 'order': 'asc'},
+                       {'sort': 'priority', 'order': 'up'}, {'sort': 'priority'}):
+            with self.subTest(params=params):
+                res = self.client.get(url, {**params, 'cursor': ''})
+                self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.collect({}), list(range(1, 12)))
+
+    def test_invalid_cursor(self):
+        url = reverse('ticket-list')
+        res = self.client.get(url, {'sort': 'id', 'order': 'asc', 'cursor': 'garbage'})
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_bound_to_ordering(self):
+        url = reverse('ticket-list')
+        res = self.client.get(url, {'sort': 'id', 'order': 'asc', 'cursor': '', 'limit': 3})
+        cursor = res.json()['next'].split('cursor=')[1].split('&')[0]
+        res = self.client.get(url, {'sort': 'id', 'order': 'desc', 'cursor': cursor})
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
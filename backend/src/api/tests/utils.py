@@ -0,0 +1,46 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin, `with self.assertQueryBudget(n):` fails when the block runs more than n queries.
+    Unlike assertNumQueries the budget is an upper bound, so an endpoint may get cheaper without breaking tests.
+    """
+
+    @contextmanager
+    def assertQueryBudget(self, budget, using=DEFAULT_DB_ALIAS):
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+        executed = len(context.captured_queries)
+        if executed > budget:
+            queries = '\n'.join(f'{i}. {query["sql"]}' for i, query in enumerate(context.captured_queries, start=1))
+            self.fail(f'{executed} queries executed, budget is {budget}\n{queries}')
+
+
+async def slow_view(request):
+    await asyncio.sleep(0.2)
+    return HttpResponse(b'0' * 4096)
+
+
+def stream_view(request):
+    # Django 3.1 sends streamed bodies from the event loop under ASGI, where they may not query the database.
+    return StreamingHttpResponse(f'{i}\n'.encode() for i in range(1000))
+
+
+# ROOT_URLCONF of tests of middleware under ASGI.
+urlpatterns = [
+    path('slow/', slow_view, name='slow'),
+    path('stream/', stream_view, name='stream'),
+]
+
+
+async def time_concurrent(client, url, count):
+    started = time.perf_counter()
+    responses = await asyncio.gather(*(client.get(url, **{'accept-encoding': 'gzip'}) for _ in range(count)))
+    return time.perf_counter() - started, responses
@@ -1,7 +1,10 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import TicketViewSet, UserViewSet, WorkTypeViewSet, CategoriesViewSet, PriorityViewSet,\
-    ticket_per_date, PositionViewSet, DeviceViewSet, ExpenditureViewSet, DepartmentViewSet, DevTypeViewSet
+    ticket_per_date, ticket_series, PositionViewSet, DeviceViewSet, ExpenditureViewSet, DepartmentViewSet,\
+    DevTypeViewSet, ticket_report, ticket_cube, changes
+from . import async_views
+from .metrics import metrics_view
 
 
 router = DefaultRouter()
@@ -18,6 +21,14 @@ router.register(r'devtypes', DevTypeViewSet)
 
 
 urlpatterns = [
-    path('api/dashboard/', ticket_per_date),
+    path('api/dashboard/', ticket_per_date, name='ticket_per_date'),
+    path('api/dashboard/series/', ticket_series, name='ticket_series'),
+    path('api/reports/tickets/', ticket_report, name='ticket_report'),
+    path('api/reports/cube/', ticket_cube, name='ticket_cube'),
+    path('api/changes/', changes, name='changes'),
+    path('api/async/tickets/', async_views.ticket_list, name='async_ticket_list'),
+    path('api/async/tickets/<int:pk>/', async_views.ticket_detail, name='async_ticket_detail'),
+    path('api/async/dashboard/', async_views.ticket_per_date, name='async_ticket_per_date'),
     path('api/', include(router.urls)),
+    path('metrics/', metrics_view, name='metrics'),
 ]
\ No newline at end of file
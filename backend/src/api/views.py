@@ -1,18 +1,48 @@
 from datetime import datetime
 from rest_framework import viewsets
 from rest_framework.response import Response
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, action
+from rest_framework.exceptions import ValidationError, UnsupportedMediaType
+from rest_framework.settings import api_settings
+from rest_framework.status import HTTP_201_CREATED, HTTP_400_BAD_REQUEST, HTTP_501_NOT_IMPLEMENTED
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db.models import Count
-from .models import Ticket, WorkType, Category, Priority, Position, Device, Expenditure, Department, DevType
+from django.http import StreamingHttpResponse
+from django.db.models import F, Prefetch, Sum
+from django.db.models.functions import TruncWeek, TruncMonth
+from django.utils import timezone
+from .models import Ticket, WorkType, Category, Priority, Position, Device, Expenditure, Department, DevType, \
+    TicketDailyCount, OutOfStock
 from .serializers import TicketSerializer, UserSerializer, WorkTypeSerializer, CategorySerializer,\
     PrioritySerializer, PositionSerializer, DeviceSerializer, ExpenditureSerializer, DepartmentSerializer,\
     DevTypeSerializer
-
-
-class TicketViewSet(viewsets.ModelViewSet):
+from .pagination import KeysetPagination
+from .search import search, prefix_filter
+from .rollups import GRANULARITIES, iter_buckets
+from .lookups import get_lookup_cache
+from .conditional import ConditionalGetMixin, conditional_get
+from .counts import TotalCountMixin
+from .parsers import FastJSONParser, NDJSONParser, ROW_READERS
+from .bulk import BulkTicketImport, DeviceImport
+from .export import TicketExport, EXPORT_FORMATS
+from .autocomplete import DEVICE_AUTOCOMPLETE
+from .reports import TicketReport
+from .cube import TICKET_CUBE, parse_query
+from .stock import with_ledger_stock
+from .fieldsets import SparseFieldsViewMixin
+from .changes import ChangeFeed
+from .renderers import CompactJSONRenderer
+
+
+class TicketViewSet(SparseFieldsViewMixin, ConditionalGetMixin, TotalCountMixin, viewsets.ModelViewSet):
     serializer_class = TicketSerializer
-    queryset = Ticket.objects.all()
+    queryset = Ticket.objects.select_related('device', 'owner').prefetch_related(
+        'work_done', Prefetch('expenditures', queryset=Expenditure.objects.select_related('position')))
+    pagination_class = KeysetPagination
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [CompactJSONRenderer]
+    etag_models = (Ticket, Device, User, WorkType, Priority, Category, Expenditure, Position, Department, DevType)
+    count_models = (Ticket, Device, Department)
+    bulk_max_items = 50000
 
     def get_queryset(self):
         dt_exclude = ['', 'undefined']
@@ -42,10 +72,7 @@ class TicketViewSet(viewsets.ModelViewSet):
         description = self.request.query_params.get('description_like', '')
 
         if inv_num:
-            filter_params['device__inv_num__startswith'] = inv_num
-
-        if description:
-            filter_params['description__icontains'] = description
+            filter_params.update(prefix_filter('device__inv_num', inv_num))
 
         if status in ('1', '0'):
             filter_params['status'] = status
@@ -63,44 +90,94 @@ class TicketViewSet(viewsets.ModelViewSet):
 
         try:
             queryset = self.queryset.filter(**filter_params).order_by()
+            if description:
+                queryset = search(queryset, description)
             if sort and order:
                 queryset = queryset.order_by(orders[order] + sort)
-            if start and end:
+            if start and end and self.action == 'list' and not self.paginator.is_active(self.request):
                 queryset = queryset[int(start): int(end)]
         except KeyError as err:
             print('Key error:', err)
             queryset = self.queryset
         return queryset
 
+    @action(detail=False, methods=['post'], parser_classes=[FastJSONParser, NDJSONParser])
+    def bulk(self, request):
+        if not isinstance(request.data, list):
+            raise ValidationError('Expected a list of tickets.')
+        if len(request.data) > self.bulk_max_items:
+            raise ValidationError(f'At most {self.bulk_max_items} tickets per request.')
 
-class UserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all()
+        bulk_import = BulkTicketImport(request.data)
+        if not bulk_import.is_valid():
+            return Response({'errors': bulk_import.get_errors()}, status=HTTP_400_BAD_REQUEST)
+        try:
+            tickets = bulk_import.save()
+        except OutOfStock:
+            return Response({'errors': bulk_import.get_errors()}, status=HTTP_400_BAD_REQUEST)
+        return Response({'created': len(tickets), 'ids': [ticket.pk for ticket in tickets]},
+                        status=HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        # `format` is taken by DRF for renderer selection.
+        export_format = request.query_params.get('type', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({'type': [f'Expected one of: {", ".join(EXPORT_FORMATS)}.']})
+
+        content_type, render = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(render(TicketExport(self.get_queryset())),
+                                         content_type=f'{content_type}; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="tickets.{export_format}"'
+        return response
+
+
+class CachedLookupListMixin:
+    """
+    Serves the list of a lookup table from the process-wide lookup cache.
+    """
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_serializer(get_lookup_cache(self.queryset.model).all(), many=True)
+        return Response(serializer.data)
+
+
+class UserViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    queryset = User.objects.prefetch_related(Prefetch('tickets', queryset=Ticket.objects.only('id', 'owner')))
     serializer_class = UserSerializer
+    etag_models = (User, Ticket)
 
 
-class DepartmentViewSet(viewsets.ModelViewSet):
+class DepartmentViewSet(ConditionalGetMixin, CachedLookupListMixin, viewsets.ModelViewSet):
     queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
+    etag_models = (Department,)
 
 
-class WorkTypeViewSet(viewsets.ModelViewSet):
+class WorkTypeViewSet(ConditionalGetMixin, CachedLookupListMixin, viewsets.ModelViewSet):
     queryset = WorkType.objects.all()
     serializer_class = WorkTypeSerializer
+    etag_models = (WorkType,)
 
 
-class CategoriesViewSet(viewsets.ModelViewSet):
+class CategoriesViewSet(ConditionalGetMixin, CachedLookupListMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    etag_models = (Category,)
 
 
-class PriorityViewSet(viewsets.ModelViewSet):
+class PriorityViewSet(ConditionalGetMixin, CachedLookupListMixin, viewsets.ModelViewSet):
     queryset = Priority.objects.all()
     serializer_class = PrioritySerializer
+    etag_models = (Priority,)
 
 
-class PositionViewSet(viewsets.ModelViewSet):
+class PositionViewSet(SparseFieldsViewMixin, ConditionalGetMixin, TotalCountMixin, viewsets.ModelViewSet):
     queryset = Position.objects.all()
     serializer_class = PositionSerializer
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [CompactJSONRenderer]
+    etag_models = (Position,)
+    count_models = (Position,)
 
     def get_queryset(self):
         filter_params = {}
@@ -117,11 +194,10 @@ class PositionViewSet(viewsets.ModelViewSet):
 
         title = self.request.query_params.get('contains', '')
 
-        if title:
-            filter_params['title__icontains'] = title
-
         try:
             queryset = self.queryset.filter(**filter_params)
+            if title:
+                queryset = search(queryset, title)
 
             if sort and order:
                 queryset = queryset.order_by(orders[order] + sort)
@@ -134,10 +210,28 @@ class PositionViewSet(viewsets.ModelViewSet):
 
         return queryset
 
-
-class DeviceViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'])
+    def stock(self, request):
+        # Stock by the ledger, at the time `at` if given, see api.stock.
+        dt_format = '%Y-%m-%dT%H:%M:%S'
+        at = request.query_params.get('at', '').split('.')[0]
+        if at:
+            try:
+                at = timezone.make_aware(datetime.strptime(at, dt_format))
+            except ValueError:
+                raise ValidationError({'at': [f'Expected format: {dt_format}']})
+        positions = with_ledger_stock(Position.objects.order_by('pk'), at or None)
+        return Response([{'id': pk, 'title': title, 'quantity': quantity}
+                         for pk, title, quantity in positions.values_list('pk', 'title', 'ledger_quantity')])
+
+
+class DeviceViewSet(SparseFieldsViewMixin, ConditionalGetMixin, TotalCountMixin, viewsets.ModelViewSet):
     queryset = Device.objects.all()
     serializer_class = DeviceSerializer
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [CompactJSONRenderer]
+    etag_models = (Device, Department, DevType)
+    count_models = (Device, Department, DevType)
+    autocomplete_max_limit = 50
 
     def get_queryset(self):
         filter_params = {}
@@ -158,10 +252,7 @@ class DeviceViewSet(viewsets.ModelViewSet):
         dev_type = self.request.query_params.get('type')
 
         if inventory_num:
-            filter_params['inv_num__startswith'] = inventory_num
-
-        if title:
-            filter_params['title__icontains'] = title
+            filter_params.update(prefix_filter('inv_num', inventory_num))
 
         if department and department != 'Любая':
             filter_params['department__title'] = department
@@ -171,6 +262,8 @@ class DeviceViewSet(viewsets.ModelViewSet):
 
         try:
             queryset = self.queryset.filter(**filter_params)
+            if title:
+                queryset = search(queryset, title)
             if order and sort:
                 queryset = queryset.order_by(orders[order] + sort)
             if start and end:
@@ -180,36 +273,152 @@ class DeviceViewSet(viewsets.ModelViewSet):
             queryset = self.queryset
         return queryset
 
-
-class DevTypeViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        # Answered from the in-process index, see api.autocomplete.
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), self.autocomplete_max_limit)
+        except ValueError:
+            raise ValidationError({'limit': ['Expected an integer.']})
+        return Response(DEVICE_AUTOCOMPLETE.suggest(request.query_params.get('q', ''), limit))
+
+    @action(detail=False, methods=['post'], url_path='import', url_name='import')
+    def import_devices(self, request):
+        # The body is read line by line and imported in batches, see api.bulk.DeviceImport.
+        read_rows = ROW_READERS.get(request.content_type.split(';')[0].strip())
+        if read_rows is None:
+            raise UnsupportedMediaType(request.content_type)
+        rows = read_rows(request.stream or [], DeviceImport.fields, request.encoding or settings.DEFAULT_CHARSET)
+        create_missing = request.query_params.get('create_missing', '') in ('1', 'true')
+        return Response(DeviceImport(rows, create_missing=create_missing).run())
+
+
+class DevTypeViewSet(ConditionalGetMixin, CachedLookupListMixin, viewsets.ModelViewSet):
     queryset = DevType.objects.all()
     serializer_class = DevTypeSerializer
+    etag_models = (DevType,)
 
 
-class ExpenditureViewSet(viewsets.ModelViewSet):
-    queryset = Expenditure.objects.all()
+class ExpenditureViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    queryset = Expenditure.objects.select_related('position')
     serializer_class = ExpenditureSerializer
+    etag_models = (Expenditure, Position)
 
 
 @api_view(['GET'])
+@conditional_get(Ticket, Device, Department, Category)
 def ticket_per_date(request):
+    return Response(get_ticket_counts(request.query_params))
+
+
+def get_ticket_counts(query_params):
     filter_params = {}
     dt_format = '%Y-%m-%dT%H:%M:%S'
-    date_lte = request.query_params.get('date_lte', '').split('.')[0]
-    date_gte = request.query_params.get('date_gte', '').split('.')[0]
-    date_from = datetime.strptime(date_gte, dt_format)
-    date_to = datetime.strptime(date_lte, dt_format)
-    status = request.query_params.get('status', '')
+    date_lte = query_params.get('date_lte', '').split('.')[0]
+    date_gte = query_params.get('date_gte', '').split('.')[0]
+    status = query_params.get('status', '')
+    department = query_params.get('department', '')
+    category = query_params.get('category', '')
 
-    if status in ('1', '0'):
-        filter_params['status'] = status
+    try:
+        date_from = datetime.strptime(date_gte, dt_format)
+        date_to = datetime.strptime(date_lte, dt_format)
+    except ValueError:
+        raise ValidationError(f'date_gte and date_lte are required, expected format: {dt_format}')
 
-    queryset = Ticket.objects.filter(created__range=[date_from, date_to], **filter_params)\
-        .values('created').annotate(count=Count('id'))
-    data = dict([(item['created'].strftime("%Y-%m-%d"), item['count']) for item in queryset])
+    counters = {
+        '1': F('open_count'),
+        '0': F('closed_count'),
+    }
+
+    if department and department != 'Любая':
+        filter_params['department__title'] = department
+
+    if category:
+        filter_params['category__title'] = category
+
+    queryset = TicketDailyCount.objects.filter(day__range=[date_from.date(), date_to.date()], **filter_params)\
+        .values('day').annotate(count=Sum(counters.get(status, F('open_count') + F('closed_count'))))\
+        .filter(count__gt=0).order_by()
+    return dict([(item['day'].strftime("%Y-%m-%d"), item['count']) for item in queryset])
+
+
+@api_view(['GET'])
+@conditional_get(Ticket, Device, Department, Category)
+def ticket_series(request):
+    filter_params = {}
+    dt_format = '%Y-%m-%dT%H:%M:%S'
+    date_lte = request.query_params.get('date_lte', '').split('.')[0]
+    date_gte = request.query_params.get('date_gte', '').split('.')[0]
+    granularity = request.query_params.get('granularity', 'day')
+    department = request.query_params.get('department', '')
+    category = request.query_params.get('category', '')
+
+    try:
+        date_from = datetime.strptime(date_gte, dt_format).date()
+        date_to = datetime.strptime(date_lte, dt_format).date()
+    except ValueError:
+        raise ValidationError(f'date_gte and date_lte are required, expected format: {dt_format}')
+
+    if granularity not in GRANULARITIES:
+        raise ValidationError(f'granularity must be one of: {", ".join(GRANULARITIES)}')
+
+    truncs = {
+        'day': F('day'),
+        'week': TruncWeek('day'),
+        'month': TruncMonth('day'),
+    }
+
+    if department and department != 'Любая':
+        filter_params['department__title'] = department
+
+    if category:
+        filter_params['category__title'] = category
+
+    queryset = TicketDailyCount.objects.filter(day__range=[date_from, date_to], **filter_params)\
+        .annotate(bucket=truncs[granularity]).values('bucket')\
+        .annotate(open=Sum('open_count'), closed=Sum('closed_count')).order_by()
+    counts = {item['bucket']: item for item in queryset}
+
+    data = {
+        'granularity': granularity,
+        'open': {},
+        'closed': {},
+    }
+    for bucket in iter_buckets(date_from, date_to, granularity):
+        label = bucket.strftime("%Y-%m-%d")
+        item = counts.get(bucket, {})
+        data['open'][label] = item.get('open') or 0
+        data['closed'][label] = item.get('closed') or 0
     return Response(data)
 
 
+@api_view(['GET'])
+def ticket_report(request):
+    return Response(TicketReport(request.query_params).get_data())
 
 
+@api_view(['GET'])
+def ticket_cube(request):
+    if not TICKET_CUBE.available:
+        return Response({'detail': 'The analytics cube requires NumPy, which is not installed.'},
+                        status=HTTP_501_NOT_IMPLEMENTED)
+    query = parse_query(request.query_params)
+    if query['histogram']:
+        return Response(TICKET_CUBE.histogram(query['histogram'], query['bins'], query['filters']))
+    return Response({
+        'dimensions': list(query['dimensions']),
+        'measures': list(query['measures']),
+        'rows': TICKET_CUBE.group_by(query['dimensions'], query['measures'], query['filters']),
+    })
+
 
+@api_view(['GET'])
+def changes(request):
+    # Rendered like the lists, with the querysets and serializers of the viewsets.
+    sources = {
+        'tickets': (TicketViewSet.queryset, TicketSerializer),
+        'devices': (DeviceViewSet.queryset, DeviceSerializer),
+        'positions': (PositionViewSet.queryset, PositionSerializer),
+    }
+    return Response(ChangeFeed(sources, request.query_params).get_data())
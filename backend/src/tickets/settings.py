@@ -50,6 +50,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'api.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -63,6 +65,8 @@ MIDDLEWARE = [
 ROOT_URLCONF = 'tickets.urls'
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_ALLOW_CREDENTIALS = True
+# Read by the frontend tables, see api.counts.TotalCountMixin.
+CORS_EXPOSE_HEADERS = ['X-Total-Count', 'X-Total-Count-Estimated']
 
 TEMPLATES = [
     {
@@ -138,11 +142,30 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        # TokenAuthentication with the tokens cached in process.
+        'api.authentication.CachedTokenAuthentication',
+    ],
+    # orjson when it is installed, the stdlib json module otherwise.
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
-
 }
 
+# Responses smaller than this many bytes are not compressed by api.compression.CompressionMiddleware.
+COMPRESSION_MIN_SIZE = 1024
+
+# Addresses allowed to scrape /metrics/.
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
+
+# Threads running ORM work for the async read views in api.async_views.
+ASYNC_ORM_WORKERS = int(os.environ.get('ASYNC_ORM_WORKERS', 8))
+
 # LOGGING = {
 #     'version': 1,
 #     'disable_existing_loggers': False,
@@ -92,19 +92,15 @@ export default class Page {
   }
 
   async getDataForColumnCharts (from, to) {
-    const requests = [];
-    const TICKETS_OPENED = `${process.env.BACKEND_URL}api/dashboard?date_gte=${from.toISOString()}
-                            &date_lte=${to.toISOString()}&status=1`;
-    const TICKETS_CLOSED = `${process.env.BACKEND_URL}api/dashboard?date_gte=${from.toISOString()}
-                            &date_lte=${to.toISOString()}&status=0`;
+    const DAY = 24 * 60 * 60 * 1000;
+    const days = (to - from) / DAY;
+    const granularity = days > 366 ? 'month' : days > 92 ? 'week' : 'day';
+    const TICKETS_SERIES = `${process.env.BACKEND_URL}api/dashboard/series/?date_gte=${from.toISOString()}
+                            &date_lte=${to.toISOString()}&granularity=${granularity}`;
 
-    const ticketsOpenedResponse = await fetchJson(TICKETS_OPENED);
-    const ticketsClosedResponse = await fetchJson(TICKETS_CLOSED);
+    const { open, closed } = await fetchJson(TICKETS_SERIES);
 
-    requests.push(ticketsOpenedResponse);
-    requests.push(ticketsClosedResponse);
-
-    return Promise.all(requests);
+    return [open, closed];
   }
 
   updateChartsComponents = async event => {